@@ -1,34 +1,49 @@
 # -*- coding: utf-8 -*-
+import time
+SCRIPT_STARTED = time.perf_counter()
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date, timedelta
 import numpy as np
-from PIL import Image
 import io
-import base64
-import json
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
 import tempfile
 import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-import pickle
+import shutil
 import hashlib
 import re
+import uuid
 import logging
-import cv2
-from PIL import ImageEnhance
+import threading
+from itertools import islice
+from colpovision import jobs
+from colpovision.aggregates import DashboardAggregates
+from colpovision.analysis_index import AnalysisIndex, analysis_datetime
+from colpovision.cache import AnalysisCache, content_digest
+from colpovision.lazy import LazyModule
+from colpovision.registry import PatientRegistry
+from colpovision.search import SharedSearchIndex
+from colpovision.storage import RecordStore, WriteBehindWriter
+
+# Dependencias pesadas que solo usan algunas páginas: se importan al usarse por primera vez
+px = LazyModule('plotly.express')
+go = LazyModule('plotly.graph_objects')
+backends = LazyModule('colpovision.backends')
+columnar = LazyModule('colpovision.columnar')
+comparison = LazyModule('colpovision.comparison')
+decoding = LazyModule('colpovision.decoding')
+export = LazyModule('colpovision.export')
+images = LazyModule('colpovision.images')
+imaging = LazyModule('colpovision.imaging')
+outbox = LazyModule('colpovision.outbox')
+parallel = LazyModule('colpovision.parallel')
+preprocessing = LazyModule('colpovision.preprocessing')
+quality = LazyModule('colpovision.quality')
+reports = LazyModule('colpovision.reports')
+
+IMPORTS_FINISHED = time.perf_counter()
+# Presupuesto de la primera ejecución del proceso; si se supera queda un aviso en el registro
+# y falla tests/test_startup.py
+STARTUP_BUDGET_SECONDS = 2.0
 
 # Configuración de la página
 st.set_page_config(
@@ -80,203 +95,560 @@ if 'current_patient' not in st.session_state:
     st.session_state.current_patient = None
 if 'analysis_results' not in st.session_state:
     st.session_state.analysis_results = []
-if 'email_history' not in st.session_state:
-    st.session_state.email_history = []
 
 # Clases
 class PatientManager:
+    @staticmethod
+    def get_registry():
+        if 'patient_registry' not in st.session_state:
+            st.session_state.patient_registry = PatientRegistry(st.session_state.patients_db,
+                                                                PatientManager.get_search_index())
+        return st.session_state.patient_registry
+    
+    @staticmethod
+    def get_search_index():
+        return get_patient_search_index(DataPersistence.DB_FILE)
+    
+    @staticmethod
+    def rebuild_registry():
+        """Reconstruir los índices tras cargar o reemplazar la lista de pacientes"""
+        PatientManager.get_registry().rebuild(st.session_state.patients_db)
+    
     @staticmethod
     def add_patient(patient_data):
         """Agregar nuevo paciente a la base de datos"""
-        patient_data['id'] = len(st.session_state.patients_db) + 1
+        patient_data['id'] = DataPersistence.get_store().allocate_patient_id()
         patient_data['created_at'] = datetime.now()
-        st.session_state.patients_db.append(patient_data)
+        aggregates = AnalysisManager.get_aggregates()
+        PatientManager.get_registry().add(patient_data)
+        aggregates.add_patient()
+        DataPersistence.mark_patient_dirty(patient_data)
         return patient_data['id']
     
     @staticmethod
     def get_patient(patient_id):
         """Obtener paciente por ID"""
-        for patient in st.session_state.patients_db:
-            if patient['id'] == patient_id:
-                return patient
-        return None
+        return PatientManager.get_registry().get(patient_id)
+    
+    @staticmethod
+    def get_patient_by_identification(identificacion):
+        """Obtener paciente por número de identificación"""
+        return PatientManager.get_registry().get_by_identificacion(identificacion)
     
     @staticmethod
     def update_patient(patient_id, updated_data):
         """Actualizar datos del paciente"""
-        for i, patient in enumerate(st.session_state.patients_db):
-            if patient['id'] == patient_id:
-                st.session_state.patients_db[i].update(updated_data)
-                return True
-        return False
+        patient = PatientManager.get_registry().update(patient_id, updated_data)
+        if patient is None:
+            return False
+        DataPersistence.mark_patient_dirty(patient)
+        return True
+    
+    @staticmethod
+    def deletion_blocker(patient_id):
+        """Motivo por el que el paciente no se puede eliminar, o None
+
+        Los análisis forman parte del historial clínico y no se borran: un paciente con
+        análisis guardados o en curso se conserva para que ningún reporte quede sin titular.
+        """
+        count = AnalysisManager.get_index().count_for_patient(patient_id)
+        if count:
+            return f"tiene {count} análisis registrados"
+        if get_job_queue().has_pending(patient_id):
+            return "tiene análisis en curso"
+        return None
+    
+    @staticmethod
+    def delete_patient(patient_id):
+        """Eliminar un paciente sin análisis de la base de datos"""
+        if PatientManager.deletion_blocker(patient_id):
+            return False
+        if PatientManager.get_registry().remove(patient_id) is None:
+            return False
+        AnalysisManager.get_aggregates().remove_patient()
+        DataPersistence.get_writer().delete_patient(patient_id)
+        return True
+    
+    @staticmethod
+    def search_patients(query, limit=None):
+        """Buscar pacientes sin distinguir tildes ni mayúsculas, ordenados por relevancia"""
+        return PatientManager.get_registry().search(query, limit)
+    
+    @staticmethod
+    def recent_patient_ids(limit, first=None):
+        """Hasta `limit` ids, del paciente registrado más recientemente al más antiguo
+
+        `first`, si existe, encabeza la lista (p. ej. el paciente elegido en otra pestaña).
+        """
+        recent = [p['id'] for p in PatientManager.get_registry().sorted_page('created_at', 0, limit, descending=True)]
+        if first is None or PatientManager.get_patient(first) is None:
+            return recent
+        return [first] + [patient_id for patient_id in recent if patient_id != first][:limit - 1]
     
     @staticmethod
     def get_all_patients():
         """Obtener todos los pacientes"""
         return st.session_state.patients_db
 
+class AnalysisManager:
+    @staticmethod
+    def get_index():
+        if 'analysis_index' not in st.session_state:
+            st.session_state.analysis_index = AnalysisIndex(st.session_state.analysis_results)
+        return st.session_state.analysis_index
+    
+    @staticmethod
+    def rebuild_index():
+        AnalysisManager.get_index().rebuild(st.session_state.analysis_results)
+    
+    @staticmethod
+    def get_aggregates():
+        if 'dashboard_aggregates' not in st.session_state:
+            st.session_state.dashboard_aggregates = DashboardAggregates(
+                st.session_state.patients_db, st.session_state.analysis_results)
+        return st.session_state.dashboard_aggregates
+    
+    @staticmethod
+    def rebuild_aggregates():
+        AnalysisManager.get_aggregates().rebuild(st.session_state.patients_db, st.session_state.analysis_results)
+    
+    @staticmethod
+    def get_columns():
+        """Almacén columnar de la sesión; se abre la primera vez que una página lo necesita"""
+        if 'analysis_columns' not in st.session_state:
+            st.session_state.analysis_columns = AnalysisManager.load_columns(
+                st.session_state.analysis_results, st.session_state.get('analysis_source'))
+        return st.session_state.analysis_columns
+    
+    @staticmethod
+    def columns_match(store, analyses, source):
+        """¿Las columnas guardadas son un prefijo de `analyses`? (mismo linaje y `seq` no posterior)"""
+        saved = store.source
+        return (saved is not None and source is not None and saved['lineage'] == source['lineage']
+                and saved['seq'] <= source['seq'] and store.records <= len(analyses))
+    
+    @staticmethod
+    def load_columns(analyses, source=None):
+        """Abrir las columnas guardadas (mmap) y ponerlas al día; se reconstruyen si no cuadran
+
+        `source` es el origen de `analyses` (RecordStore.load_analyses). La copia actualizada se
+        guarda en segundo plano; sin origen conocido no se guarda.
+        """
+        store = columnar.ColumnarStore.load(DataPersistence.COLUMNS_DIR)
+        if store is not None and AnalysisManager.columns_match(store, analyses, source):
+            if store.records == len(analyses):
+                return store
+            store.append_records(analyses[store.records:])
+        else:
+            store = columnar.ColumnarStore.from_records(analyses)
+        if source is not None:
+            threading.Thread(target=columnar.save_snapshot, daemon=True,
+                             args=(store.snapshot(), DataPersistence.COLUMNS_DIR, source)).start()
+        return store
+    
+    @staticmethod
+    def find_analyses(patient_id=None, day=None):
+        """Posiciones de los análisis filtrados por paciente y/o día"""
+        return AnalysisManager.get_index().query(patient_id, day)
+
+@st.cache_resource
+def get_inference_backend(name, weights_path, size):
+    """Motor de inferencia cargado y calentado una vez por proceso, compartido por las sesiones"""
+    backend = backends.get_backend(name, weights_path)
+    backend.warm_up(size)
+    return backend
+
+@st.cache_resource
+def get_analysis_pool(workers, backend, size):
+    """Pool de procesos de análisis compartido (uno por configuración de procesos y motor)"""
+    return parallel.create_process_pool(workers, backend, size)
+
+@st.cache_resource
+def get_comparison_pool():
+    """Hilos para ejecutar las técnicas de la comparación en paralelo"""
+    return comparison.create_thread_pool()
+
+@st.cache_resource
+def get_analysis_cache(max_mb, cache_dir):
+    """Caché de resultados compartida por todas las sesiones"""
+    return AnalysisCache(max_bytes=max_mb * 1024 * 1024, disk_dir=cache_dir or None)
+
+@st.cache_resource
+def get_job_queue():
+    """Cola de trabajos en segundo plano (persiste entre re-ejecuciones y páginas)"""
+    return jobs.JobQueue(workers=2)
+
+TREND_FREQUENCIES = {'D': "Día", 'W': "Semana", 'M': "Mes"}
+TREND_MAX_POINTS = 400
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_trend(data_version, freq, start, end, _store):
+    """Análisis y resultados por diagnóstico por período, reducidos para el gráfico
+
+    Se recalcula solo cuando cambian los datos (`data_version`), el período o el rango.
+    """
+    trend = _store.class_counts_by(freq, start, end)
+    trend.insert(0, 'Análisis', _store.counts_by(freq, start, end).reindex(trend.index, fill_value=0))
+    reduced = columnar.downsample(trend, TREND_MAX_POINTS)
+    reduced.attrs['downsampled'] = len(reduced) < len(trend)
+    return reduced
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_image_preview(image_digest, _data):
+    """Miniatura de una imagen subida (se calcula una vez por contenido)"""
+    return decoding.make_preview(_data)
+
 class ImageAnalyzer:
     @staticmethod
-    def analyze_image(image, analysis_type="individual"):
-        """Simular análisis de imagen con IA"""
-        np.random.seed(42)  # Para resultados consistentes
-        results = {
+    def get_upload_digest(uploaded_file):
+        """Huella del contenido de un archivo subido, calculada una vez por archivo"""
+        digests = st.session_state.setdefault('upload_digests', {})
+        if uploaded_file.file_id not in digests:
+            digests[uploaded_file.file_id] = content_digest(uploaded_file.getvalue())
+        return digests[uploaded_file.file_id]
+    
+    @staticmethod
+    def open_upload(uploaded_file):
+        """Abrir un archivo subido para decodificarlo a la resolución de análisis"""
+        max_size = Config.get_config_value('model.max_image_size', 512)
+        return decoding.open_reduced(uploaded_file.getvalue(), max_size)
+    
+    @staticmethod
+    def show_preview(uploaded_file, caption):
+        preview = get_image_preview(ImageAnalyzer.get_upload_digest(uploaded_file), uploaded_file.getvalue())
+        st.image(preview, caption=caption, use_column_width=True)
+    
+    @staticmethod
+    def analyze_image(image, analysis_type="individual", image_digest=None, technique=None, preprocessing=()):
+        """Analizar imagen (PIL o arreglo RGB) con el motor de características (determinista)"""
+        return ImageAnalyzer.analysis_task(image, analysis_type, image_digest, technique, preprocessing)()
+    
+    @staticmethod
+    def analysis_task(image, analysis_type="individual", image_digest=None, technique=None, preprocessing=()):
+        """Preparar en la sesión un análisis que puede ejecutarse en cualquier hilo
+
+        Con `image_digest` (huella de los bytes subidos) el resultado se sirve desde la caché;
+        `preprocessing` nombra las etapas ya aplicadas a la imagen y forma parte de la clave.
+        """
+        max_size = Config.get_config_value('model.max_image_size', 512)
+        cache = ImageAnalyzer.get_cache()
+        backend = ImageAnalyzer.get_backend()
+        key = (ImageAnalyzer.cache_key(image_digest, backend, max_size, technique, *preprocessing)
+               if image_digest else None)
+        
+        def run():
+            analysis = cache.get(key) if key else None
+            if analysis is None:
+                analysis = backend.analyze_array(imaging.prepare_input(image, max_size))
+                if key:
+                    cache.put(key, analysis)
+            return ImageAnalyzer.build_results(analysis, analysis_type, image_digest)
+        return run
+    
+    @staticmethod
+    def techniques_task(uploaded_file, techniques):
+        """Preparar la comparación de técnicas: la imagen se decodifica una sola vez
+
+        Cada resultado incluye 'latency' (segundos) y 'cached'.
+        """
+        max_size = Config.get_config_value('model.max_image_size', 512)
+        cache = ImageAnalyzer.get_cache()
+        backend = ImageAnalyzer.get_backend()
+        executor = get_comparison_pool()
+        image = ImageAnalyzer.open_upload(uploaded_file)
+        image_digest = ImageAnalyzer.get_upload_digest(uploaded_file)
+        keys = {technique: ImageAnalyzer.cache_key(image_digest, backend, max_size, technique)
+                for technique in techniques}
+        
+        def run():
+            analyses = {technique: cache.get(key) for technique, key in keys.items()}
+            misses = [technique for technique, analysis in analyses.items() if analysis is None]
+            if misses:
+                shared = imaging.prepare_input(image, max_size)
+                computed = comparison.compare_techniques(shared, misses, backend, executor)
+                for technique, analysis in computed.items():
+                    cache.put(keys[technique], analysis)
+                    analyses[technique] = analysis
+            comparison_results = {}
+            for technique in techniques:
+                results = ImageAnalyzer.build_results(analyses[technique], f"comparison_{technique}")
+                results['latency'] = analyses[technique]['latency']
+                results['cached'] = technique not in misses
+                comparison_results[technique] = results
+            return comparison_results
+        return run
+    
+    @staticmethod
+    def get_cache():
+        return get_analysis_cache(Config.get_config_value('model.cache_mb', 64),
+                                  Config.get_config_value('model.cache_dir', ''))
+    
+    @staticmethod
+    def get_backend_spec():
+        """(nombre, ruta de pesos) del motor configurado; identifica el motor en otros procesos"""
+        return (Config.get_config_value('model.backend', backends.FEATURES_BACKEND),
+                Config.get_config_value('model.weights_path', '') or None)
+    
+    @staticmethod
+    def get_backend():
+        return get_inference_backend(*ImageAnalyzer.get_backend_spec(),
+                                     Config.get_config_value('model.max_image_size', 512))
+    
+    @staticmethod
+    def cache_key(image_digest, backend, max_size, technique=None, *preprocessing):
+        return AnalysisCache.make_key(image_digest, backend.name, backend.version, max_size,
+                                      technique, *preprocessing)
+    
+    @staticmethod
+    def batch_task(encoded_images, analysis_type="batch"):
+        """Preparar un lote de imágenes codificadas; el generador devuelto produce
+        (posición, resultados) a medida que termina cada una
+
+        Las imágenes ya analizadas salen de la caché sin decodificarse. Las copias de
+        impresión se generan en los procesos de análisis, con la misma decodificación.
+        """
+        max_size = Config.get_config_value('model.max_image_size', 512)
+        batch_size = Config.get_config_value('model.batch_size', 8)
+        workers = Config.get_config_value('model.workers', 1)
+        cache = ImageAnalyzer.get_cache()
+        backend = ImageAnalyzer.get_backend()
+        backend_spec = ImageAnalyzer.get_backend_spec()
+        executor = get_analysis_pool(workers, backend_spec, max_size) if workers > 1 else None
+        print_store = ReportGenerator.get_print_store()
+        
+        def run():
+            digests = [content_digest(data) for data in encoded_images]
+            keys = [ImageAnalyzer.cache_key(digest, backend, max_size) for digest in digests]
+            pending = []
+            for position, key in enumerate(keys):
+                analysis = cache.get(key)
+                if analysis is None:
+                    pending.append(position)
+                else:
+                    print_store.add(encoded_images[position], digests[position])
+                    yield position, ImageAnalyzer.build_results(analysis, analysis_type, digests[position])
+            if not pending:
+                return
+            # Bloques no mayores que lo necesario para dar trabajo a todos los procesos
+            chunk_size = max(1, min(batch_size, -(-len(pending) // workers)))
+            misses = [encoded_images[position] for position in pending]
+            for index, analysis, jpeg in parallel.iter_batch_analysis(misses, max_size, chunk_size, executor,
+                                                                      backend_spec, print_copies=True):
+                position = pending[index]
+                cache.put(keys[position], analysis)
+                print_store.put(digests[position], jpeg)
+                yield position, ImageAnalyzer.build_results(analysis, analysis_type, digests[position])
+        return run
+    
+    @staticmethod
+    def build_results(analysis, analysis_type, image_digest=None):
+        return {
+            'analysis_id': uuid.uuid4().hex,
+            'image_digest': image_digest,
             'timestamp': datetime.now(),
             'analysis_type': analysis_type,
-            'predictions': {
-                'Normal': np.random.uniform(0.1, 0.4),
-                'CIN I': np.random.uniform(0.1, 0.3),
-                'CIN II': np.random.uniform(0.1, 0.3),
-                'CIN III': np.random.uniform(0.1, 0.3),
-                'Carcinoma': np.random.uniform(0.05, 0.2)
-            },
-            'confidence': np.random.uniform(0.75, 0.95),
-            'image_quality': np.random.uniform(0.8, 1.0),
-            'recommendations': []
+            'predictions': dict(analysis['predictions']),
+            'confidence': analysis['confidence'],
+            'image_quality': analysis['image_quality'],
+            'features': dict(analysis['features']),
+            'recommendations': ImageAnalyzer.get_recommendations(analysis['predictions'])
         }
-        total = sum(results['predictions'].values())
-        results['predictions'] = {k: v/total for k, v in results['predictions'].items()}
-        max_class = max(results['predictions'], key=results['predictions'].get)
+    
+    @staticmethod
+    def get_recommendations(predictions):
+        """Recomendaciones clínicas según el diagnóstico más probable"""
+        max_class = max(predictions, key=predictions.get)
         if max_class == 'Normal':
-            results['recommendations'] = [
+            return [
                 "Continuar con controles de rutina",
                 "Repetir colposcopía en 12 meses"
             ]
         elif max_class in ['CIN I']:
-            results['recommendations'] = [
+            return [
                 "Seguimiento estrecho cada 6 meses",
                 "Considerar biopsia si persiste",
                 "Evaluación de factores de riesgo"
             ]
         elif max_class in ['CIN II', 'CIN III']:
-            results['recommendations'] = [
+            return [
                 "Biopsia confirmativa recomendada",
                 "Tratamiento según protocolo",
                 "Seguimiento oncológico"
             ]
         else:
-            results['recommendations'] = [
+            return [
                 "Evaluación oncológica urgente",
                 "Biopsia confirmatoria inmediata",
                 "Estadificación completa"
             ]
-        return results
+
+@st.cache_resource
+def get_export_pool(workers):
+    """Pool de procesos para renderizar reportes en exportaciones masivas"""
+    return parallel.create_process_pool(workers)
+
+@st.cache_resource
+def get_print_store(directory):
+    """Copias de impresión de las imágenes analizadas (por huella de contenido)"""
+    return images.PrintImageStore(directory)
+
+@st.cache_resource
+def get_report_cache():
+    """PDF ya generados, compartidos por todas las sesiones"""
+    return AnalysisCache(max_bytes=32 * 1024 * 1024)
 
 class ReportGenerator:
     @staticmethod
-    def create_pdf_report(patient_data, analysis_results, image_data=None):
-        """Generar reporte PDF"""
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1,
-            textColor=colors.darkblue
-        )
-        story.append(Paragraph("REPORTE DE ANÁLISIS COLPOSCÓCICO", title_style))
-        story.append(Spacer(1, 20))
-        patient_info = [
-            ['Datos del Paciente', ''],
-            ['Nombre:', f"{patient_data['nombre']} {patient_data['apellido']}"],
-            ['Identificación:', patient_data['identificacion']],
-            ['Fecha de Nacimiento:', str(patient_data['fecha_nacimiento'])],
-            ['Edad:', str(patient_data['edad'])],
-            ['Teléfono:', patient_data.get('telefono', 'N/A')],
-            ['Email:', patient_data.get('email', 'N/A')],
-            ['Fecha del Análisis:', analysis_results['timestamp'].strftime('%d/%m/%Y %H:%M')]
-        ]
-        patient_table = Table(patient_info, colWidths=[2*inch, 4*inch])
-        patient_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(patient_table)
-        story.append(Spacer(1, 20))
-        story.append(Paragraph("RESULTADOS DEL ANÁLISIS", styles['Heading2']))
-        story.append(Spacer(1, 10))
-        results_data = [['Diagnóstico', 'Probabilidad (%)']]
-        for diag, prob in analysis_results['predictions'].items():
-            results_data.append([diag, f"{prob*100:.1f}%"])
-        results_table = Table(results_data, colWidths=[3*inch, 2*inch])
-        results_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(results_table)
-        story.append(Spacer(1, 20))
-        story.append(Paragraph("RECOMENDACIONES CLÍNICAS", styles['Heading2']))
-        story.append(Spacer(1, 10))
-        for i, rec in enumerate(analysis_results['recommendations'], 1):
-            story.append(Paragraph(f"{i}. {rec}", styles['Normal']))
-            story.append(Spacer(1, 5))
-        story.append(Spacer(1, 20))
-        info_adicional = f"""
-        <b>Confianza del análisis:</b> {analysis_results['confidence']*100:.1f}%<br/>
-        <b>Calidad de imagen:</b> {analysis_results['image_quality']*100:.1f}%<br/>
-        <b>Tipo de análisis:</b> {analysis_results['analysis_type'].title()}<br/>
-        <br/>
-        <i>Este reporte es generado automáticamente por el sistema ColpoVision y debe ser 
-        interpretado por un profesional médico calificado. No sustituye el juicio clínico.</i>
+    def create_pdf_report(patient_data, analysis_results, image_data=None, options=None):
+        """Generar reporte PDF
+
+        La imagen incrustada es `image_data` o, si no se indica, la guardada al analizar.
         """
-        story.append(Paragraph(info_adicional, styles['Normal']))
-        doc.build(story)
-        buffer.seek(0)
-        return buffer
+        image_digest = analysis_results.get('image_digest')
+        if image_data is not None:
+            image_digest = ReportGenerator.get_print_store().add(image_data)
+        return io.BytesIO(ReportGenerator.get_pdf_bytes(patient_data, analysis_results, options, image_digest))
+    
+    @staticmethod
+    def get_print_store():
+        return get_print_store(DataPersistence.IMAGE_DIR)
+    
+    @staticmethod
+    def get_pdf_bytes(patient_data, analysis_results, options=None, image_digest=None):
+        """Bytes del PDF; se reutilizan mientras no cambien el paciente, el análisis ni las opciones"""
+        cache = get_report_cache()
+        key = f"{reports.report_key(patient_data, analysis_results, options)}|{image_digest}"
+        pdf = cache.get(key)
+        if pdf is None:
+            image = None
+            if reports.normalize_options(options)['images']:
+                image = ReportGenerator.get_print_store().get(image_digest)
+            pdf = reports.render_report(patient_data, analysis_results, options, image)
+            cache.put(key, pdf)
+        return pdf
+
+    @staticmethod
+    def export_items(positions, options=None):
+        """Elementos (nombre, paciente, resultados, opciones) de los análisis indicados
+
+        Los lotes aportan un reporte por imagen.
+        """
+        items = []
+        for i in positions:
+            analysis = st.session_state.analysis_results[i]
+            patient = PatientManager.get_patient(analysis['patient_id'])
+            if patient is None:
+                continue
+            if 'results' in analysis:
+                entries = [(analysis.get('image_name', 'analisis'), analysis['results'])]
+            else:
+                entries = [(r['filename'], r['results']) for r in analysis.get('batch_results', [])]
+            for label, results in entries:
+                name = export.safe_filename(
+                    f"{len(items) + 1:05d}_{patient['apellido']}_{patient['nombre']}_"
+                    f"{results['timestamp'].strftime('%Y%m%d_%H%M')}_{os.path.splitext(label)[0]}")
+                items.append((name + '.pdf', patient, results, options))
+        return items
+    
+    @staticmethod
+    def discard_export(path):
+        """Borrar el archivo temporal de una exportación, si todavía existe"""
+        if os.path.exists(path):
+            os.remove(path)
+    
+    @staticmethod
+    def submit_export(items, export_format):
+        """Encolar la exportación; el archivo se escribe en disco a medida que se genera
+
+        El archivo se borra al descargarlo, al reemplazarlo con otra exportación o cuando
+        la cola descarta el trabajo; si la exportación falla se borra el archivo parcial.
+        """
+        previous = get_job_queue().get(st.session_state.get('job_views', {}).get('bulk_export', ''))
+        if previous and previous['result']:
+            ReportGenerator.discard_export(previous['result']['path'])
+        suffix = '.zip' if export_format == 'zip' else '.pdf'
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix='colpovision_reportes_')
+        os.close(fd)
+        workers = Config.get_config_value('model.workers', 1)
+        executor = get_export_pool(workers) if workers > 1 else None
+        
+        def run(report):
+            try:
+                if export_format == 'zip':
+                    export.export_zip(items, path, executor, report, DataPersistence.IMAGE_DIR)
+                else:
+                    export.export_merged_pdf(items, path, report, DataPersistence.IMAGE_DIR)
+            except Exception:
+                ReportGenerator.discard_export(path)
+                raise
+            return {'path': path, 'format': export_format, 'count': len(items)}
+        return JobManager.submit("export", f"Exportación de {len(items)} reportes", run, view="bulk_export",
+                                 discard=lambda result: ReportGenerator.discard_export(result['path']))
+
+@st.cache_resource
+def get_mail_dispatcher(outbox_file):
+    """Cola de correo en disco y su despachador, compartidos por todas las sesiones"""
+    return outbox.Dispatcher(outbox.Outbox(outbox_file))
 
 class EmailSender:
+    OUTBOX_FILE = 'colpovision_outbox.db'
+    DEFAULT_BODY = """Estimado/a paciente,
+
+Adjunto encontrará el reporte de su análisis colposcópico.
+
+Por favor, consulte con su médico tratante para la interpretación de los resultados.
+
+Saludos cordiales,
+Sistema ColpoVision"""
+
     @staticmethod
-    def send_report_email(recipient_email, patient_name, pdf_buffer, smtp_config):
-        """Enviar reporte por email"""
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = smtp_config['email']
-            msg['To'] = recipient_email
-            msg['Subject'] = f"Reporte de Análisis Colposcópico - {patient_name}"
-            body = f"""
-            Estimado/a paciente,
-            
-            Adjunto encontrará el reporte de su análisis colposcópico realizado el {datetime.now().strftime('%d/%m/%Y')}.
-            
-            Por favor, consulte con su médico tratante para la interpretación de los resultados.
-            
-            Saludos cordiales,
-            Sistema ColpoVision
-            """
-            msg.attach(MIMEText(body, 'plain'))
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(pdf_buffer.read())
-            encoders.encode_base64(part)
-            part.add_header(
-                'Content-Disposition',
-                f'attachment; filename="Reporte_Colposcopia_{patient_name.replace(" ", "_")}.pdf"'
-            )
-            msg.attach(part)
-            server = smtplib.SMTP(smtp_config['smtp_server'], smtp_config['port'])
-            server.starttls()
-            server.login(smtp_config['email'], smtp_config['password'])
-            text = msg.as_string()
-            server.sendmail(smtp_config['email'], recipient_email, text)
-            server.quit()
-            return True, "Email enviado exitosamente"
-        except Exception as e:
-            return False, f"Error al enviar email: {str(e)}"
+    def attachment_name(patient_name):
+        return f"Reporte_Colposcopia_{patient_name.replace(' ', '_')}.pdf"
+
+    @staticmethod
+    def get_dispatcher():
+        return get_mail_dispatcher(EmailSender.OUTBOX_FILE)
+
+    @staticmethod
+    def queue_reports(deliveries, smtp_config, subject, body):
+        """Encolar [(paciente, resultados, [destinatarios]), ...] y devolver cuántos mensajes se encolaron
+
+        Cada PDF se genera una vez (o se toma de la caché) y se guarda una sola vez en la
+        cola para todos sus destinatarios; el envío lo hace el despachador en segundo plano.
+        """
+        messages = []
+        for patient, results, recipients in deliveries:
+            patient_name = f"{patient['nombre']} {patient['apellido']}"
+            pdf = ReportGenerator.get_pdf_bytes(patient, results, image_digest=results.get('image_digest'))
+            for recipient in recipients:
+                messages.append({
+                    'sender': smtp_config['email'],
+                    'recipient': recipient,
+                    'patient': patient_name,
+                    'subject': subject,
+                    'body': body,
+                    'filename': EmailSender.attachment_name(patient_name),
+                    'pdf': pdf
+                })
+        if messages:
+            EmailSender.get_dispatcher().enqueue(smtp_config, messages)
+        return len(messages)
+
+    @staticmethod
+    def history_frame(limit=500):
+        """Historial de envíos leído de la cola"""
+        rows = EmailSender.get_dispatcher().outbox.history(limit)
+        return pd.DataFrame([{
+            'Fecha': datetime.fromtimestamp(row['created_at']).strftime('%d/%m/%Y %H:%M'),
+            'Paciente': row['patient'],
+            'Destinatario': row['recipient'],
+            'Asunto': row['subject'],
+            'Estado': outbox.STATUS_LABELS.get(row['status'], row['status']),
+            'Intentos': row['attempts'],
+            'Finalizado': datetime.fromtimestamp(row['sent_at']).strftime('%H:%M:%S') if row['sent_at'] else '',
+            'Latencia (ms)': round(row['latency'] * 1000) if row['latency'] else None,
+            'Detalle': row['last_error'] or ''
+        } for row in rows])
 
 class DataValidator:
     @staticmethod
@@ -303,44 +675,100 @@ class DataValidator:
             errors.append("Edad debe estar entre 0 y 120 años")
         return errors
 
+@st.cache_resource
+def get_record_store(db_file):
+    """Conexión compartida al almacén de registros (una por proceso)"""
+    return RecordStore(db_file)
+
+@st.cache_resource
+def get_record_writer(db_file):
+    """Escritor diferido compartido por todas las sesiones"""
+    return WriteBehindWriter(get_record_store(db_file))
+
+@st.cache_resource
+def get_patient_search_index(db_file):
+    """Índice de búsqueda de pacientes, construido una vez por proceso a partir del almacén"""
+    store = get_record_store(db_file)
+    writer = get_record_writer(db_file)
+    
+    def load():
+        writer.flush()
+        return store.load_patients()
+    return SharedSearchIndex(load)
+
 class DataPersistence:
     DATA_FILE = 'colpovision_data.pkl'
+    DB_FILE = 'colpovision_data.db'
+    IMAGE_DIR = 'colpovision_images'
+    COLUMNS_DIR = 'colpovision_columns'
     
     @staticmethod
-    def save_data():
-        try:
-            data = {
-                'patients_db': st.session_state.patients_db,
-                'analysis_results': st.session_state.analysis_results,
-                'timestamp': datetime.now()
-            }
-            with open(DataPersistence.DATA_FILE, 'wb') as f:
-                pickle.dump(data, f)
-            return True
-        except Exception as e:
-            st.error(f"Error al guardar datos: {e}")
-            return False
+    def get_store():
+        return get_record_store(DataPersistence.DB_FILE)
+    
+    @staticmethod
+    def get_writer():
+        return get_record_writer(DataPersistence.DB_FILE)
+    
+    @staticmethod
+    def mark_patient_dirty(patient):
+        """Registrar que un paciente cambió; se escribirá en segundo plano"""
+        DataPersistence.get_writer().put_patient(patient)
+    
+    @staticmethod
+    def add_analysis(record):
+        """Agregar a la sesión un análisis que su trabajo ya encoló para persistencia"""
+        aggregates = AnalysisManager.get_aggregates()
+        columns = AnalysisManager.get_columns()
+        st.session_state.analysis_results.append(record)
+        AnalysisManager.get_index().add(len(st.session_state.analysis_results) - 1, record)
+        aggregates.add_analysis(record)
+        columns.append_records([record])
+    
+    @staticmethod
+    def save_data(wait=False):
+        """Escribir ya los cambios pendientes (cada cambio se encola al hacerse)
+
+        No bloquea salvo con `wait`. Devuelve False si la escritura falló o no terminó a tiempo.
+        """
+        writer = DataPersistence.get_writer()
+        if wait:
+            return writer.flush()
+        writer.request_write()
+        return writer.last_error is None
     
     @staticmethod
     def load_data():
         try:
-            if os.path.exists(DataPersistence.DATA_FILE):
-                with open(DataPersistence.DATA_FILE, 'rb') as f:
-                    data = pickle.load(f)
-                st.session_state.patients_db = data.get('patients_db', [])
-                st.session_state.analysis_results = data.get('analysis_results', [])
-                return True
+            store = DataPersistence.get_store()
+            DataPersistence.get_writer().flush()
+            store.migrate_pickle(DataPersistence.DATA_FILE)
+            analyses, source = store.load_analyses()
+            st.session_state.patients_db = store.load_patients()
+            st.session_state.analysis_results = analyses
+            st.session_state.analysis_source = source
+            PatientManager.rebuild_registry()
+            PatientManager.get_search_index().warm()
+            AnalysisManager.rebuild_index()
+            AnalysisManager.rebuild_aggregates()
+            st.session_state.pop('analysis_columns', None)
+            return True
         except Exception as e:
             st.error(f"Error al cargar datos: {e}")
         return False
     
     @staticmethod
-    def auto_save():
-        if 'last_save' not in st.session_state:
-            st.session_state.last_save = datetime.now()
-        if datetime.now() - st.session_state.last_save > timedelta(minutes=5):
-            if DataPersistence.save_data():
-                st.session_state.last_save = datetime.now()
+    def clear_data():
+        st.session_state.patients_db = []
+        st.session_state.analysis_results = []
+        st.session_state.analysis_source = None
+        PatientManager.rebuild_registry()
+        AnalysisManager.rebuild_index()
+        AnalysisManager.rebuild_aggregates()
+        st.session_state.pop('analysis_columns', None)
+        shutil.rmtree(DataPersistence.COLUMNS_DIR, ignore_errors=True)
+        DataPersistence.get_writer().clear()
+        PatientManager.get_search_index().reset()
 
 class SecurityManager:
     @staticmethod
@@ -377,39 +805,173 @@ class Logger:
     def log_error(error_msg, context=""):
         logger = logging.getLogger(__name__)
         logger.error(f"Error: {error_msg} - Contexto: {context}")
+    
+    @staticmethod
+    def log_startup(timings):
+        logger = logging.getLogger(__name__)
+        message = (f"Arranque - Importaciones: {timings['imports']:.2f} s, "
+                   f"Primera ejecución: {timings['first_run']:.2f} s")
+        if timings['first_run'] > STARTUP_BUDGET_SECONDS:
+            logger.warning(f"{message} (supera el presupuesto de {STARTUP_BUDGET_SECONDS:.1f} s)")
+        else:
+            logger.info(message)
 
 class EnhancedImageAnalyzer(ImageAnalyzer):
     @staticmethod
-    def preprocess_image(image):
-        img_array = np.array(image)
-        enhancer = ImageEnhance.Contrast(image)
-        enhanced_img = enhancer.enhance(1.2)
-        return enhanced_img
+    def get_pipeline(uploaded_file):
+        """Pipeline de preprocesamiento memorizado para el archivo subido actual"""
+        max_size = Config.get_config_value('model.max_image_size', 512)
+        key = (EnhancedImageAnalyzer.get_upload_digest(uploaded_file), max_size)
+        cached = st.session_state.get('preprocessing_pipeline')
+        if cached is None or cached[0] != key:
+            base = decoding.decode_working(uploaded_file.getvalue(), max_size)
+            cached = (key, preprocessing.PreprocessingPipeline(base))
+            st.session_state.preprocessing_pipeline = cached
+        return cached[1]
+    
+    @staticmethod
+    def preprocess_image(uploaded_file, stages):
+        """Aplicar las etapas seleccionadas; solo se recalculan las posteriores a un cambio"""
+        return EnhancedImageAnalyzer.get_pipeline(uploaded_file).run(stages)
     
     @staticmethod
     def validate_image_quality(image):
-        img_array = np.array(image)
-        height, width = img_array.shape[:2]
-        if height < 224 or width < 224:
-            return False, "Imagen muy pequeña (mínimo 224x224)"
-        mean_intensity = np.mean(img_array)
-        if mean_intensity < 10:
-            return False, "Imagen muy oscura"
-        if mean_intensity > 245:
-            return False, "Imagen muy clara"
-        return True, "Calidad aceptable"
+        """Control de calidad de una imagen PIL sobre una copia reducida"""
+        return quality.check_images([image])[0]
+    
+    @staticmethod
+    def passes_quality_gate(uploaded_file):
+        """Mostrar el motivo y devolver False si la imagen no supera el control de calidad"""
+        accepted, message = EnhancedImageAnalyzer.validate_uploads([uploaded_file.getvalue()])[0]
+        if not accepted:
+            st.error(f"❌ Imagen rechazada: {message}")
+        return accepted
+    
+    @staticmethod
+    def validate_uploads(encoded_images):
+        """Control de calidad vectorizado de imágenes codificadas: [(aceptada, mensaje), ...]"""
+        return quality.check_encoded(encoded_images)
+
+class JobManager:
+    STATUS_LABELS = {
+        jobs.PENDING: "⏳ En cola",
+        jobs.RUNNING: "🔄 Procesando",
+        jobs.DONE: "✅ Completado",
+        jobs.FAILED: "❌ Error",
+    }
+    
+    @staticmethod
+    def submit(kind, label, fn, patient_id=None, view=None, discard=None):
+        """Encolar `fn(report)` y asociarlo a la sesión (y a una vista de resultados)
+
+        `fn` devuelve un dict; si incluye 'record' el propio trabajo lo encola en el escritor
+        compartido (se guarda aunque se cierre la pestaña) y si incluye 'confidence' se registra.
+        `discard(result)` libera lo que deje el resultado cuando la cola descarta el trabajo.
+        """
+        writer = DataPersistence.get_writer()
+        
+        def persisted(report):
+            result = fn(report)
+            if result.get('record') is not None:
+                writer.append_analyses([result['record']])
+            return result
+        job_id = get_job_queue().submit(kind, label, persisted, patient_id, discard)
+        st.session_state.setdefault('job_ids', []).append(job_id)
+        if view:
+            st.session_state.setdefault('job_views', {})[view] = job_id
+        return job_id
+    
+    @staticmethod
+    def get_session_jobs():
+        queue = get_job_queue()
+        session_jobs = [queue.get(job_id) for job_id in st.session_state.get('job_ids', [])]
+        return [job for job in session_jobs if job is not None]
+    
+    @staticmethod
+    def collect_finished():
+        """Incorporar (una sola vez) a la sesión los resultados ya guardados de sus trabajos terminados"""
+        queue = get_job_queue()
+        collected = st.session_state.setdefault('collected_jobs', set())
+        for job in JobManager.get_session_jobs():
+            if job['status'] != jobs.DONE or job['id'] in collected:
+                continue
+            collected.add(job['id'])
+            queue.mark_collected(job['id'])
+            if job['result'].get('record') is not None:
+                DataPersistence.add_analysis(job['result']['record'])
+            if 'confidence' in job['result']:
+                Logger.log_analysis(job['patient_id'], job['kind'], job['result']['confidence'])
+    
+    @staticmethod
+    def has_uncollected():
+        collected = st.session_state.get('collected_jobs', set())
+        return any(job['status'] == jobs.DONE and job['id'] not in collected
+                   for job in JobManager.get_session_jobs())
+    
+    @staticmethod
+    def show_view(view, render):
+        """Mostrar el estado del último trabajo de una vista, o su resultado con `render(job)`"""
+        job_id = st.session_state.get('job_views', {}).get(view)
+        job = get_job_queue().get(job_id) if job_id else None
+        if job is None:
+            return
+        if job['status'] == jobs.DONE:
+            render(job)
+        elif job['status'] == jobs.FAILED:
+            st.error(f"❌ El trabajo {job['id']} falló: {job['error']}")
+        else:
+            st.info(f"{JobManager.STATUS_LABELS[job['status']]}: {job['label']} (trabajo {job['id']}). "
+                    "Puede seguir usando la aplicación; el resultado aparecerá aquí al terminar.")
+            st.progress(job['progress'], text=job['message'] or None)
+    
+    @staticmethod
+    def show_job_list(session_jobs):
+        st.subheader("⏱️ Trabajos en Segundo Plano")
+        for job in reversed(session_jobs[-5:]):
+            st.caption(f"{JobManager.STATUS_LABELS[job['status']]} · {job['label']}")
+            if not job['finished']:
+                st.progress(job['progress'])
+
+@st.fragment(run_every=1.0)
+def poll_jobs():
+    """Actualizar el progreso cada segundo; al terminar un trabajo se re-ejecuta la app"""
+    if JobManager.has_uncollected():
+        st.rerun()
+    JobManager.show_job_list(JobManager.get_session_jobs())
+
+def show_job_monitor():
+    """Trabajos de la sesión en la barra lateral, visibles desde cualquier página"""
+    session_jobs = JobManager.get_session_jobs()
+    with st.sidebar:
+        if any(not job['finished'] for job in session_jobs):
+            poll_jobs()
+        elif session_jobs:
+            JobManager.show_job_list(session_jobs)
+
+def show_persistence_status():
+    """Avisar en la barra lateral si los cambios no se están pudiendo guardar"""
+    writer = DataPersistence.get_writer()
+    if writer.last_error:
+        st.sidebar.error(f"⚠️ No se pudieron guardar {writer.pending()} cambios ({writer.last_error}); "
+                         "se reintentará automáticamente.")
 
 class Config:
     DEFAULT_CONFIG = {
         'ui': {
             'theme': 'light',
             'primary_color': '#1e3c72',
-            'secondary_color': '#2a5298'
+            'secondary_color': '#2a5298',
+            'page_size': 20
         },
         'model': {
             'confidence_threshold': 0.75,
             'batch_size': 8,
-            'max_image_size': 512
+            'max_image_size': 512,
+            'workers': parallel.default_workers(),
+            'cache_mb': 64,
+            'cache_dir': 'colpovision_cache',
+            'backend': backends.FEATURES_BACKEND,
+            'weights_path': ''
         },
         'email': {
             'smtp_server': 'smtp.gmail.com',
@@ -455,6 +1017,8 @@ def main():
         ["🏠 Dashboard", "👤 Gestión de Pacientes", "🔍 Análisis de Imágenes", 
          "📊 Reportes", "📧 Envío de Resultados", "⚙️ Configuración"]
     )
+    show_job_monitor()
+    show_persistence_status()
     
     if page == "🏠 Dashboard":
         show_dashboard()
@@ -469,54 +1033,59 @@ def main():
     elif page == "⚙️ Configuración":
         show_configuration()
 
+MONTH_NAMES = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
 def show_dashboard():
     st.header("📊 Dashboard General")
+    aggregates = AnalysisManager.get_aggregates()
+    mean_confidence = aggregates.mean_confidence
+    mean_time = aggregates.mean_processing_time
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.markdown(f"""
         <div class="metric-card">
             <h3>👤 Pacientes</h3>
-            <h2>{len(st.session_state.patients_db)}</h2>
+            <h2>{aggregates.patients}</h2>
         </div>
         """, unsafe_allow_html=True)
     with col2:
-        total_analyses = len(st.session_state.analysis_results)
         st.markdown(f"""
         <div class="metric-card">
             <h3>🔍 Análisis</h3>
-            <h2>{total_analyses}</h2>
+            <h2>{aggregates.analyses}</h2>
         </div>
         """, unsafe_allow_html=True)
     with col3:
-        st.markdown("""
+        st.markdown(f"""
         <div class="metric-card">
-            <h3>📈 Precisión</h3>
-            <h2>94.2%</h2>
+            <h3>📈 Confianza Prom.</h3>
+            <h2>{f"{mean_confidence*100:.1f}%" if mean_confidence is not None else "—"}</h2>
         </div>
         """, unsafe_allow_html=True)
     with col4:
-        st.markdown("""
+        st.markdown(f"""
         <div class="metric-card">
             <h3>⏱️ Tiempo Prom.</h3>
-            <h2>2.3 min</h2>
+            <h2>{f"{mean_time:.1f} s" if mean_time is not None else "—"}</h2>
         </div>
         """, unsafe_allow_html=True)
     
     st.markdown("---")
     
-    if st.session_state.analysis_results:
+    if aggregates.analyses:
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("📊 Distribución de Diagnósticos")
-            diagnoses = ['Normal', 'CIN I', 'CIN II', 'CIN III', 'Carcinoma']
-            values = [45, 25, 15, 10, 5]
+            diagnoses = list(aggregates.by_class)
+            values = list(aggregates.by_class.values())
             fig = px.pie(values=values, names=diagnoses, title="Distribución de Diagnósticos")
             st.plotly_chart(fig, use_container_width=True)
         with col2:
             st.subheader("📈 Análisis por Mes")
-            months = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun']
-            analyses = [12, 15, 18, 22, 19, 25]
-            fig = px.line(x=months, y=analyses, title="Análisis Realizados por Mes")
+            monthly = aggregates.monthly_counts()
+            months = [f"{MONTH_NAMES[month - 1]} {year}" for (year, month), _ in monthly]
+            analyses = [count for _, count in monthly]
+            fig = px.line(x=months, y=analyses, title="Análisis Realizados por Mes", markers=True)
             st.plotly_chart(fig, use_container_width=True)
 
 def show_patient_management():
@@ -562,6 +1131,8 @@ def show_patient_management():
                     'observaciones': observaciones
                 }
                 errors = DataValidator.validate_patient_data(patient_data)
+                if PatientManager.get_patient_by_identification(identificacion):
+                    errors.append("Ya existe un paciente con esa identificación")
                 if not errors:
                     patient_id = PatientManager.add_patient(patient_data)
                     st.success(f"✅ Paciente agregado exitosamente con ID: {patient_id}")
@@ -573,20 +1144,19 @@ def show_patient_management():
     with tab2:
         st.subheader("Lista de Pacientes Registrados")
         if st.session_state.patients_db:
-            df_patients = pd.DataFrame(st.session_state.patients_db)
             col1, col2 = st.columns(2)
             with col1:
                 search_term = st.text_input("🔍 Buscar paciente", placeholder="Nombre, apellido o identificación")
             with col2:
                 sort_by = st.selectbox("Ordenar por:", ["nombre", "apellido", "fecha_nacimiento", "created_at"])
             if search_term:
-                mask = (
-                    df_patients['nombre'].str.contains(search_term, case=False, na=False) |
-                    df_patients['apellido'].str.contains(search_term, case=False, na=False) |
-                    df_patients['identificacion'].str.contains(search_term, case=False, na=False)
-                )
-                df_patients = df_patients[mask]
-            for idx, patient in df_patients.iterrows():
+                matches = PatientManager.search_patients(search_term)
+                start, stop = show_pagination(len(matches), "patients_page")
+                patients = matches[start:stop]
+            else:
+                start, stop = show_pagination(len(PatientManager.get_registry()), "patients_page")
+                patients = PatientManager.get_registry().sorted_page(sort_by, start, stop)
+            for patient in patients:
                 with st.container():
                     st.markdown(f"""
                     <div class="patient-card">
@@ -609,11 +1179,9 @@ def show_patient_management():
     with tab3:
         st.subheader("Editar Información del Paciente")
         if st.session_state.patients_db:
-            patient_options = {f"{p['nombre']} {p['apellido']} - {p['identificacion']}": p['id'] 
-                             for p in st.session_state.patients_db}
-            selected_patient_key = st.selectbox("Seleccionar paciente:", list(patient_options.keys()))
-            if selected_patient_key:
-                patient_id = patient_options[selected_patient_key]
+            patient_id = pick_patient("edit", "Seleccionar paciente:", PatientManager.recent_patient_ids(
+                PATIENT_CHOICES, st.session_state.get('selected_patient')))
+            if patient_id is not None:
                 patient = PatientManager.get_patient(patient_id)
                 if patient:
                     with st.form(f"edit_patient_{patient_id}"):
@@ -637,23 +1205,118 @@ def show_patient_management():
                                 'edad': edad,
                                 'direccion': direccion
                             }
-                            if PatientManager.update_patient(patient_id, updated_data):
+                            existing = PatientManager.get_patient_by_identification(identificacion)
+                            if existing and existing['id'] != patient_id:
+                                st.error("⚠️ Ya existe un paciente con esa identificación")
+                            elif PatientManager.update_patient(patient_id, updated_data):
                                 st.success("✅ Datos actualizados correctamente")
                                 st.rerun()
                             else:
                                 st.error("❌ Error al actualizar los datos")
+                    confirm_key = f"confirm_delete_{patient_id}"
+                    blocker = PatientManager.deletion_blocker(patient_id)
+                    if blocker:
+                        st.session_state.pop(confirm_key, None)
+                        st.caption(f"🔒 No se puede eliminar: el paciente {blocker} "
+                                   "y el historial clínico se conserva.")
+                    elif st.session_state.get(confirm_key):
+                        st.warning(f"⚠️ ¿Eliminar definitivamente a {patient['nombre']} {patient['apellido']}? "
+                                   "Esta acción no se puede deshacer.")
+                        col1, col2 = st.columns(2)
+                        if col1.button("✅ Confirmar Eliminación", key=f"delete_confirm_{patient_id}", type="primary"):
+                            del st.session_state[confirm_key]
+                            if PatientManager.delete_patient(patient_id):
+                                st.success("✅ Paciente eliminado")
+                            st.rerun()
+                        if col2.button("❌ Cancelar", key=f"delete_cancel_{patient_id}"):
+                            del st.session_state[confirm_key]
+                            st.rerun()
+                    elif st.button("🗑️ Eliminar Paciente", key=f"delete_patient_{patient_id}"):
+                        st.session_state[confirm_key] = True
+                        st.rerun()
         else:
             st.info("No hay pacientes registrados para editar.")
 
+def format_patient_option(patient_id):
+    """Etiqueta de un paciente en los selectores"""
+    patient = PatientManager.get_patient(patient_id)
+    if patient is None:
+        return f"Paciente #{patient_id} (eliminado)"
+    return f"{patient['nombre']} {patient['apellido']} - {patient['identificacion']}"
+
+# Opciones como máximo en los selectores de paciente; el resto se alcanza buscando
+PATIENT_CHOICES = 50
+
+def pick_patient(key, label, default_ids, accept=None, none_label=None,
+                 no_match="Ningún paciente coincide con la búsqueda."):
+    """Selector de pacientes guiado por búsqueda: nunca ofrece más de PATIENT_CHOICES opciones
+
+    Sin texto se ofrecen `default_ids`; con texto, las primeras coincidencias que cumplan
+    `accept(patient_id)`. Con `none_label` (y sin búsqueda) se agrega la opción None.
+    """
+    query = st.text_input("🔍 Buscar paciente", key=f"{key}_search",
+                          placeholder="Nombre, apellido o identificación").strip()
+    if query:
+        if accept is None:
+            patient_ids = [p['id'] for p in PatientManager.search_patients(query, PATIENT_CHOICES)]
+        else:
+            matches = (p['id'] for p in PatientManager.search_patients(query) if accept(p['id']))
+            patient_ids = list(islice(matches, PATIENT_CHOICES))
+        if not patient_ids:
+            st.caption(no_match)
+    else:
+        patient_ids = list(default_ids)
+    # Al buscar, la primera coincidencia queda seleccionada en lugar de la opción None
+    options = ([None] if none_label and not query else []) + patient_ids
+    labels = {patient_id: none_label if patient_id is None else format_patient_option(patient_id)
+              for patient_id in options}
+    # La búsqueda forma parte de la clave: con otras opciones, el selector vuelve a la primera
+    return st.selectbox(label, options, format_func=labels.get, key=f"{key}_patient_{query}")
+
+def select_analysis_patient(key, allow_all=False):
+    """Elegir un paciente con análisis buscándolo por texto; None si no hay selección ('Todos')
+
+    Sin búsqueda se ofrecen los pacientes analizados más recientemente.
+    """
+    index = AnalysisManager.get_index()
+    return pick_patient(key, "Paciente", index.recent_patient_ids(PATIENT_CHOICES), index.has_patient,
+                        "Todos" if allow_all else None,
+                        "Ningún paciente con análisis coincide con la búsqueda.")
+
+def report_positions(patient_id):
+    """Análisis individuales (con resultados) de un paciente, del más reciente al más antiguo"""
+    analyses = st.session_state.analysis_results
+    return [i for i in reversed(AnalysisManager.find_analyses(patient_id)) if 'results' in analyses[i]]
+
+def format_analysis_option(position):
+    analysis = st.session_state.analysis_results[position]
+    analysis_date = analysis_datetime(analysis)
+    label = f"Análisis #{position + 1} - {analysis_date.strftime('%d/%m/%Y %H:%M') if analysis_date else 'sin fecha'}"
+    if 'image_name' in analysis:
+        label += f" - {analysis['image_name']}"
+    return label
+
+def show_pagination(total_items, key):
+    """Dibujar el selector de página y devolver el rango [inicio, fin) visible"""
+    page_size = Config.get_config_value('ui.page_size', 20)
+    total_pages = max(1, -(-total_items // page_size))
+    if st.session_state.get(key, 1) > total_pages:
+        st.session_state[key] = total_pages
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page = st.number_input("Página", min_value=1, max_value=total_pages, step=1, key=key)
+    start = (page - 1) * page_size
+    stop = min(start + page_size, total_items)
+    with col2:
+        st.caption(f"Mostrando {min(start + 1, total_items)}–{stop} de {total_items} · {total_pages} página(s)")
+    return start, stop
+
 def show_image_analysis():
     st.header("🔍 Análisis de Imágenes")
     if st.session_state.patients_db:
-        patient_options = {f"{p['nombre']} {p['apellido']} - {p['identificacion']}": p['id'] 
-                         for p in st.session_state.patients_db}
-        selected_patient_key = st.selectbox("👤 Seleccionar Paciente:", 
-                                          ["Seleccione un paciente..."] + list(patient_options.keys()))
-        if selected_patient_key != "Seleccione un paciente...":
-            patient_id = patient_options[selected_patient_key]
+        patient_id = pick_patient("analysis", "👤 Seleccionar Paciente:", PatientManager.recent_patient_ids(
+            PATIENT_CHOICES, st.session_state.current_patient), none_label="Seleccione un paciente...")
+        if patient_id is not None:
             patient = PatientManager.get_patient(patient_id)
             st.success(f"📋 Paciente seleccionado: {patient['nombre']} {patient['apellido']}")
             analysis_type = st.radio("Tipo de Análisis:", 
@@ -671,90 +1334,135 @@ def show_individual_analysis(patient):
     st.subheader("🔍 Análisis Individual de Imagen")
     uploaded_file = st.file_uploader("📷 Cargar imagen de colposcopía", 
                                    type=['png', 'jpg', 'jpeg', 'tiff'])
+    view = f"individual_{patient['id']}"
     if uploaded_file is not None:
-        image = Image.open(uploaded_file)
         col1, col2 = st.columns([1, 1])
         with col1:
-            st.image(image, caption="Imagen Original", use_column_width=True)
+            EnhancedImageAnalyzer.show_preview(uploaded_file, "Imagen Original")
             st.subheader("⚙️ Opciones de Procesamiento")
             enhance_contrast = st.checkbox("Mejorar Contraste", value=True)
             reduce_noise = st.checkbox("Reducir Ruido", value=True)
             edge_detection = st.checkbox("Detección de Bordes", value=False)
+            stages = [name for name, enabled in (('contrast', enhance_contrast),
+                                                 ('denoise', reduce_noise),
+                                                 ('edges', edge_detection)) if enabled]
+            if stages:
+                processed = EnhancedImageAnalyzer.preprocess_image(uploaded_file, stages)
+                st.image(processed, caption="Imagen Procesada", use_column_width=True)
         with col2:
-            if st.button("🚀 Realizar Análisis", type="primary", use_container_width=True):
-                with st.spinner("Analizando imagen... Por favor espere"):
-                    import time
-                    time.sleep(2)
-                    results = EnhancedImageAnalyzer.analyze_image(image, "individual")
-                    analysis_record = {
-                        'patient_id': patient['id'],
+            if (st.button("🚀 Realizar Análisis", type="primary", use_container_width=True)
+                    and EnhancedImageAnalyzer.passes_quality_gate(uploaded_file)):
+                analysis_stages = [name for name in stages if name in preprocessing.ANALYSIS_STAGES]
+                if analysis_stages:
+                    image = EnhancedImageAnalyzer.get_pipeline(uploaded_file).analysis_input(stages)
+                else:
+                    image = EnhancedImageAnalyzer.open_upload(uploaded_file)
+                task = EnhancedImageAnalyzer.analysis_task(
+                    image, "individual",
+                    image_digest=EnhancedImageAnalyzer.get_upload_digest(uploaded_file),
+                    preprocessing=analysis_stages)
+                image_name = uploaded_file.name
+                image_data = uploaded_file.getvalue()
+                print_store = ReportGenerator.get_print_store()
+                patient_id = patient['id']
+                
+                def run(report):
+                    start = time.perf_counter()
+                    report(0.1, "Analizando imagen...")
+                    results = task()
+                    print_store.add(image_data, results['image_digest'])
+                    record = {
+                        'patient_id': patient_id,
                         'results': results,
-                        'image_name': uploaded_file.name,
-                        'analysis_date': datetime.now()
+                        'image_name': image_name,
+                        'analysis_date': datetime.now(),
+                        'processing_time': time.perf_counter() - start
                     }
-                    st.session_state.analysis_results.append(analysis_record)
-                    Logger.log_analysis(patient['id'], "individual", results['confidence'])
-                    show_analysis_results(results)
-                    if st.button("📄 Generar Reporte PDF"):
-                        pdf_buffer = ReportGenerator.create_pdf_report(patient, results)
-                        st.download_button(
-                            label="⬇️ Descargar Reporte",
-                            data=pdf_buffer,
-                            file_name=f"Reporte_{patient['apellido']}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
-                            mime="application/pdf"
-                        )
+                    return {'record': record, 'confidence': results['confidence']}
+                JobManager.submit("individual", f"Análisis: {image_name}", run, patient_id, view)
+    JobManager.show_view(view, lambda job: show_individual_result(patient, job))
+
+def show_individual_result(patient, job):
+    results = job['result']['record']['results']
+    show_analysis_results(results)
+    reports = st.session_state.setdefault('job_reports', {})
+    if st.button("📄 Generar Reporte PDF", key=f"pdf_{job['id']}"):
+        reports[job['id']] = ReportGenerator.create_pdf_report(patient, results)
+    if job['id'] in reports:
+        st.download_button(
+            label="⬇️ Descargar Reporte",
+            data=reports[job['id']],
+            file_name=f"Reporte_{patient['apellido']}_{results['timestamp'].strftime('%Y%m%d_%H%M')}.pdf",
+            mime="application/pdf"
+        )
 
 def show_batch_analysis(patient):
     st.subheader("📊 Análisis por Lotes")
     uploaded_files = st.file_uploader("📷 Cargar múltiples imágenes", 
                                     type=['png', 'jpg', 'jpeg', 'tiff'],
                                     accept_multiple_files=True)
+    view = f"batch_{patient['id']}"
     if uploaded_files:
         st.info(f"✅ {len(uploaded_files)} imágenes cargadas")
         if st.button("🚀 Procesar Lote", type="primary"):
-            progress_bar = st.progress(0)
-            results_container = st.container()
-            batch_results = []
-            for i, uploaded_file in enumerate(uploaded_files):
-                progress = (i + 1) / len(uploaded_files)
-                progress_bar.progress(progress)
-                image = Image.open(uploaded_file)
-                results = EnhancedImageAnalyzer.analyze_image(image, "batch")
-                batch_results.append({
-                    'filename': uploaded_file.name,
-                    'results': results
-                })
-                with results_container:
-                    st.write(f"✅ Procesada: {uploaded_file.name}")
-            st.success("🎉 Análisis por lotes completado!")
-            show_batch_summary(batch_results)
-            batch_record = {
-                'patient_id': patient['id'],
-                'batch_results': batch_results,
-                'batch_date': datetime.now(),
-                'total_images': len(uploaded_files)
-            }
-            st.session_state.analysis_results.append(batch_record)
-            Logger.log_analysis(patient['id'], "batch", np.mean([r['results']['confidence'] for r in batch_results]))
+            encoded_images = [uploaded_file.getvalue() for uploaded_file in uploaded_files]
+            verdicts = EnhancedImageAnalyzer.validate_uploads(encoded_images)
+            for uploaded_file, (accepted, message) in zip(uploaded_files, verdicts):
+                if not accepted:
+                    st.warning(f"⚠️ Omitida: {uploaded_file.name} ({message})")
+            names = [f.name for f, (accepted, _) in zip(uploaded_files, verdicts) if accepted]
+            encoded_images = [data for data, (accepted, _) in zip(encoded_images, verdicts) if accepted]
+            if not names:
+                st.error("❌ Ninguna imagen superó el control de calidad")
+            else:
+                task = EnhancedImageAnalyzer.batch_task(encoded_images, "batch")
+                patient_id = patient['id']
+                
+                def run(report):
+                    start = time.perf_counter()
+                    batch_results = [None] * len(names)
+                    completed = 0
+                    for position, results in task():
+                        batch_results[position] = {
+                            'filename': names[position],
+                            'results': results
+                        }
+                        completed += 1
+                        report(completed / len(names), f"Procesada: {names[position]}")
+                    record = {
+                        'patient_id': patient_id,
+                        'batch_results': batch_results,
+                        'batch_date': datetime.now(),
+                        'total_images': len(names),
+                        'processing_time': time.perf_counter() - start
+                    }
+                    confidence = np.mean([r['results']['confidence'] for r in batch_results])
+                    return {'record': record, 'confidence': confidence}
+                JobManager.submit("batch", f"Lote de {len(names)} imágenes", run, patient_id, view)
+    JobManager.show_view(view, show_batch_result)
+
+def show_batch_result(job):
+    st.success("🎉 Análisis por lotes completado!")
+    show_batch_summary(job['result']['record']['batch_results'])
 
 def show_technique_comparison(patient):
     st.subheader("⚖️ Comparación de Técnicas")
     uploaded_file = st.file_uploader("📷 Cargar imagen para comparar técnicas", 
                                    type=['png', 'jpg', 'jpeg', 'tiff'])
+    view = f"comparison_{patient['id']}"
     if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Imagen para Comparación", use_column_width=True)
-        if st.button("🔬 Comparar Técnicas", type="primary"):
-            with st.spinner("Comparando diferentes técnicas de análisis..."):
-                import time
-                time.sleep(3)
-                techniques = ['CNN Básico', 'ResNet-50', 'EfficientNet', 'Vision Transformer']
-                comparison_results = {}
-                for technique in techniques:
-                    results = EnhancedImageAnalyzer.analyze_image(image, f"comparison_{technique}")
-                    comparison_results[technique] = results
-                show_technique_comparison_results(comparison_results)
-                Logger.log_analysis(patient['id'], "comparison", np.mean([r['confidence'] for r in comparison_results.values()]))
+        EnhancedImageAnalyzer.show_preview(uploaded_file, "Imagen para Comparación")
+        if (st.button("🔬 Comparar Técnicas", type="primary")
+                and EnhancedImageAnalyzer.passes_quality_gate(uploaded_file)):
+            task = EnhancedImageAnalyzer.techniques_task(uploaded_file, list(imaging.TECHNIQUES))
+            
+            def run(report):
+                report(0.1, "Comparando diferentes técnicas de análisis...")
+                comparison_results = task()
+                confidence = np.mean([r['confidence'] for r in comparison_results.values()])
+                return {'comparison_results': comparison_results, 'confidence': confidence}
+            JobManager.submit("comparison", f"Comparación: {uploaded_file.name}", run, patient['id'], view)
+    JobManager.show_view(view, lambda job: show_technique_comparison_results(job['result']['comparison_results']))
 
 def show_analysis_results(results):
     st.subheader("🎯 Resultados del Análisis")
@@ -789,47 +1497,33 @@ def show_analysis_results(results):
             'Timestamp': results['timestamp'].isoformat(),
             'Analysis Type': results['analysis_type'],
             'Confidence Score': results['confidence'],
-            'Image Quality Score': results['image_quality']
+            'Image Quality Score': results['image_quality'],
+            'Features': results.get('features', {})
         })
 
 def show_batch_summary(batch_results):
     st.subheader("📈 Resumen del Análisis por Lotes")
-    total_images = len(batch_results)
-    avg_confidence = np.mean([r['results']['confidence'] for r in batch_results])
-    avg_quality = np.mean([r['results']['image_quality'] for r in batch_results])
+    probabilities, confidence, quality = columnar.result_arrays([r['results'] for r in batch_results])
+    top = probabilities.argmax(axis=1)
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("📊 Total Imágenes", total_images)
+        st.metric("📊 Total Imágenes", len(batch_results))
     with col2:
-        st.metric("🎯 Confianza Promedio", f"{avg_confidence*100:.1f}%")
+        st.metric("🎯 Confianza Promedio", f"{confidence.mean()*100:.1f}%")
     with col3:
-        st.metric("📸 Calidad Promedio", f"{avg_quality*100:.1f}%")
-    all_predictions = {}
-    for result in batch_results:
-        for diag, prob in result['results']['predictions'].items():
-            if diag not in all_predictions:
-                all_predictions[diag] = []
-            all_predictions[diag].append(prob)
-    diagnoses = list(all_predictions.keys())
-    avg_probs = [np.mean(all_predictions[diag])*100 for diag in diagnoses]
-    fig = px.bar(x=diagnoses, y=avg_probs,
+        st.metric("📸 Calidad Promedio", f"{quality.mean()*100:.1f}%")
+    fig = px.bar(x=imaging.CLASSES, y=probabilities.mean(axis=0) * 100,
                 title="Distribución Promedio de Diagnósticos en el Lote",
                 labels={'x': 'Diagnóstico', 'y': 'Probabilidad Promedio (%)'})
     st.plotly_chart(fig, use_container_width=True)
     st.subheader("📋 Resultados Detallados")
-    results_data = []
-    for result in batch_results:
-        max_diag = max(result['results']['predictions'], 
-                      key=result['results']['predictions'].get)
-        max_prob = result['results']['predictions'][max_diag]
-        results_data.append({
-            'Archivo': result['filename'],
-            'Diagnóstico Principal': max_diag,
-            'Probabilidad': f"{max_prob*100:.1f}%",
-            'Confianza': f"{result['results']['confidence']*100:.1f}%",
-            'Calidad': f"{result['results']['image_quality']*100:.1f}%"
-        })
-    df = pd.DataFrame(results_data)
+    df = pd.DataFrame({
+        'Archivo': [result['filename'] for result in batch_results],
+        'Diagnóstico Principal': np.array(imaging.CLASSES)[top],
+        'Probabilidad': [f"{p*100:.1f}%" for p in probabilities[np.arange(len(top)), top]],
+        'Confianza': [f"{c*100:.1f}%" for c in confidence],
+        'Calidad': [f"{q*100:.1f}%" for q in quality]
+    })
     st.dataframe(df, use_container_width=True)
 
 def show_technique_comparison_results(comparison_results):
@@ -843,7 +1537,8 @@ def show_technique_comparison_results(comparison_results):
             'Diagnóstico': max_diag,
             'Probabilidad': f"{max_prob*100:.1f}%",
             'Confianza': f"{results['confidence']*100:.1f}%",
-            'Tiempo (s)': np.random.uniform(1.5, 4.2)
+            'Latencia (ms)': round(results['latency'] * 1000, 1),
+            'Origen': "💾 Caché" if results['cached'] else "⚡ Calculado"
         })
     df = pd.DataFrame(comparison_data)
     st.dataframe(df, use_container_width=True)
@@ -865,29 +1560,34 @@ def show_reports():
     if not st.session_state.analysis_results:
         st.info("📝 No hay análisis realizados. Realice análisis en la sección correspondiente.")
         return
-    tab1, tab2, tab3 = st.tabs(["📋 Historial", "📄 Generar Reporte", "📈 Estadísticas"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 Historial", "📄 Generar Reporte", "📦 Exportación Masiva",
+                                      "📈 Estadísticas"])
     with tab1:
         st.subheader("Historial de Análisis")
         col1, col2 = st.columns(2)
         with col1:
-            date_filter = st.date_input("Filtrar por fecha")
+            date_filter = st.date_input("Filtrar por fecha", value=None)
         with col2:
-            patient_filter = st.selectbox("Filtrar por paciente", 
-                                        ["Todos"] + [f"{p['nombre']} {p['apellido']}" 
-                                                   for p in st.session_state.patients_db])
-        for i, analysis in enumerate(st.session_state.analysis_results):
+            patient_filter = select_analysis_patient("history", allow_all=True)
+        positions = AnalysisManager.find_analyses(patient_filter, date_filter)
+        if not positions:
+            st.info("No hay análisis que coincidan con los filtros.")
+        start, stop = show_pagination(len(positions), "history_page")
+        for i in positions[start:stop]:
+            analysis = st.session_state.analysis_results[i]
             patient = PatientManager.get_patient(analysis['patient_id'])
             if patient:
                 with st.expander(f"Análisis #{i+1} - {patient['nombre']} {patient['apellido']}", 
                                expanded=False):
                     col1, col2 = st.columns(2)
                     with col1:
-                        st.write(f"**Fecha:** {analysis.get('analysis_date', 'No disponible').strftime('%d/%m/%Y %H:%M') if analysis.get('analysis_date') else 'No disponible'}")
+                        analysis_date = analysis_datetime(analysis)
+                        st.write(f"**Fecha:** {analysis_date.strftime('%d/%m/%Y %H:%M') if analysis_date else 'No disponible'}")
                         st.write(f"**Paciente:** {patient['nombre']} {patient['apellido']}")
                         if 'image_name' in analysis:
                             st.write(f"**Imagen:** {analysis['image_name']}")
                     with col2:
-                        if st.button(f"📄 Ver Reporte", key=f"report_{i}"):
+                        if 'results' in analysis and st.button(f"📄 Ver Reporte", key=f"report_{i}"):
                             pdf_buffer = ReportGenerator.create_pdf_report(
                                 patient, analysis['results'])
                             st.download_button(
@@ -900,23 +1600,28 @@ def show_reports():
     with tab2:
         st.subheader("Generar Nuevo Reporte")
         if st.session_state.patients_db and st.session_state.analysis_results:
-            analysis_options = []
-            for i, analysis in enumerate(st.session_state.analysis_results):
-                patient = PatientManager.get_patient(analysis['patient_id'])
-                if patient:
-                    analysis_options.append(
-                        f"Análisis #{i+1} - {patient['nombre']} {patient['apellido']} - {analysis['analysis_date'].strftime('%d/%m/%Y')}"
-                    )
-            selected_analysis = st.selectbox("Seleccionar análisis:", analysis_options)
-            if selected_analysis:
-                analysis_idx = int(selected_analysis.split('#')[1].split(' ')[0]) - 1
+            patient_id = select_analysis_patient("report")
+            patient = PatientManager.get_patient(patient_id) if patient_id is not None else None
+            positions = report_positions(patient_id) if patient else []
+            if patient and not positions:
+                st.info("El paciente no tiene análisis individuales con resultados.")
+            analysis_idx = None
+            if positions:
+                start, stop = show_pagination(len(positions), "report_page")
+                labels = {i: format_analysis_option(i) for i in positions[start:stop]}
+                analysis_idx = st.selectbox("Seleccionar análisis:", list(labels), format_func=labels.get)
+            if analysis_idx is not None:
                 analysis = st.session_state.analysis_results[analysis_idx]
-                patient = PatientManager.get_patient(analysis['patient_id'])
                 include_images = st.checkbox("Incluir imágenes", value=True)
                 include_recommendations = st.checkbox("Incluir recomendaciones", value=True)
                 include_technical_info = st.checkbox("Incluir información técnica", value=False)
                 if st.button("📄 Generar Reporte Personalizado"):
-                    pdf_buffer = ReportGenerator.create_pdf_report(patient, analysis['results'])
+                    options = {
+                        'images': include_images,
+                        'recommendations': include_recommendations,
+                        'technical_info': include_technical_info
+                    }
+                    pdf_buffer = ReportGenerator.create_pdf_report(patient, analysis['results'], options=options)
                     st.download_button(
                         label="⬇️ Descargar Reporte",
                         data=pdf_buffer,
@@ -924,39 +1629,144 @@ def show_reports():
                         mime="application/pdf"
                     )
     with tab3:
+        show_bulk_export()
+    with tab4:
         st.subheader("Estadísticas Generales")
         show_statistics()
 
+def show_bulk_export():
+    st.subheader("Exportación Masiva de Reportes")
+    col1, col2 = st.columns(2)
+    with col1:
+        date_range = st.date_input("Rango de fechas", value=(), key="export_dates")
+    with col2:
+        patient_filter = select_analysis_patient("export", allow_all=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        export_format = st.radio("Formato", ['zip', 'pdf'], key="export_format",
+                                 format_func=lambda f: "📁 ZIP (un PDF por análisis)" if f == 'zip'
+                                 else "📄 PDF combinado con marcadores",
+                                 help="El PDF combinado se arma en memoria y admite un número limitado "
+                                      "de reportes con imagen; para exportaciones grandes use el ZIP.")
+    with col2:
+        include_images = st.checkbox("Incluir imágenes", value=True, key="export_images")
+        include_recommendations = st.checkbox("Incluir recomendaciones", value=True, key="export_recs")
+        include_technical_info = st.checkbox("Incluir información técnica", value=False, key="export_tech")
+    positions = AnalysisManager.find_analyses(patient_filter)
+    if len(date_range) == 2:
+        start_day, end_day = date_range
+        positions = [i for i in positions
+                     if (analysis_date := analysis_datetime(st.session_state.analysis_results[i]))
+                     and start_day <= analysis_date.date() <= end_day]
+    st.caption(f"{len(positions)} análisis seleccionados")
+    if st.button("📦 Exportar Reportes", type="primary", disabled=not positions):
+        options = {
+            'images': include_images,
+            'recommendations': include_recommendations,
+            'technical_info': include_technical_info
+        }
+        items = ReportGenerator.export_items(positions, options)
+        if not items:
+            st.warning("⚠️ Ningún análisis seleccionado tiene resultados exportables")
+        else:
+            try:
+                if export_format == 'pdf':
+                    export.check_merged_pdf(items)
+                ReportGenerator.submit_export(items, export_format)
+            except ValueError as e:
+                st.warning(f"⚠️ {e}")
+    JobManager.show_view("bulk_export", show_export_result)
+
+def show_export_result(job):
+    result = job['result']
+    if not os.path.exists(result['path']):
+        st.info("El archivo exportado ya se descargó o expiró; vuelva a exportar para obtenerlo otra vez.")
+        return
+    st.success(f"✅ {result['count']} reportes exportados")
+    with open(result['path'], 'rb') as f:
+        st.download_button(
+            label="⬇️ Descargar Exportación",
+            data=f,
+            file_name=f"Reportes_ColpoVision_{job['finished_at'].strftime('%Y%m%d_%H%M')}.{result['format']}",
+            mime="application/zip" if result['format'] == 'zip' else "application/pdf",
+            on_click=ReportGenerator.discard_export,
+            args=(result['path'],)
+        )
+
 def show_statistics():
     if not st.session_state.analysis_results:
         st.info("No hay datos suficientes para mostrar estadísticas.")
         return
+    store = AnalysisManager.get_columns()
     total_analyses = len(st.session_state.analysis_results)
-    total_patients = len(set(a['patient_id'] for a in st.session_state.analysis_results))
+    patient_summary = store.patient_summary()
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.metric("🔍 Total Análisis", total_analyses)
     with col2:
-        st.metric("👥 Pacientes Únicos", total_patients)
+        st.metric("👥 Pacientes Únicos", len(patient_summary))
     with col3:
         avg_analyses = total_analyses / len(st.session_state.patients_db) if st.session_state.patients_db else 0
         st.metric("📊 Promedio por Paciente", f"{avg_analyses:.1f}")
     with col4:
-        if st.session_state.analysis_results:
-            last_analysis = max(st.session_state.analysis_results, 
-                              key=lambda x: x['analysis_date'])
-            days_since = (datetime.now() - last_analysis['analysis_date']).days
+        last_analysis = store.timestamp.max()
+        if not np.isnat(last_analysis):
+            days_since = (datetime.now() - pd.Timestamp(last_analysis).to_pydatetime()).days
             st.metric("📅 Último Análisis", f"Hace {days_since} días")
     st.subheader("📈 Tendencias")
-    dates = [datetime.now() - pd.Timedelta(days=30-i) for i in range(30)]
-    analyses_per_day = np.random.poisson(2, 30)
-    df_trend = pd.DataFrame({
-        'Fecha': dates,
-        'Análisis': analyses_per_day
-    })
-    fig = px.line(df_trend, x='Fecha', y='Análisis', 
-                 title="Análisis Realizados por Día (Últimos 30 días)")
-    st.plotly_chart(fig, use_container_width=True)
+    first_analysis = store.timestamp.min()
+    first_day = pd.Timestamp(first_analysis).date() if not np.isnat(first_analysis) else date.today()
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        date_range = st.date_input("Período del gráfico",
+                                   value=(max(first_day, date.today() - timedelta(days=29)), date.today()),
+                                   min_value=first_day, max_value=date.today(), key="trend_dates")
+    with col2:
+        freq = st.radio("Agrupar por", list(TREND_FREQUENCIES), horizontal=True,
+                        format_func=TREND_FREQUENCIES.get)
+    with col3:
+        by_class = st.toggle("Por diagnóstico", value=False)
+    if len(date_range) == 2:
+        start, end = date_range
+        trend = get_trend(store.version, freq, start, end, store)
+        period = TREND_FREQUENCIES[freq].lower()
+        if by_class:
+            df_trend = trend[imaging.CLASSES].rename_axis('Fecha').reset_index()
+            fig = px.bar(df_trend, x='Fecha', y=imaging.CLASSES,
+                         title=f"Resultados por Diagnóstico Principal (por {period})",
+                         labels={'value': 'Resultados', 'variable': 'Diagnóstico'})
+        else:
+            df_trend = trend[['Análisis']].rename_axis('Fecha').reset_index()
+            fig = px.line(df_trend, x='Fecha', y='Análisis',
+                          title=f"Análisis Realizados por {period.capitalize()}")
+        st.plotly_chart(fig, use_container_width=True)
+        if trend.attrs.get('downsampled'):
+            st.caption(f"Serie reducida a {len(trend)} puntos: cada punto suma varios períodos consecutivos.")
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = px.bar(x=imaging.CLASSES, y=store.class_distribution(),
+                     title="Resultados por Diagnóstico Principal",
+                     labels={'x': 'Diagnóstico', 'y': 'Resultados'})
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        fig = px.bar(x=imaging.CLASSES, y=store.probabilities.mean(axis=0) * 100,
+                     title="Probabilidad Promedio por Diagnóstico",
+                     labels={'x': 'Diagnóstico', 'y': 'Probabilidad Promedio (%)'})
+        st.plotly_chart(fig, use_container_width=True)
+    st.subheader("👥 Resumen por Paciente")
+    top_patients = patient_summary.nlargest(Config.get_config_value('ui.page_size', 20), 'analyses')
+    names = []
+    for patient_id in top_patients.index:
+        patient = PatientManager.get_patient(int(patient_id))
+        names.append(f"{patient['nombre']} {patient['apellido']}" if patient else f"#{patient_id}")
+    st.dataframe(pd.DataFrame({
+        'Paciente': names,
+        'Análisis': top_patients['analyses'].values,
+        'Imágenes': top_patients['results'].values,
+        'Confianza Media': [f"{c*100:.1f}%" for c in top_patients['confidence']],
+        'Diagnóstico Frecuente': top_patients['top_class'].values,
+        'Último Análisis': pd.to_datetime(top_patients['last'].values).strftime('%d/%m/%Y')
+    }), use_container_width=True)
 
 def show_email_sender():
     st.header("📧 Envío de Resultados")
@@ -973,22 +1783,33 @@ def show_email_sender():
             sender_password = st.text_input("Contraseña", type="password")
             use_tls = st.checkbox("Usar TLS", value=True)
     st.subheader("📋 Seleccionar Análisis")
-    analysis_options = []
-    for i, analysis in enumerate(st.session_state.analysis_results):
-        patient = PatientManager.get_patient(analysis['patient_id'])
-        if patient:
-            analysis_options.append({
-                'label': f"Análisis #{i+1} - {patient['nombre']} {patient['apellido']} - {analysis['analysis_date'].strftime('%d/%m/%Y')}",
-                'index': i,
-                'patient': patient,
-                'analysis': analysis
-            })
-    selected_analyses = st.multiselect(
-        "Seleccionar análisis para enviar:",
-        options=analysis_options,
-        format_func=lambda x: x['label']
-    )
+    # Posiciones elegidas; la selección se conserva al cambiar de paciente o de página
+    selection = st.session_state.setdefault('email_selection', set())
+    patient_id = select_analysis_patient("email")
+    if patient_id is not None:
+        positions = report_positions(patient_id)
+        start, stop = show_pagination(len(positions), "email_page")
+        for i in positions[start:stop]:
+            if st.checkbox(format_analysis_option(i), value=i in selection, key=f"email_pick_{i}"):
+                selection.add(i)
+            else:
+                selection.discard(i)
+    selected_analyses = []
+    for i in sorted(selection):
+        analysis = st.session_state.analysis_results[i] if i < len(st.session_state.analysis_results) else None
+        patient = PatientManager.get_patient(analysis['patient_id']) if analysis else None
+        if patient and 'results' in analysis:
+            selected_analyses.append({'patient': patient, 'analysis': analysis})
     if selected_analyses:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.caption(f"{len(selected_analyses)} análisis seleccionados")
+        with col2:
+            if st.button("🧹 Quitar Selección"):
+                for i in selection:
+                    st.session_state.pop(f"email_pick_{i}", None)
+                selection.clear()
+                st.rerun()
         st.subheader("📧 Configurar Envío")
         recipients = []
         for selected in selected_analyses:
@@ -1019,57 +1840,75 @@ Saludos cordiales,
 Equipo Médico"""
         )
         if st.button("📧 Enviar Reportes", type="primary"):
-            if sender_email and sender_password and recipients:
-                success_count = 0
-                error_count = 0
-                progress_bar = st.progress(0)
-                status_container = st.container()
+            if sender_email and recipients:
                 smtp_config = {
                     'smtp_server': smtp_server,
                     'port': smtp_port,
                     'email': sender_email,
-                    'password': sender_password
+                    'password': sender_password,
+                    'use_tls': use_tls
                 }
-                for i, selected in enumerate(selected_analyses):
-                    progress = (i + 1) / len(selected_analyses)
-                    progress_bar.progress(progress)
+                deliveries = []
+                for selected in selected_analyses:
                     patient = selected['patient']
-                    analysis = selected['analysis']
-                    pdf_buffer = ReportGenerator.create_pdf_report(patient, analysis['results'])
                     patient_recipients = [patient.get('email')] if patient.get('email') and send_to_patient else []
                     if additional_emails:
                         patient_recipients.extend(additional_list)
-                    for recipient in patient_recipients:
-                        try:
-                            success, message = EmailSender.send_report_email(
-                                recipient, 
-                                f"{patient['nombre']} {patient['apellido']}", 
-                                pdf_buffer, 
-                                smtp_config
-                            )
-                            if success:
-                                success_count += 1
-                                with status_container:
-                                    st.success(f"✅ Enviado a {recipient}")
-                            else:
-                                error_count += 1
-                                with status_container:
-                                    st.error(f"❌ Error enviando a {recipient}: {message}")
-                        except Exception as e:
-                            error_count += 1
-                            with status_container:
-                                st.error(f"❌ Error enviando a {recipient}: {str(e)}")
-                            Logger.log_error(str(e), f"Envío de email a {recipient}")
-                st.success(f"🎉 Proceso completado: {success_count} enviados exitosamente, {error_count} errores")
+                    if patient_recipients:
+                        deliveries.append((patient, selected['analysis']['results'], patient_recipients))
+                try:
+                    queued = EmailSender.queue_reports(deliveries, smtp_config, email_subject, email_body)
+                    st.success(f"📬 {queued} mensajes en cola; el envío continúa en segundo plano")
+                except Exception as e:
+                    st.error(f"❌ Error al encolar los reportes: {str(e)}")
+                    Logger.log_error(str(e), "Encolado de emails")
             else:
                 st.error("⚠️ Por favor complete la configuración SMTP y verifique que hay destinatarios válidos")
     st.subheader("📝 Historial de Envíos")
-    if st.session_state.email_history:
-        df_history = pd.DataFrame(st.session_state.email_history)
+    dispatcher = EmailSender.get_dispatcher()
+    counts = dispatcher.outbox.counts()
+    if counts.get(outbox.PENDING) or counts.get(outbox.SENDING):
+        poll_outbox()
+    else:
+        show_outbox_status()
+    col1, col2 = st.columns(2)
+    with col1:
+        if counts.get(outbox.FAILED) and st.button("🔁 Reintentar Fallidos"):
+            st.success(f"✅ {dispatcher.outbox.retry_failed()} mensajes devueltos a la cola")
+            dispatcher.wake()
+    with col2:
+        if (counts.get(outbox.SENT) or counts.get(outbox.FAILED)) and st.button("🧹 Limpiar Historial"):
+            dispatcher.outbox.clear_finished()
+            st.rerun()
+
+def show_outbox_status():
+    """Estado de la cola de correo, métricas del despachador e historial"""
+    dispatcher = EmailSender.get_dispatcher()
+    counts = dispatcher.outbox.counts()
+    metrics = dispatcher.metrics.snapshot()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("En Cola", counts.get(outbox.PENDING, 0) + counts.get(outbox.SENDING, 0))
+    col2.metric("Enviados", counts.get(outbox.SENT, 0))
+    col3.metric("Envíos por Minuto", f"{metrics['throughput']:.0f}")
+    col4.metric("Latencia p95", f"{metrics['latency_p95'] * 1000:.0f} ms")
+    st.caption(f"Fallidos: {counts.get(outbox.FAILED, 0)} · Reintentos: {metrics['retries']} · "
+               f"Latencia media: {metrics['latency_avg'] * 1000:.0f} ms")
+    waiting = [account for account in dispatcher.outbox.pending_accounts()
+               if not dispatcher.is_registered(account)]
+    if waiting:
+        st.warning("⚠️ Hay mensajes en cola de cuentas sin credenciales en esta ejecución; "
+                   "se enviarán al volver a enviar con la misma configuración SMTP.")
+    df_history = EmailSender.history_frame()
+    if not df_history.empty:
         st.dataframe(df_history, use_container_width=True)
     else:
         st.info("No hay historial de envíos disponible.")
 
+@st.fragment(run_every=2.0)
+def poll_outbox():
+    """Actualizar el estado de la cola mientras queden mensajes por enviar"""
+    show_outbox_status()
+
 def show_configuration():
     st.header("⚙️ Configuración del Sistema")
     tab1, tab2, tab3, tab4 = st.tabs(["🎨 Apariencia", "🤖 Modelo IA", "📧 Email", "💾 Datos"])
@@ -1079,11 +1918,13 @@ def show_configuration():
         theme = st.selectbox("Tema", ["light", "dark"], index=0 if config['ui']['theme'] == 'light' else 1)
         primary_color = st.color_picker("Color Primario", config['ui']['primary_color'])
         secondary_color = st.color_picker("Color Secundario", config['ui']['secondary_color'])
+        page_size = st.number_input("Elementos por página", 5, 200, config['ui'].get('page_size', 20))
         if st.button("💾 Guardar Cambios de Apariencia"):
             config['ui'].update({
                 'theme': theme,
                 'primary_color': primary_color,
-                'secondary_color': secondary_color
+                'secondary_color': secondary_color,
+                'page_size': page_size
             })
             Config.save_config(config)
             st.success("✅ Configuración de apariencia guardada")
@@ -1092,14 +1933,40 @@ def show_configuration():
         confidence_threshold = st.slider("Umbral de Confianza", 0.5, 1.0, config['model']['confidence_threshold'])
         batch_size = st.number_input("Tamaño del Lote", 1, 32, config['model']['batch_size'])
         max_image_size = st.number_input("Tamaño Máximo de Imagen", 128, 1024, config['model']['max_image_size'])
+        workers = st.number_input("Procesos de Análisis en Paralelo", 1, os.cpu_count() or 1,
+                                  min(config['model'].get('workers', 1), os.cpu_count() or 1))
+        backend_names = list(backends.BACKEND_LABELS)
+        backend = st.selectbox("Motor de Inferencia", backend_names,
+                               index=backend_names.index(config['model'].get('backend', backends.FEATURES_BACKEND)),
+                               format_func=backends.BACKEND_LABELS.get)
+        weights_path = st.text_input("Directorio de Pesos (weights.npy, bias.npy)",
+                                     config['model'].get('weights_path', ''),
+                                     help="Vacío para usar los pesos incorporados")
         if st.button("💾 Guardar Configuración del Modelo"):
-            config['model'].update({
-                'confidence_threshold': confidence_threshold,
-                'batch_size': batch_size,
-                'max_image_size': max_image_size
-            })
-            Config.save_config(config)
-            st.success("✅ Configuración del modelo guardada")
+            if backend == backends.FEATURES_BACKEND and weights_path and not os.path.isdir(weights_path):
+                st.error(f"❌ No existe el directorio de pesos: {weights_path}")
+            else:
+                config['model'].update({
+                    'confidence_threshold': confidence_threshold,
+                    'batch_size': batch_size,
+                    'max_image_size': max_image_size,
+                    'workers': workers,
+                    'backend': backend,
+                    'weights_path': weights_path
+                })
+                Config.save_config(config)
+                st.success("✅ Configuración del modelo guardada")
+        st.subheader("Caché de Resultados")
+        cache_stats = ImageAnalyzer.get_cache().stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Aciertos (memoria)", cache_stats['hits'])
+        col2.metric("Aciertos (disco)", cache_stats['disk_hits'])
+        col3.metric("Fallos", cache_stats['misses'])
+        col4.metric("Tasa de Aciertos", f"{cache_stats['hit_rate']*100:.1f}%")
+        st.caption(f"{cache_stats['entries']} resultados en memoria ({cache_stats['memory_bytes'] / 1024:.0f} KB)")
+        if st.button("🗑️ Vaciar Caché"):
+            ImageAnalyzer.get_cache().clear()
+            st.success("✅ Caché vaciada")
     with tab3:
         st.subheader("Configuración de Email")
         smtp_server = st.text_input("Servidor SMTP", config['email']['smtp_server'])
@@ -1115,21 +1982,60 @@ def show_configuration():
             st.success("✅ Configuración de email guardada")
     with tab4:
         st.subheader("Gestión de Datos")
+        if st.button("💾 Guardar Ahora"):
+            if DataPersistence.save_data(wait=True):
+                st.success("✅ Todos los cambios están guardados")
+            else:
+                st.error(f"❌ No se pudieron guardar los cambios: {DataPersistence.get_writer().last_error or 'tiempo agotado'}")
         if st.button("🗑️ Eliminar Todos los Datos"):
-            st.session_state.patients_db = []
-            st.session_state.analysis_results = []
-            DataPersistence.save_data()
+            DataPersistence.clear_data()
             st.success("✅ Todos los datos han sido eliminados")
+        show_startup_timings()
+
+@st.cache_resource
+def get_startup_timings():
+    """Tiempos del primer arranque del proceso, compartidos por todas las sesiones"""
+    return {}
+
+def record_run_time():
+    """Medir la ejecución actual; la primera del proceso queda registrada como arranque"""
+    finished = time.perf_counter()
+    st.session_state.last_run_seconds = finished - SCRIPT_STARTED
+    timings = get_startup_timings()
+    if 'first_run' not in timings:
+        timings['imports'] = IMPORTS_FINISHED - SCRIPT_STARTED
+        timings['first_run'] = finished - SCRIPT_STARTED
+        timings['recorded_at'] = datetime.now()
+        Logger.log_startup(timings)
+
+def show_startup_timings():
+    st.subheader("⏱️ Tiempo de Arranque")
+    timings = get_startup_timings()
+    if 'first_run' not in timings:
+        st.info("El arranque se mide al terminar la primera ejecución.")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Importaciones", f"{timings['imports']:.2f} s")
+    col2.metric("Primera Ejecución", f"{timings['first_run']:.2f} s")
+    col3.metric("Ejecución Anterior", f"{st.session_state.get('last_run_seconds', 0):.2f} s")
+    if timings['first_run'] > STARTUP_BUDGET_SECONDS:
+        st.warning(f"⚠️ La primera ejecución superó el presupuesto de {STARTUP_BUDGET_SECONDS:.1f} s")
+    st.caption(f"Medido el {timings['recorded_at'].strftime('%d/%m/%Y %H:%M:%S')}. Las bibliotecas "
+               "de gráficos, reportes, correo y visión se cargan al abrir la página que las usa.")
 
 def enhanced_main():
     Logger.setup_logging()
-    if 'data_loaded' not in st.session_state:
-        DataPersistence.load_data()
-        st.session_state.data_loaded = True
-    DataPersistence.auto_save()
-    config = Config.load_config()
-    main()
-    DataPersistence.save_data()
+    try:
+        if 'data_loaded' not in st.session_state:
+            DataPersistence.load_data()
+            st.session_state.data_loaded = True
+        config = Config.load_config()
+        JobManager.collect_finished()
+        main()
+    finally:
+        # También cuando la ejecución termina con st.rerun() o st.stop(): si no, una
+        # ejecución posterior quedaría registrada como el arranque
+        record_run_time()
 
 if __name__ == "__main__":
     enhanced_main()
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Componentes de ColpoVision independientes de la interfaz Streamlit."""
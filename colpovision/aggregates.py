@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Agregados del panel principal, mantenidos de forma incremental.
+
+Cada paciente o análisis agregado actualiza unos pocos contadores, así que el panel se
+dibuja sin recorrer los registros. Los lotes aportan un diagnóstico por imagen. El
+tiempo de procesamiento solo existe en los análisis que lo registran ('processing_time').
+"""
+from collections import Counter
+
+from colpovision.analysis_index import analysis_datetime
+
+
+def record_results(record):
+    """Resultados de un análisis individual o de cada imagen de un lote"""
+    if 'results' in record:
+        return [record['results']]
+    return [item['results'] for item in record.get('batch_results', ()) if item]
+
+
+def top_class(results):
+    predictions = results.get('predictions')
+    return max(predictions, key=predictions.get) if predictions else None
+
+
+class DashboardAggregates:
+    """Contadores de pacientes, análisis por mes, diagnósticos, confianza y tiempos"""
+
+    def __init__(self, patients=(), analyses=()):
+        self.rebuild(patients, analyses)
+
+    def rebuild(self, patients, analyses):
+        """Recalcular todo a partir de los registros completos (al cargar los datos)"""
+        self.patients = 0
+        self.analyses = 0
+        self.images = 0
+        self.by_class = Counter()
+        self.by_month = Counter()
+        self._confidence_sum = 0.0
+        self._time_sum = 0.0
+        self._timed = 0
+        for _ in patients:
+            self.add_patient()
+        for record in analyses:
+            self.add_analysis(record)
+
+    def add_patient(self):
+        self.patients += 1
+
+    def remove_patient(self):
+        self.patients = max(0, self.patients - 1)
+
+    def add_analysis(self, record):
+        """Sumar un análisis recién agregado"""
+        self.analyses += 1
+        when = analysis_datetime(record)
+        if when is not None:
+            self.by_month[(when.year, when.month)] += 1
+        for results in record_results(record):
+            self.images += 1
+            self._confidence_sum += results.get('confidence', 0.0)
+            diagnosis = top_class(results)
+            if diagnosis is not None:
+                self.by_class[diagnosis] += 1
+        if record.get('processing_time') is not None:
+            self._time_sum += record['processing_time']
+            self._timed += 1
+
+    @property
+    def mean_confidence(self):
+        return self._confidence_sum / self.images if self.images else None
+
+    @property
+    def mean_processing_time(self):
+        """Segundos por análisis, entre los que registran su tiempo"""
+        return self._time_sum / self._timed if self._timed else None
+
+    def monthly_counts(self):
+        """[((año, mes), análisis), ...] en orden cronológico"""
+        return sorted(self.by_month.items())
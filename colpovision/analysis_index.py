@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Índices secundarios sobre los registros de análisis (por paciente y por fecha)."""
+from itertools import islice
+
+
+def analysis_datetime(record):
+    """Fecha de un análisis individual o de un lote"""
+    return record.get('analysis_date') or record.get('batch_date')
+
+
+class AnalysisIndex:
+    """Posiciones de `analysis_results` agrupadas por patient_id y por día"""
+
+    def __init__(self, analyses=()):
+        self._by_patient = {}
+        self._by_day = {}
+        self._count = 0
+        self.rebuild(analyses)
+
+    def rebuild(self, analyses):
+        self._by_patient = {}
+        self._by_day = {}
+        self._count = 0
+        for position, record in enumerate(analyses):
+            self.add(position, record)
+
+    def add(self, position, record):
+        """Indexar un análisis recién agregado en la posición dada"""
+        # Reinsertar la clave mantiene los pacientes ordenados por su último análisis
+        patient_id = record.get('patient_id')
+        postings = self._by_patient.pop(patient_id, [])
+        postings.append(position)
+        self._by_patient[patient_id] = postings
+        when = analysis_datetime(record)
+        if when is not None:
+            self._by_day.setdefault(when.date(), []).append(position)
+        self._count += 1
+
+    def has_patient(self, patient_id):
+        return patient_id in self._by_patient
+
+    def recent_patient_ids(self, limit):
+        """Hasta `limit` pacientes, del analizado más recientemente al más antiguo"""
+        return list(islice(reversed(self._by_patient), limit))
+
+    def count_for_patient(self, patient_id):
+        return len(self._by_patient.get(patient_id, ()))
+
+    def query(self, patient_id=None, day=None):
+        """Posiciones (en orden de inserción) que cumplen todos los filtros dados"""
+        postings = []
+        if patient_id is not None:
+            postings.append(self._by_patient.get(patient_id, []))
+        if day is not None:
+            postings.append(self._by_day.get(day, []))
+        if not postings:
+            return range(self._count)
+        postings.sort(key=len)
+        result = postings[0]
+        for other in postings[1:]:
+            members = set(other)
+            result = [position for position in result if position in members]
+        return result
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Motores de inferencia intercambiables, seguros entre hilos y procesos.
+
+Un motor recibe entradas ya preparadas (N, size, size, 3) y devuelve un análisis por
+imagen. No guarda estado mutable: los pesos son arreglos de solo lectura (mapeados en
+memoria si vienen de un .npy) y la aleatoriedad del motor simulado sale de un
+`np.random.Generator` propio de cada llamada, derivado del contenido de la imagen.
+"""
+import abc
+import hashlib
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from colpovision.lazy import LazyModule
+
+# Solo los métodos usan OpenCV: elegir el motor o leer sus constantes no lo importa
+imaging = LazyModule('colpovision.imaging')
+
+FEATURES_BACKEND = 'features'
+SIMULATED_BACKEND = 'simulated'
+BACKEND_LABELS = {
+    FEATURES_BACKEND: "Modelo de características",
+    SIMULATED_BACKEND: "Simulado (demostración)",
+}
+
+
+class InferenceBackend(abc.ABC):
+    """Base de los motores: un motor sin `analyze_stack` falla al crearse, no en su primera inferencia"""
+    name = None
+    version = None
+
+    @abc.abstractmethod
+    def analyze_stack(self, stack, temperature=1.0):
+        """Un análisis por imagen de un lote (N, size, size, 3)"""
+
+    def analyze_array(self, rgb, temperature=1.0):
+        return self.analyze_stack(rgb[np.newaxis], temperature)[0]
+
+    def warm_up(self, size):
+        """Una inferencia sobre una entrada vacía: reserva búferes e inicializa OpenCV"""
+        self.analyze_stack(np.zeros((1, size, size, 3), dtype=np.uint8))
+
+
+class FeatureBackend(InferenceBackend):
+    """Modelo lineal sobre las características de `imaging`
+
+    Con `weights_path` carga `<ruta>/weights.npy` y `<ruta>/bias.npy` mapeados en memoria
+    (solo lectura, compartidos por todas las sesiones y por los procesos hijos con fork).
+    """
+    name = FEATURES_BACKEND
+
+    def __init__(self, weights_path=None):
+        if weights_path:
+            self.weights = np.load(os.path.join(weights_path, 'weights.npy'), mmap_mode='r')
+            self.bias = np.load(os.path.join(weights_path, 'bias.npy'), mmap_mode='r')
+            if self.weights.shape != imaging.WEIGHTS.shape or self.bias.shape != imaging.BIAS.shape:
+                raise ValueError(f"Pesos con forma inesperada en {weights_path}: "
+                                 f"{self.weights.shape}, {self.bias.shape}")
+            digest = hashlib.blake2b(np.ascontiguousarray(self.weights).tobytes() +
+                                     np.ascontiguousarray(self.bias).tobytes(), digest_size=8)
+            self.version = f"{imaging.MODEL_VERSION}+{digest.hexdigest()}"
+        else:
+            self.weights = imaging.WEIGHTS
+            self.bias = imaging.BIAS
+            self.version = imaging.MODEL_VERSION
+
+    def analyze_stack(self, stack, temperature=1.0):
+        features = imaging.extract_features(stack)
+        probs, confidence, quality = imaging.score_features(features, temperature, self.weights, self.bias)
+        return [imaging.build_result(probs, confidence, quality, features, i) for i in range(len(stack))]
+
+
+class SimulatedBackend(InferenceBackend):
+    """Resultados aleatorios reproducibles por imagen, para demostraciones sin modelo"""
+    name = SIMULATED_BACKEND
+    version = 'simulated-1'
+    RANGES = {
+        'Normal': (0.1, 0.4),
+        'CIN I': (0.1, 0.3),
+        'CIN II': (0.1, 0.3),
+        'CIN III': (0.1, 0.3),
+        'Carcinoma': (0.05, 0.2),
+    }
+
+    @staticmethod
+    def generator_for(rgb):
+        """Generador propio de la imagen: la misma entrada siempre da el mismo resultado"""
+        seed = hashlib.blake2b(np.ascontiguousarray(rgb).data, digest_size=8).digest()
+        return np.random.default_rng(int.from_bytes(seed, 'little'))
+
+    def analyze_stack(self, stack, temperature=1.0):
+        results = []
+        for rgb in stack:
+            rng = self.generator_for(rgb)
+            scores = np.array([rng.uniform(low, high) for low, high in self.RANGES.values()])
+            scores = scores ** (1.0 / temperature)
+            scores /= scores.sum()
+            results.append({
+                'predictions': {name: float(p) for name, p in zip(self.RANGES, scores)},
+                'confidence': float(rng.uniform(0.75, 0.95)),
+                'image_quality': float(rng.uniform(0.8, 1.0)),
+                'features': {},
+            })
+        return results
+
+
+@lru_cache(maxsize=None)
+def get_backend(name=FEATURES_BACKEND, weights_path=None):
+    """Motor compartido por proceso (los pesos se cargan una sola vez)"""
+    if name == SIMULATED_BACKEND:
+        return SimulatedBackend()
+    if name == FEATURES_BACKEND:
+        return FeatureBackend(weights_path or None)
+    raise ValueError(f"Motor de inferencia desconocido: {name}")
+
+
+def warm_up_worker(name, weights_path, size):
+    """Inicializador de procesos del pool: cargar y calentar el motor antes del primer lote"""
+    get_backend(name, weights_path).warm_up(size)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Almacén columnar de resultados de análisis sobre arreglos NumPy.
+
+Cada fila es un resultado (un análisis individual o una imagen de un lote) con sus
+probabilidades por clase (float32), confianza, calidad, fecha (datetime64) y paciente.
+La columna `record` guarda la posición del análisis en `analysis_results`, así que las
+filas de un mismo lote son contiguas. Las columnas crecen por bloques (capacidad
+duplicada) y se guardan como archivos .npy que se pueden abrir con mmap. Cada copia
+guardada anota su origen (linaje y último `seq` del almacén de registros) para saber si
+todavía corresponde a los análisis cargados.
+"""
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from colpovision.aggregates import record_results
+from colpovision.analysis_index import analysis_datetime
+from colpovision.imaging import CLASSES
+
+COLUMNS = {
+    'probabilities': (np.float32, (len(CLASSES),)),
+    'confidence': (np.float32, ()),
+    'image_quality': (np.float32, ()),
+    'timestamp': ('datetime64[s]', ()),
+    'patient_id': (np.int64, ()),
+    'record': (np.int64, ()),
+}
+META_FILE = 'meta.json'
+NO_PATIENT = -1
+
+# Varias sesiones pueden guardar en el mismo directorio: las copias no se intercalan
+_SAVE_LOCK = threading.Lock()
+
+
+def result_arrays(results):
+    """(probabilidades, confianza, calidad) de una lista de resultados, en arreglos"""
+    probabilities = np.array([[r['predictions'].get(name, 0.0) for name in CLASSES] for r in results],
+                             dtype=np.float32).reshape(len(results), len(CLASSES))
+    confidence = np.array([r.get('confidence', np.nan) for r in results], dtype=np.float32)
+    quality = np.array([r.get('image_quality', np.nan) for r in results], dtype=np.float32)
+    return probabilities, confidence, quality
+
+
+def record_columns(records, first_position=0):
+    """Columnas de un bloque de análisis, con una fila por resultado"""
+    results = []
+    timestamps = []
+    patient_ids = []
+    positions = []
+    for position, record in enumerate(records, first_position):
+        when = analysis_datetime(record)
+        patient_id = record.get('patient_id')
+        for item in record_results(record):
+            results.append(item)
+            timestamps.append(when or item.get('timestamp'))
+            patient_ids.append(NO_PATIENT if patient_id is None else patient_id)
+            positions.append(position)
+    probabilities, confidence, quality = result_arrays(results)
+    return {
+        'probabilities': probabilities,
+        'confidence': confidence,
+        'image_quality': quality,
+        'timestamp': np.array(timestamps, dtype='datetime64[s]'),
+        'patient_id': np.array(patient_ids, dtype=np.int64),
+        'record': np.array(positions, dtype=np.int64),
+    }
+
+
+PERIOD_FREQUENCIES = {'D': 'D', 'W': 'W-MON', 'M': 'MS'}
+
+
+def floor_periods(timestamps, freq):
+    """Inicio del período (día, semana desde el lunes o mes) de cada fecha, en datetime64[D]"""
+    days = timestamps.astype('datetime64[D]')
+    if freq == 'W':
+        # 1970-01-01 fue jueves
+        offsets = days.astype(np.int64)
+        return (offsets - (offsets + 3) % 7).astype('datetime64[D]')
+    if freq == 'M':
+        return timestamps.astype('datetime64[M]').astype('datetime64[D]')
+    return days
+
+
+def period_range(index, freq, start=None, end=None):
+    """Todos los períodos entre `start` (o el primero con datos) y `end` (o el último)"""
+    first = floor_periods(np.array([start], dtype='datetime64[D]'), freq)[0] if start is not None else None
+    last = floor_periods(np.array([end], dtype='datetime64[D]'), freq)[0] if end is not None else None
+    if first is None:
+        first = index.min() if len(index) else None
+    if last is None:
+        last = index.max() if len(index) else None
+    if first is None or last is None:
+        return pd.DatetimeIndex([])
+    return pd.date_range(first, last, freq=PERIOD_FREQUENCIES[freq])
+
+
+def downsample(frame, max_points):
+    """Sumar períodos consecutivos en grupos iguales hasta tener a lo sumo `max_points` filas
+
+    Los conteos se conservan; cada grupo se etiqueta con su primer período.
+    """
+    if len(frame) <= max_points:
+        return frame
+    step = -(-len(frame) // max_points)
+    groups = np.arange(len(frame)) // step
+    reduced = frame.groupby(groups).sum()
+    reduced.index = frame.index[::step]
+    return reduced
+
+
+def save_snapshot(snapshot, directory, source=None):
+    """Guardar una instantánea (ver ColumnarStore.snapshot) como .npy, apta para otro hilo
+
+    meta.json se borra antes y se escribe al final: una copia a medias nunca se da por buena.
+    """
+    with _SAVE_LOCK:
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name, column in snapshot['columns'].items():
+            path = os.path.join(directory, f"{name}.npy")
+            temporary = f"{path}.{uuid.uuid4().hex}.tmp.npy"
+            np.save(temporary, column)
+            os.replace(temporary, path)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'rows': snapshot['rows'], 'records': snapshot['records'], 'classes': CLASSES,
+                       'source': source}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+
+class ColumnarStore:
+    """Columnas de resultados con anexado por bloques y persistencia en .npy"""
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self.records = 0
+        self.source = None
+        self._token = uuid.uuid4().hex
+        self._data = {name: np.empty((capacity, *shape), dtype=dtype)
+                      for name, (dtype, shape) in COLUMNS.items()}
+
+    @classmethod
+    def from_records(cls, records):
+        store = cls(capacity=max(1024, len(records)))
+        store.append_records(records)
+        return store
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def version(self):
+        """Identifica el contenido actual: cambia con cada anexado o reconstrucción"""
+        return f"{self._token}:{self._size}"
+
+    def __getattr__(self, name):
+        if name in COLUMNS:
+            return self._data[name][:self._size]
+        raise AttributeError(name)
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._data['record'])
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity)
+        for name, column in self._data.items():
+            grown = np.empty((capacity, *column.shape[1:]), dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._data[name] = grown
+
+    def append(self, columns, records=None):
+        """Anexar un bloque completo de filas ({columna: arreglo}) con una copia por columna"""
+        rows = len(columns['record'])
+        if rows == 0:
+            # Sin filas no se escribe nada: una copia abierta con mmap es de solo lectura
+            if records is not None:
+                self.records = records
+            return
+        self._reserve(rows)
+        for name in COLUMNS:
+            self._data[name][self._size:self._size + rows] = columns[name]
+        self._size += rows
+        if records is not None:
+            self.records = records
+        else:
+            self.records = max(self.records, int(columns['record'][-1]) + 1)
+
+    def append_records(self, records):
+        """Anexar análisis que siguen a los ya almacenados en `analysis_results`"""
+        self.append(record_columns(records, self.records), self.records + len(records))
+
+    def snapshot(self):
+        """Vistas de las filas actuales; siguen valiendo aunque después se anexen filas"""
+        return {'columns': {name: getattr(self, name) for name in COLUMNS},
+                'rows': self._size, 'records': self.records}
+
+    def save(self, directory, source=None):
+        """Guardar las columnas con el origen (`source`) de los análisis que contienen"""
+        save_snapshot(self.snapshot(), directory, source)
+        self.source = source
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Abrir columnas guardadas (por defecto mapeadas en memoria); None si faltan o no cuadran"""
+        try:
+            with open(os.path.join(directory, META_FILE)) as f:
+                meta = json.load(f)
+            if meta['classes'] != CLASSES:
+                return None
+            data = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                    for name in COLUMNS}
+        except (OSError, ValueError, KeyError):
+            return None
+        if any(len(column) != meta['rows'] for column in data.values()):
+            return None
+        store = cls.__new__(cls)
+        store._data = data
+        store._size = meta['rows']
+        store.records = meta['records']
+        store.source = meta.get('source')
+        store._token = uuid.uuid4().hex
+        return store
+
+    # Estadísticas vectorizadas
+
+    def top_classes(self):
+        """Índice de la clase más probable de cada fila"""
+        return self.probabilities.argmax(axis=1)
+
+    def class_distribution(self):
+        """Resultados por diagnóstico principal, en el orden de CLASSES"""
+        return np.bincount(self.top_classes(), minlength=len(CLASSES))
+
+    def record_starts(self):
+        """Máscara de la primera fila de cada análisis (las filas de un lote son contiguas)"""
+        record = self.record
+        starts = np.ones(len(record), dtype=bool)
+        starts[1:] = record[1:] != record[:-1]
+        return starts
+
+    def _in_range(self, rows, start=None, end=None):
+        """Máscara de filas con fecha válida dentro de [start, end] (fechas inclusive)"""
+        timestamps = self.timestamp
+        mask = rows & ~np.isnat(timestamps)
+        if start is not None:
+            mask &= timestamps >= np.datetime64(start, 's')
+        if end is not None:
+            mask &= timestamps < np.datetime64(end, 'D') + np.timedelta64(1, 'D')
+        return mask
+
+    def counts_by(self, freq='D', start=None, end=None):
+        """Análisis por período ('D', 'W' o 'M') entre `start` y `end`, sin períodos vacíos"""
+        mask = self._in_range(self.record_starts(), start, end)
+        periods, counts = np.unique(floor_periods(self.timestamp[mask], freq), return_counts=True)
+        series = pd.Series(counts, index=pd.DatetimeIndex(periods))
+        return series.reindex(period_range(series.index, freq, start, end), fill_value=0)
+
+    def class_counts_by(self, freq='D', start=None, end=None):
+        """Resultados por período y diagnóstico principal (períodos × CLASSES)"""
+        mask = self._in_range(np.ones(self._size, dtype=bool), start, end)
+        periods, inverse = np.unique(floor_periods(self.timestamp[mask], freq), return_inverse=True)
+        counts = np.bincount(inverse * len(CLASSES) + self.top_classes()[mask],
+                             minlength=len(periods) * len(CLASSES)).reshape(len(periods), len(CLASSES))
+        frame = pd.DataFrame(counts, index=pd.DatetimeIndex(periods), columns=CLASSES)
+        return frame.reindex(period_range(frame.index, freq, start, end), fill_value=0)
+
+    def patient_summary(self):
+        """Por paciente: análisis, resultados, confianza media, última fecha y diagnóstico más frecuente"""
+        ids, inverse = np.unique(self.patient_id, return_inverse=True)
+        results = np.bincount(inverse, minlength=len(ids))
+        confidence = np.bincount(inverse, weights=self.confidence, minlength=len(ids)) / np.maximum(results, 1)
+        seconds = self.timestamp.astype(np.int64)
+        last = np.full(len(ids), np.iinfo(np.int64).min)
+        np.maximum.at(last, inverse, seconds)
+        by_class = np.bincount(inverse * len(CLASSES) + self.top_classes(),
+                               minlength=len(ids) * len(CLASSES)).reshape(len(ids), len(CLASSES))
+        return pd.DataFrame({
+            'analyses': np.bincount(inverse[self.record_starts()], minlength=len(ids)),
+            'results': results,
+            'confidence': confidence,
+            'last': last.astype('datetime64[s]'),
+            'top_class': np.array(CLASSES)[by_class.argmax(axis=1)],
+        }, index=pd.Index(ids, name='patient_id'))
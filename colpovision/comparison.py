@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Comparación de técnicas sobre una misma entrada compartida, en paralelo.
+
+La imagen se decodifica y prepara una sola vez; cada técnica lee ese búfer de solo
+lectura y deriva su propia entrada. OpenCV libera el GIL, así que los hilos se solapan.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from colpovision import imaging
+
+
+def create_thread_pool(workers=len(imaging.TECHNIQUES)):
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='comparison')
+
+
+def analyze_technique(shared, technique, backend):
+    """Análisis de una técnica sobre el búfer compartido, con su latencia en segundos"""
+    start = time.perf_counter()
+    spec = imaging.TECHNIQUES[technique]
+    size = min(spec['size'], shared.shape[0])
+    if size == shared.shape[0]:
+        rgb = shared
+    else:
+        rgb = cv2.resize(shared, (size, size), interpolation=cv2.INTER_AREA)
+    analysis = backend.analyze_array(rgb, spec['temperature'])
+    analysis['latency'] = time.perf_counter() - start
+    return analysis
+
+
+def compare_techniques(shared, techniques, backend, executor=None):
+    """{técnica: análisis} ejecutando las técnicas en paralelo sobre `shared` (size, size, 3)"""
+    shared.flags.writeable = False
+    if executor is None:
+        return {technique: analyze_technique(shared, technique, backend) for technique in techniques}
+    futures = {technique: executor.submit(analyze_technique, shared, technique, backend)
+               for technique in techniques}
+    return {technique: future.result() for technique, future in futures.items()}
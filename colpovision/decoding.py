@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Decodificación de imágenes subidas a la resolución que realmente se necesita.
+
+Los JPEG se decodifican con `draft`: el decodificador escala por 1/2, 1/4 u 1/8 al leer
+los coeficientes DCT, sin materializar nunca los píxeles a resolución completa.
+Otros formatos se decodifican completos y se reducen con `reduce`.
+"""
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+from colpovision import imaging
+
+PREVIEW_SIZE = 640
+PREVIEW_QUALITY = 85
+
+
+def open_reduced(data, size, long_side=0):
+    """Abrir bytes codificados de modo que el lado menor quede >= size (y el mayor >= long_side)
+
+    La decodificación es perezosa: si el resultado se sirve de caché, no se decodifica nada.
+    Las dimensiones sin reducir quedan en `image.original_size`.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.original_size = image.size
+    if image.format == 'JPEG':
+        width, height = image.size
+        scale = max(size / min(width, height), long_side / max(width, height))
+        image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+    return image
+
+
+def decode_for_analysis(data, size, out=None):
+    """Bytes codificados -> entrada del modelo (size, size, 3)"""
+    with open_reduced(data, size) as image:
+        return imaging.prepare_input(image, size, out=out)
+
+
+def decode_working(data, size):
+    """Bytes codificados -> arreglo RGB con el lado menor entre size y 2 * size (sin deformar)"""
+    with open_reduced(data, size) as image:
+        factor = min(image.size) // size
+        if factor >= 2:
+            image = image.reduce(factor)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return np.asarray(image)
+
+
+def make_preview(data, max_side=PREVIEW_SIZE):
+    """Miniatura JPEG para mostrar en pantalla en lugar de la imagen original"""
+    with open_reduced(data, max_side) as image:
+        image.thumbnail((max_side, max_side), reducing_gap=None)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=PREVIEW_QUALITY)
+        return output.getvalue()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Exportación masiva de reportes a un ZIP o a un único PDF con marcadores.
+
+Cada elemento a exportar es una tupla (nombre, paciente, resultados, opciones).
+- ZIP: los PDF se generan en bloques repartidos entre procesos y se escriben en el
+  archivo a medida que llegan; nunca hay más de `window` bloques en memoria.
+- PDF combinado: un solo documento de ReportLab alimentado reporte a reporte. Los
+  flowables de un reporte se descartan al dibujarlo, pero ReportLab conserva todas las
+  páginas e imágenes hasta `save()`: la memoria crece con el tamaño del PDF (unos 0,5 MB
+  por reporte con imagen propia), así que este modo tiene un límite y las exportaciones
+  grandes deben ir al ZIP.
+"""
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import Flowable, PageBreak, SimpleDocTemplate
+
+from colpovision import images, reports
+
+EXPORT_CHUNK = 25
+# Límites del PDF combinado (≈130 MB adicionales en el peor caso, con imágenes distintas)
+MERGED_MAX_REPORTS = 5000
+MERGED_MAX_IMAGES = 200
+
+
+def safe_filename(text):
+    return re.sub(r'[^\w.-]+', '_', text, flags=re.UNICODE).strip('_')
+
+
+def load_image(store, results, options):
+    """Copia de impresión de un resultado, si el reporte lleva imágenes"""
+    if store is None or not reports.normalize_options(options)['images']:
+        return None
+    return store.get(results.get('image_digest'))
+
+
+def render_chunk(items, image_dir=None):
+    """Tarea de un proceso: [(nombre, bytes del PDF), ...] para un bloque de elementos
+
+    Las imágenes se leen del almacén en disco `image_dir` dentro del propio proceso.
+    """
+    store = images.PrintImageStore(image_dir) if image_dir else None
+    return [(name, reports.render_report(patient, results, options, load_image(store, results, options)))
+            for name, patient, results, options in items]
+
+
+def iter_rendered(items, executor=None, chunk_size=EXPORT_CHUNK, window=4, image_dir=None):
+    """Generar (nombre, PDF) a medida que se renderizan, con a lo sumo `window` bloques en curso"""
+    chunks = (items[start:start + chunk_size] for start in range(0, len(items), chunk_size))
+    if executor is None:
+        for chunk in chunks:
+            yield from render_chunk(chunk, image_dir)
+        return
+    pending = set()
+    try:
+        for chunk in chunks:
+            pending.add(executor.submit(render_chunk, chunk, image_dir))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def export_zip(items, path, executor=None, report=None, image_dir=None):
+    """Escribir los reportes en un ZIP en disco; `report(progreso, mensaje)` publica el avance"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for done, (name, pdf) in enumerate(iter_rendered(items, executor, image_dir=image_dir), 1):
+            archive.writestr(name, pdf)
+            if report:
+                report(done / len(items), f"Reportes generados: {done}/{len(items)}")
+    return path
+
+
+class Bookmark(Flowable):
+    """Marcador invisible: entrada del índice del PDF que apunta a la página actual"""
+
+    def __init__(self, key, title, on_draw=None):
+        super().__init__()
+        self.key = key
+        self.title = title
+        self.on_draw = on_draw
+
+    def wrap(self, available_width, available_height):
+        return 0, 0
+
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=0)
+        if self.on_draw:
+            self.on_draw()
+
+
+class _StreamedStory(list):
+    """Lista de flowables que se rellena desde un generador a medida que ReportLab la consume"""
+
+    def __init__(self, parts):
+        super().__init__()
+        self._parts = iter(parts)
+
+    def __len__(self):
+        while not list.__len__(self):
+            part = next(self._parts, None)
+            if part is None:
+                break
+            self.extend(part)
+        return list.__len__(self)
+
+
+def check_merged_pdf(items):
+    """Lanzar ValueError si los elementos superan los límites del PDF combinado"""
+    with_images = sum(1 for _, _, results, options in items
+                      if reports.normalize_options(options)['images'] and results.get('image_digest'))
+    if len(items) > MERGED_MAX_REPORTS or with_images > MERGED_MAX_IMAGES:
+        raise ValueError(f"El PDF combinado admite hasta {MERGED_MAX_REPORTS} reportes y "
+                         f"{MERGED_MAX_IMAGES} con imagen ({len(items)} reportes, {with_images} con "
+                         "imagen); use el formato ZIP o exporte sin imágenes")
+
+
+def export_merged_pdf(items, path, report=None, image_dir=None):
+    """Escribir todos los reportes en un único PDF con un marcador por reporte
+
+    El documento completo queda en memoria hasta guardarse; ver `check_merged_pdf`.
+    """
+    check_merged_pdf(items)
+    store = images.PrintImageStore(image_dir) if image_dir else None
+    drawn = [0]
+
+    def on_draw():
+        drawn[0] += 1
+        if report:
+            report(drawn[0] / len(items), f"Reportes generados: {drawn[0]}/{len(items)}")
+
+    def parts():
+        for i, (name, patient, results, options) in enumerate(items):
+            title = f"{patient['nombre']} {patient['apellido']} - {results['timestamp'].strftime('%d/%m/%Y %H:%M')}"
+            story = [Bookmark(f"report-{i}", title, on_draw)]
+            story.extend(reports.build_story(patient, results, options, load_image(store, results, options)))
+            if i < len(items) - 1:
+                story.append(PageBreak())
+            yield story
+
+    doc = SimpleDocTemplate(path, pagesize=A4)
+    doc.build(_StreamedStory(parts()))
+    return path
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Copias de impresión de las imágenes analizadas, para incrustarlas en los reportes.
+
+Cada imagen se guarda una sola vez por huella de contenido como JPEG reducido a
+resolución de impresión y con calidad acotada: los reportes se generan sin decodificar
+el original y los adjuntos de correo se mantienen pequeños.
+"""
+import io
+
+from PIL import Image
+
+from colpovision import decoding, imaging
+from colpovision.cache import AnalysisCache, content_digest
+
+PRINT_MAX_SIDE = 900        # 6 pulgadas a 150 ppp
+PRINT_QUALITY = 80
+PRINT_WIDTH_INCHES = 4.5
+
+
+def print_jpeg(image, max_side=PRINT_MAX_SIDE, quality=PRINT_QUALITY):
+    """Imagen PIL abierta -> JPEG de impresión (lado mayor <= max_side); reduce `image` en su lugar"""
+    image.thumbnail((max_side, max_side), reducing_gap=None)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def encode_print_jpeg(data, max_side=PRINT_MAX_SIDE, quality=PRINT_QUALITY):
+    """Bytes de imagen -> JPEG de impresión"""
+    with decoding.open_reduced(data, 0, max_side) as image:
+        return print_jpeg(image, max_side, quality)
+
+
+def decode_with_print(data, size, out=None):
+    """Entrada del modelo (size, size, 3) y copia de impresión: (entrada, JPEG de impresión)
+
+    La entrada es idéntica a la de `decoding.decode_for_analysis`. Si esa decodificación ya
+    alcanza la resolución de impresión (lo habitual con fotos de cámara), la copia sale de
+    ella; si no, la imagen se decodifica una segunda vez.
+    """
+    with decoding.open_reduced(data, size) as image:
+        rgb = imaging.prepare_input(image, size, out=out)
+        if max(image.size) >= min(PRINT_MAX_SIDE, max(image.original_size)):
+            return rgb, print_jpeg(image)
+    return rgb, encode_print_jpeg(data)
+
+
+def image_size(data):
+    """(ancho, alto) leyendo solo la cabecera"""
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+class PrintImageStore:
+    """Almacén de copias de impresión por huella: memoria (LRU) y disco"""
+
+    def __init__(self, directory, max_bytes=16 * 1024 * 1024):
+        self._cache = AnalysisCache(max_bytes=max_bytes, disk_dir=directory)
+
+    @staticmethod
+    def key(digest):
+        return AnalysisCache.make_key(digest, 'print-jpeg', PRINT_MAX_SIDE, PRINT_QUALITY)
+
+    def add(self, data, digest=None):
+        """Guardar la copia de impresión de `data` (si no existe) y devolver su huella"""
+        digest = digest or content_digest(data)
+        if not self.has(digest):
+            self.put(digest, encode_print_jpeg(data))
+        return digest
+
+    def put(self, digest, jpeg):
+        """Guardar una copia de impresión ya codificada (p. ej. por un proceso de análisis)"""
+        self._cache.put(self.key(digest), jpeg)
+
+    def has(self, digest):
+        return self._cache.get(self.key(digest)) is not None
+
+    def get(self, digest):
+        return self._cache.get(self.key(digest)) if digest else None
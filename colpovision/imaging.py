@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Extracción de características colposcópicas y puntuación vectorizada por clase.
+
+Las entradas del modelo son arreglos RGB uint8 de forma fija (size, size, 3), así que un
+lote se apila en un búfer contiguo (N, size, size, 3). Las pasadas por píxel se hacen
+imagen por imagen, con los intermedios en caché; la puntuación se aplica al lote completo.
+"""
+import cv2
+import numpy as np
+
+# Cambia cuando cambian las características, umbrales o pesos (invalida la caché de resultados)
+MODEL_VERSION = 'features-linear-3'
+
+CLASSES = ['Normal', 'CIN I', 'CIN II', 'CIN III', 'Carcinoma']
+FEATURES = ['acetowhite', 'redness', 'vascular', 'texture', 'glare']
+
+# Umbrales en escala 0-255 (saturación HSV de OpenCV: 255 * croma / valor)
+GLARE_VALUE = 240
+GLARE_SATURATION = 31       # 12 %
+ACETOWHITE_VALUE = 179
+ACETOWHITE_SATURATION = 64  # 25 %
+REDNESS_INDEX = 77          # 2R - G - B, equivale a R - (G + B) / 2 >= 0.15
+VASCULAR_RESPONSE = 15
+HISTOGRAM_BINS = 32
+
+# Modelo lineal de demostración: logit = WEIGHTS @ [acetowhite, redness, vascular, texture, glare] + BIAS
+WEIGHTS = np.array([
+    [-3.0, -1.0, -2.0, -0.5, 0.0],   # Normal
+    [2.0, 0.5, 0.0, 0.0, 0.0],       # CIN I
+    [3.0, 0.5, 1.5, 0.5, 0.0],       # CIN II
+    [3.5, 0.5, 3.0, 1.0, 0.0],       # CIN III
+    [1.5, 1.5, 4.5, 2.0, 0.0],       # Carcinoma
+], dtype=np.float32)
+BIAS = np.array([1.0, 0.3, -0.2, -0.6, -1.2], dtype=np.float32)
+REDNESS_TRANSFORM = np.array([[2.0, -1.0, -1.0]], dtype=np.float32)
+
+# Variantes de demostración para la comparación de técnicas: resolución de entrada y temperatura
+TECHNIQUES = {
+    'CNN Básico': {'size': 224, 'temperature': 1.3},
+    'ResNet-50': {'size': 256, 'temperature': 1.0},
+    'EfficientNet': {'size': 320, 'temperature': 0.9},
+    'Vision Transformer': {'size': 384, 'temperature': 0.8},
+}
+
+
+def prepare_input(image, size, out=None):
+    """Imagen PIL -> entrada RGB uint8 (size, size, 3)
+
+    Todas las imágenes comparten la misma forma de entrada para poder apilarse en lotes;
+    las características son proporciones de área, así que el cambio de aspecto no las altera.
+    Si se pasa `out`, el resultado se escribe directamente en ese búfer.
+    También acepta un arreglo RGB uint8 (H, W, 3), p. ej. la salida del preprocesamiento.
+    """
+    if out is None:
+        out = np.empty((size, size, 3), dtype=np.uint8)
+    if isinstance(image, np.ndarray):
+        cv2.resize(image, (size, size), dst=out, interpolation=cv2.INTER_AREA)
+        return out
+    # Reducción entera en PIL antes de copiar los píxeles: evita convertir la imagen completa.
+    # Lo que resta es una escala entre 0.5 y 1, donde la interpolación bilineal no produce aliasing.
+    factor = min(image.size) // size
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    cv2.resize(np.asarray(image), (size, size), dst=out, interpolation=cv2.INTER_LINEAR)
+    return out
+
+
+def image_features(rgb):
+    """Características en [0, 1] (y medidas de calidad) de una entrada (H, W, 3)"""
+    h, w, _ = rgb.shape
+    area = h * w
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    glare = cv2.inRange(hsv, (0, 0, GLARE_VALUE), (180, GLARE_SATURATION, 255))
+    # El rango de reflejo está contenido en el acetoblanco: se descuenta al contar
+    bright = cv2.inRange(hsv, (0, 0, ACETOWHITE_VALUE), (180, ACETOWHITE_SATURATION, 255))
+    # Con saturación <= 12 % el índice 2R - G - B no supera 61: rojo y reflejo no se solapan
+    redness = cv2.compare(cv2.transform(rgb, REDNESS_TRANSFORM), REDNESS_INDEX, cv2.CMP_GE)
+    # Vasos: estructuras finas y oscuras en el canal verde (respuesta positiva del Laplaciano)
+    green_lap = cv2.Laplacian(cv2.extractChannel(rgb, 1), cv2.CV_16S, ksize=1)
+    vascular = cv2.subtract(cv2.compare(green_lap, VASCULAR_RESPONSE, cv2.CMP_GE), glare)
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    gray_lap = cv2.Laplacian(gray, cv2.CV_16S, ksize=1)
+
+    glare_count = cv2.countNonZero(glare)
+    tissue_area = max(area - glare_count, 1)
+    _, gray_std = cv2.meanStdDev(gray)
+    _, lap_std = cv2.meanStdDev(gray_lap[1:-1])
+    hist = cv2.calcHist([gray], [0], None, [HISTOGRAM_BINS], [0, 256]).ravel() / area
+    nonzero = hist[hist > 0]
+    return {
+        'acetowhite': (cv2.countNonZero(bright) - glare_count) / tissue_area,
+        'redness': cv2.countNonZero(redness) / tissue_area,
+        'vascular': cv2.countNonZero(vascular[1:-1]) / tissue_area,
+        'texture': min(gray_std[0, 0] / 255.0 * 4.0, 1.0),
+        'glare': glare_count / area,
+        'entropy': -(nonzero * np.log2(nonzero)).sum() / np.log2(HISTOGRAM_BINS),
+        'brightness': cv2.mean(hsv)[2] / 255.0,
+        'sharpness': 1.0 - np.exp(-(lap_std[0, 0] / 255.0) ** 2 * 400.0),
+    }
+
+
+def extract_features(stack):
+    """Columnas float32 de características para un lote (N, H, W, 3)
+
+    Procesar el lote como una sola imagen alta resultó más lento que recorrerlo: los
+    intermedios de un bloque completo no caben en caché.
+    """
+    columns = {}
+    for i, rgb in enumerate(stack):
+        for name, value in image_features(rgb).items():
+            columns.setdefault(name, np.empty(len(stack), dtype=np.float32))[i] = value
+    return columns
+
+
+def score_features(features, temperature=1.0, weights=WEIGHTS, bias=BIAS):
+    """Probabilidades por clase, confianza y calidad a partir de las características"""
+    vector = np.stack([features[name] for name in FEATURES], axis=-1)
+    logits = (vector @ weights.T + bias) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    probs = exp / exp.sum(axis=-1, keepdims=True)
+
+    exposure = 1.0 - np.minimum(np.abs(features['brightness'] - 0.55) / 0.55, 1.0)
+    quality = np.clip(0.4 * exposure + 0.4 * features['sharpness'] +
+                      0.2 * (1.0 - 5.0 * features['glare']), 0.0, 1.0)
+    top_two = np.sort(probs, axis=-1)[..., -2:]
+    margin = top_two[..., 1] - top_two[..., 0]
+    confidence = np.clip(0.55 + 0.25 * quality + 0.2 * np.sqrt(margin), 0.0, 1.0)
+    return probs, confidence, quality
+
+
+def build_result(probs, confidence, quality, features, i):
+    """Resultado de la imagen `i` de un lote ya puntuado"""
+    return {
+        'predictions': {name: float(p) for name, p in zip(CLASSES, probs[i])},
+        'confidence': float(confidence[i]),
+        'image_quality': float(quality[i]),
+        'features': {name: float(v[i]) for name, v in features.items()},
+    }
+
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Cola de trabajos en segundo plano que sobrevive a las re-ejecuciones de Streamlit.
+
+Un trabajo es una función `fn(report)` que se ejecuta en un hilo del pool; `report(progreso,
+mensaje)` publica el avance. La interfaz consulta el estado por id y recoge el resultado
+en el hilo de la sesión (el único que puede tocar `st.session_state`).
+"""
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+MAX_FINISHED = 200
+# Un trabajo terminado que ninguna sesión recoge en este tiempo se da por abandonado
+ABANDONED_AFTER = timedelta(hours=1)
+
+
+class Job:
+    def __init__(self, kind, label, patient_id=None, discard=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.label = label
+        self.patient_id = patient_id
+        self.status = PENDING
+        self.progress = 0.0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.collected = False
+        # Se llama con el resultado cuando el trabajo se descarta (p. ej. para borrar un archivo)
+        self.discard = discard
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def snapshot(self):
+        """Copia del estado para leer fuera del lock"""
+        return dict(self.__dict__, finished=self.finished)
+
+
+class JobQueue:
+    def __init__(self, workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, label, fn, patient_id=None, discard=None):
+        """Encolar `fn(report)` y devolver el id del trabajo"""
+        job = Job(kind, label, patient_id, discard)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job.id
+
+    def _run(self, job, fn):
+        def report(progress, message=''):
+            with self._lock:
+                job.progress = progress
+                job.message = message
+
+        with self._lock:
+            job.status = RUNNING
+        try:
+            result = fn(report)
+        except Exception as e:
+            with self._lock:
+                job.status = FAILED
+                job.error = f"{e}"
+                job.message = traceback.format_exc(limit=3)
+                job.finished_at = datetime.now()
+            return
+        with self._lock:
+            job.result = result
+            job.progress = 1.0
+            job.status = DONE
+            job.finished_at = datetime.now()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def mark_collected(self, job_id):
+        """Indicar que la sesión ya incorporó el resultado; desde entonces se puede descartar"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.collected = True
+
+    def has_pending(self, patient_id):
+        """Si hay trabajos del paciente cuyo resultado todavía no recogió ninguna sesión"""
+        with self._lock:
+            return any(job.patient_id == patient_id and job.status != FAILED and not job.collected
+                       for job in self._jobs.values())
+
+    def _prune(self):
+        # Solo se descartan los más antiguos entre los ya recogidos, fallidos o abandonados
+        abandoned = datetime.now() - ABANDONED_AFTER
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.finished and (job.collected or job.status == FAILED or job.finished_at < abandoned)]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            job = self._jobs.pop(job_id)
+            if job.discard is not None and job.status == DONE:
+                job.discard(job.result)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""Importación diferida de módulos pesados.
+
+Streamlit ejecuta el script completo en cada arranque; los módulos que solo usa una
+página se importan la primera vez que se accede a uno de sus atributos. La importación
+real la hace `importlib`, que ya es segura entre hilos.
+"""
+import importlib
+
+
+class LazyModule:
+    """Representante de un módulo que se importa al usar cualquiera de sus atributos"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'cargado' if self._module is not None else 'sin cargar'
+        return f"<módulo diferido {self._name!r} ({state})>"
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Envío de reportes por SMTP con conexiones reutilizadas.
+
+Cada hilo que envía mantiene una sesión SMTP ya autenticada (STARTTLS + login una sola
+vez) y la reutiliza para todos sus mensajes. El adjunto PDF se codifica una vez por
+reporte y se comparte entre destinatarios. Sin contraseña no se hace login y sin TLS no
+se hace STARTTLS, lo que permite probar contra un servidor SMTP local de pruebas.
+"""
+import smtplib
+import threading
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+SENT, RETRY, FAILED = 'sent', 'retry', 'failed'
+
+MAX_CONNECTIONS = 4
+TIMEOUT_SECONDS = 30
+
+# Errores definitivos: reintentar no cambia el resultado
+PERMANENT_ERRORS = (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                    smtplib.SMTPSenderRefused, smtplib.SMTPNotSupportedError)
+
+
+def make_attachment(pdf_bytes, filename):
+    """Parte MIME del PDF, codificada una vez y reutilizable en varios mensajes"""
+    part = MIMEApplication(pdf_bytes, _subtype='pdf')
+    part.add_header('Content-Disposition', 'attachment', filename=filename)
+    return part
+
+
+def build_message(sender, recipient, subject, body, attachment):
+    """Mensaje con cuerpo de texto y el adjunto ya codificado"""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain', 'utf-8'))
+    msg.attach(attachment)
+    return msg
+
+
+class SMTPPool:
+    """Sesiones SMTP por hilo: cada hilo que envía abre la suya y la reutiliza
+
+    `config`: smtp_server, port, email, password (opcional) y use_tls.
+    """
+
+    def __init__(self, config, timeout=TIMEOUT_SECONDS, smtp_factory=smtplib.SMTP):
+        self.config = config
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        server = self.smtp_factory(self.config['smtp_server'], int(self.config['port']), timeout=self.timeout)
+        try:
+            if self.config.get('use_tls', True):
+                server.starttls()
+            if self.config.get('password'):
+                server.login(self.config['email'], self.config['password'])
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self._connections.append(server)
+        return server
+
+    def _connection(self):
+        server = getattr(self._local, 'server', None)
+        if server is None:
+            server = self._local.server = self._connect()
+        return server
+
+    def _drop_connection(self):
+        server = getattr(self._local, 'server', None)
+        self._local.server = None
+        if server is not None:
+            with self._lock:
+                if server in self._connections:
+                    self._connections.remove(server)
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def attempt(self, msg):
+        """Un único intento de envío: (SENT | RETRY | FAILED, detalle)"""
+        try:
+            self._connection().send_message(msg)
+            return SENT, "Email enviado exitosamente"
+        except PERMANENT_ERRORS as e:
+            return FAILED, f"Error al enviar email: {e}"
+        except (smtplib.SMTPException, OSError) as e:
+            # Conexión caída o error transitorio: se descarta la sesión
+            self._drop_connection()
+            return RETRY, f"Error al enviar email: {e}"
+
+    def close(self):
+        """Cerrar (QUIT) todas las sesiones abiertas"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            # Los hilos abrirán sesiones nuevas en su próximo envío
+            self._local = threading.local()
+        for server in connections:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""Cola persistente de correos salientes y despachador en segundo plano.
+
+Los mensajes se guardan en SQLite antes de enviarse, así que una re-ejecución de la
+app o un reinicio no pierden el resto del envío. Cada PDF se guarda una sola vez por
+huella y se comparte entre sus destinatarios. Las contraseñas SMTP nunca se escriben
+en disco: el despachador solo envía los mensajes de las cuentas registradas en este
+proceso; los de otras cuentas esperan hasta que se vuelvan a registrar.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from colpovision import mailer
+from colpovision.cache import content_digest
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+STATUS_LABELS = {
+    PENDING: "⏳ En cola",
+    SENDING: "📤 Enviando",
+    SENT: "✅ Enviado",
+    FAILED: "❌ Error",
+}
+
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 300.0
+
+
+def account_key(config):
+    """Identificador de una cuenta SMTP (sin la contraseña)"""
+    return f"{config['email']}@{config['smtp_server']}:{int(config['port'])}|tls={bool(config.get('use_tls', True))}"
+
+
+class Outbox:
+    """Mensajes salientes con su estado, intentos y tiempos, en una base SQLite propia"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS attachments (
+        digest TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account TEXT NOT NULL,
+        sender TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        patient TEXT,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt REAL NOT NULL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        sent_at REAL,
+        latency REAL
+    );
+    CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_attempt);
+    """
+
+    COLUMNS = ('id', 'account', 'sender', 'recipient', 'patient', 'subject', 'body', 'filename',
+               'digest', 'status', 'attempts', 'next_attempt', 'last_error', 'created_at',
+               'sent_at', 'latency')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        # Lo que quedó a medio enviar en una ejecución anterior vuelve a la cola
+        with self._lock:
+            self._conn.execute('UPDATE messages SET status = ? WHERE status = ?', (PENDING, SENDING))
+
+    def enqueue(self, account, messages):
+        """Encolar [{sender, recipient, patient, subject, body, filename, pdf}, ...]; devuelve los ids"""
+        now = time.time()
+        attachments = {}
+        rows = []
+        for message in messages:
+            digest = content_digest(message['pdf'])
+            attachments[digest] = message['pdf']
+            rows.append((account, message['sender'], message['recipient'], message.get('patient'),
+                         message['subject'], message['body'], message['filename'], digest,
+                         PENDING, now, now))
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany('INSERT OR IGNORE INTO attachments (digest, data) VALUES (?, ?)',
+                                       [(digest, sqlite3.Binary(pdf)) for digest, pdf in attachments.items()])
+                # AUTOINCREMENT no reutiliza ids borrados: cada id sale de su propia inserción
+                ids = [self._conn.execute(
+                    'INSERT INTO messages (account, sender, recipient, patient, subject, body, filename, '
+                    'digest, status, next_attempt, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    row).lastrowid for row in rows]
+        return ids
+
+    def claim(self, accounts, limit):
+        """Tomar hasta `limit` mensajes vencidos de las cuentas dadas y marcarlos como en envío"""
+        if not accounts:
+            return []
+        marks = ','.join('?' * len(accounts))
+        with self._lock:
+            with self._transaction():
+                rows = self._conn.execute(
+                    f'SELECT {", ".join(self.COLUMNS)} FROM messages '
+                    f'WHERE status = ? AND next_attempt <= ? AND account IN ({marks}) '
+                    'ORDER BY next_attempt, id LIMIT ?',
+                    (PENDING, time.time(), *accounts, limit)).fetchall()
+                self._conn.executemany('UPDATE messages SET status = ? WHERE id = ?',
+                                       [(SENDING, row[0]) for row in rows])
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def attachment(self, digest):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM attachments WHERE digest = ?', (digest,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def mark_sent(self, message_id, latency):
+        self._finish(message_id, SENT, None, latency)
+
+    def mark_failed(self, message_id, error):
+        self._finish(message_id, FAILED, error, None)
+
+    def mark_retry(self, message_id, error, delay):
+        """Devolver un mensaje a la cola para reintentarlo dentro de `delay` segundos"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE messages SET status = ?, attempts = attempts + 1, last_error = ?, '
+                'next_attempt = ? WHERE id = ?', (PENDING, error, time.time() + delay, message_id))
+
+    def _finish(self, message_id, status, error, latency):
+        with self._lock:
+            with self._transaction():
+                self._conn.execute(
+                    'UPDATE messages SET status = ?, attempts = attempts + 1, last_error = ?, '
+                    'sent_at = ?, latency = ? WHERE id = ?',
+                    (status, error, time.time(), latency, message_id))
+                # El PDF se borra cuando ya no le quedan destinatarios por atender
+                self._conn.execute(
+                    'DELETE FROM attachments WHERE digest = (SELECT digest FROM messages WHERE id = ?) '
+                    'AND NOT EXISTS (SELECT 1 FROM messages WHERE digest = attachments.digest '
+                    'AND status IN (?, ?))', (message_id, PENDING, SENDING))
+
+    def next_due(self, accounts):
+        """Momento del próximo mensaje pendiente de las cuentas dadas (None si no hay)"""
+        if not accounts:
+            return None
+        marks = ','.join('?' * len(accounts))
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT MIN(next_attempt) FROM messages WHERE status = ? AND account IN ({marks})',
+                (PENDING, *accounts)).fetchone()[0]
+
+    def counts(self):
+        """{estado: número de mensajes}"""
+        with self._lock:
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM messages GROUP BY status'))
+
+    def pending_accounts(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT DISTINCT account FROM messages WHERE status IN (?, ?)', (PENDING, SENDING))]
+
+    def history(self, limit=500):
+        """Últimos mensajes, del más reciente al más antiguo (sin cuerpo ni adjunto)"""
+        columns = ('id', 'recipient', 'patient', 'subject', 'status', 'attempts', 'last_error',
+                   'created_at', 'sent_at', 'latency')
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {", ".join(columns)} FROM messages ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def retry_failed(self):
+        """Volver a encolar los mensajes fallidos cuyo adjunto sigue disponible"""
+        with self._lock:
+            return self._conn.execute(
+                'UPDATE messages SET status = ?, attempts = 0, next_attempt = ? WHERE status = ? '
+                'AND digest IN (SELECT digest FROM attachments)', (PENDING, time.time(), FAILED)).rowcount
+
+    def clear_finished(self):
+        """Borrar del historial los mensajes enviados o fallidos"""
+        with self._lock:
+            with self._transaction():
+                self._conn.execute('DELETE FROM messages WHERE status IN (?, ?)', (SENT, FAILED))
+                self._conn.execute('DELETE FROM attachments WHERE digest NOT IN (SELECT digest FROM messages)')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._conn
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+
+class DispatchMetrics:
+    """Contadores y latencias recientes del despachador"""
+
+    def __init__(self, window=60.0, samples=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=samples)
+        self._sent_times = deque()
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def record(self, status, latency):
+        now = time.monotonic()
+        with self._lock:
+            if status == mailer.SENT:
+                self.sent += 1
+                self._latencies.append(latency)
+                self._sent_times.append(now)
+            elif status == mailer.RETRY:
+                self.retries += 1
+            else:
+                self.failed += 1
+            while self._sent_times and now - self._sent_times[0] > self.window:
+                self._sent_times.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            recent = sum(1 for t in self._sent_times if now - t <= self.window)
+            latencies = sorted(self._latencies)
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'throughput': recent * 60.0 / self.window,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95': latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        }
+
+
+class Dispatcher:
+    """Hilo que vacía la cola por medio de sesiones SMTP reutilizadas (una por conexión)"""
+
+    def __init__(self, outbox, max_connections=mailer.MAX_CONNECTIONS, max_attempts=MAX_ATTEMPTS,
+                 backoff=BACKOFF_SECONDS, idle_close=30.0, smtp_factory=mailer.smtplib.SMTP):
+        self.outbox = outbox
+        self.max_connections = max_connections
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_close = idle_close
+        self.smtp_factory = smtp_factory
+        self.metrics = DispatchMetrics()
+        self._pools = {}
+        self._woken = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='smtp')
+        self._thread = threading.Thread(target=self._run, name='colpovision-mailer', daemon=True)
+        self._thread.start()
+
+    def register(self, config):
+        """Registrar (o actualizar) las credenciales de una cuenta y devolver su clave"""
+        account = account_key(config)
+        with self._cond:
+            previous = self._pools.get(account)
+            if previous is None or previous.config != config:
+                self._pools[account] = mailer.SMTPPool(config, smtp_factory=self.smtp_factory)
+                if previous is not None:
+                    previous.close()
+        self.wake()
+        return account
+
+    def is_registered(self, account):
+        with self._cond:
+            return account in self._pools
+
+    def enqueue(self, config, messages):
+        """Registrar la cuenta, encolar sus mensajes y despertar al despachador"""
+        account = self.register(config)
+        ids = self.outbox.enqueue(account, messages)
+        self.wake()
+        return ids
+
+    def wake(self):
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def _deliver(self, pool, row, attachment):
+        msg = mailer.build_message(row['sender'], row['recipient'], row['subject'], row['body'], attachment)
+        start = time.perf_counter()
+        status, detail = pool.attempt(msg)
+        return status, detail, time.perf_counter() - start
+
+    def _process(self, rows):
+        with self._cond:
+            pools = dict(self._pools)
+        attachments = {}
+        futures = []
+        for row in rows:
+            if row['digest'] not in attachments:
+                pdf = self.outbox.attachment(row['digest'])
+                attachments[row['digest']] = pdf and mailer.make_attachment(pdf, row['filename'])
+            attachment = attachments[row['digest']]
+            if attachment is None:
+                self.outbox.mark_failed(row['id'], "Adjunto no disponible")
+                continue
+            futures.append((row, self._executor.submit(self._deliver, pools[row['account']], row, attachment)))
+        for row, future in futures:
+            try:
+                status, detail, latency = future.result()
+            except Exception as e:
+                status, detail, latency = mailer.RETRY, f"Error al enviar email: {e}", 0.0
+            self.metrics.record(status, latency)
+            if status == mailer.SENT:
+                self.outbox.mark_sent(row['id'], latency)
+            elif status == mailer.RETRY and row['attempts'] + 1 < self.max_attempts:
+                delay = min(self.backoff * 2 ** row['attempts'], MAX_BACKOFF_SECONDS)
+                self.outbox.mark_retry(row['id'], detail, delay)
+            else:
+                self.outbox.mark_failed(row['id'], detail)
+
+    def _close_idle(self):
+        with self._cond:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+    def _run(self):
+        idle_since = None
+        while True:
+            try:
+                with self._cond:
+                    accounts = list(self._pools)
+                rows = self.outbox.claim(accounts, self.max_connections * 2)
+                if rows:
+                    idle_since = None
+                    self._process(rows)
+                    continue
+                # Sin trabajo: cerrar las sesiones tras un rato y dormir hasta el próximo reintento
+                now = time.time()
+                if idle_since is None:
+                    idle_since = now
+                elif now - idle_since >= self.idle_close:
+                    self._close_idle()
+                due = self.outbox.next_due(accounts)
+                timeout = self.idle_close if due is None else max(0.05, min(due - now, self.idle_close))
+                with self._cond:
+                    if not self._woken:
+                        self._cond.wait(timeout)
+                    self._woken = False
+            except Exception:
+                logging.getLogger(__name__).exception("Error en el despachador de correo")
+                time.sleep(1.0)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Análisis por lotes repartido entre procesos, con resultados en orden de llegada."""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from colpovision import backends
+from colpovision.lazy import LazyModule
+
+decoding = LazyModule('colpovision.decoding')
+images = LazyModule('colpovision.images')
+
+
+def default_workers():
+    return max(1, (multiprocessing.cpu_count() or 2) - 1)
+
+
+def create_process_pool(workers, backend=(backends.FEATURES_BACKEND, None), size=None):
+    """Pool de procesos para análisis
+
+    Se prefiere 'fork': con 'spawn' cada proceso vuelve a ejecutar el script de Streamlit
+    como módulo principal. Los procesos solo ejecutan funciones puras de este paquete.
+    Con `size`, cada proceso carga y calienta el motor `backend` (nombre, ruta de pesos) al iniciar.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    if size is None:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=backends.warm_up_worker, initargs=(*backend, size))
+
+
+def analyze_encoded(encoded_images, size, backend=(backends.FEATURES_BACKEND, None), print_copies=False):
+    """Tarea de un proceso: decodificar, preparar y analizar un bloque de imágenes codificadas
+
+    Devuelve [(análisis, JPEG de impresión o None)]; con `print_copies` la copia de impresión
+    sale de la misma decodificación que la entrada del modelo.
+    """
+    buffer = np.empty((len(encoded_images), size, size, 3), dtype=np.uint8)
+    prints = [None] * len(encoded_images)
+    for i, data in enumerate(encoded_images):
+        if print_copies:
+            _, prints[i] = images.decode_with_print(data, size, out=buffer[i])
+        else:
+            decoding.decode_for_analysis(data, size, out=buffer[i])
+    return list(zip(backends.get_backend(*backend).analyze_stack(buffer), prints))
+
+
+def iter_batch_analysis(encoded_images, size, batch_size, executor=None,
+                        backend=(backends.FEATURES_BACKEND, None), print_copies=False):
+    """Generar (posición, análisis, JPEG de impresión o None) a medida que termina cada bloque
+
+    Sin `executor` los bloques se procesan en el proceso actual, en orden.
+    Si el consumidor abandona la iteración, los bloques pendientes se cancelan.
+    """
+    chunks = [(start, encoded_images[start:start + batch_size])
+              for start in range(0, len(encoded_images), batch_size)]
+    if executor is None:
+        for start, chunk in chunks:
+            for offset, (analysis, jpeg) in enumerate(analyze_encoded(chunk, size, backend, print_copies)):
+                yield start + offset, analysis, jpeg
+        return
+    futures = {executor.submit(analyze_encoded, chunk, size, backend, print_copies): start
+               for start, chunk in chunks}
+    try:
+        for future in as_completed(futures):
+            start = futures[future]
+            for offset, (analysis, jpeg) in enumerate(future.result()):
+                yield start + offset, analysis, jpeg
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Preprocesamiento componible sobre arreglos RGB uint8 (contraste, ruido, bordes).
+
+Las etapas se aplican siempre en el mismo orden y cada una escribe en un búfer nuevo
+mediante `dst` de OpenCV, sin pasar por PIL. `PreprocessingPipeline` memoriza cada
+prefijo de etapas: al cambiar una opción solo se recalculan las etapas posteriores.
+"""
+import cv2
+import numpy as np
+
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+BILATERAL_DIAMETER = 5
+BILATERAL_SIGMA = 40
+CANNY_LOW = 60
+CANNY_HIGH = 150
+EDGE_COLOR = (0, 255, 0)
+
+# Etapas que modifican la entrada del modelo; 'edges' solo superpone bordes para visualización
+ANALYSIS_STAGES = ('contrast', 'denoise')
+
+
+def enhance_contrast(rgb):
+    """CLAHE sobre la luminancia (canal L de Lab), conservando el color"""
+    lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB)
+    clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+    # El canal L se corrige en su sitio dentro del mismo búfer Lab
+    lightness = lab[:, :, 0].copy()
+    clahe.apply(lightness, dst=lightness)
+    lab[:, :, 0] = lightness
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2RGB, dst=lab)
+
+
+def reduce_noise(rgb):
+    """Filtro bilateral: suaviza el ruido preservando los bordes de las lesiones"""
+    return cv2.bilateralFilter(rgb, BILATERAL_DIAMETER, BILATERAL_SIGMA, BILATERAL_SIGMA)
+
+
+def detect_edges(rgb):
+    """Superponer los bordes de Canny sobre la imagen"""
+    edges = cv2.Canny(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY), CANNY_LOW, CANNY_HIGH)
+    overlay = rgb.copy()
+    overlay[edges > 0] = EDGE_COLOR
+    return overlay
+
+
+STAGES = (
+    ('contrast', enhance_contrast),
+    ('denoise', reduce_noise),
+    ('edges', detect_edges),
+)
+
+
+class PreprocessingPipeline:
+    """Etapas memorizadas sobre una imagen base (H, W, 3)"""
+
+    def __init__(self, base):
+        self.base = np.ascontiguousarray(base)
+        self._memo = {(): self.base}
+
+    def run(self, enabled):
+        """Aplicar en orden las etapas cuyo nombre está en `enabled`"""
+        key = ()
+        result = self.base
+        for name, stage in STAGES:
+            if name not in enabled:
+                continue
+            key += (name,)
+            if key not in self._memo:
+                self._memo[key] = stage(result)
+            result = self._memo[key]
+        return result
+
+    def analysis_input(self, enabled):
+        """Resultado de las etapas que alteran la entrada del modelo"""
+        return self.run([name for name in enabled if name in ANALYSIS_STAGES])
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Registro de pacientes con índices hash por id e identificación."""
+from bisect import bisect_left, insort
+
+from colpovision.search import PatientSearchIndex, normalize_text
+
+TEXT_SORT_FIELDS = ('nombre', 'apellido')
+
+
+class PatientRegistry:
+    """Lista de pacientes más índices en memoria para búsquedas O(1)"""
+
+    def __init__(self, patients=None, search_index=None):
+        """`search_index`: índice de búsqueda compartido (p. ej. `SharedSearchIndex`); sin él,
+        el registro construye el suyo en la primera búsqueda"""
+        self.patients = []
+        self._by_id = {}
+        self._by_identificacion = {}
+        self._shared_search_index = search_index
+        self._search_index = search_index
+        self._sorted = {}
+        self.rebuild(patients or [])
+
+    def rebuild(self, patients):
+        """Reconstruir los índices a partir de una lista de pacientes
+
+        Un índice de búsqueda compartido no se reconstruye: refleja el almacén, no esta lista.
+        """
+        self.patients = patients
+        self._by_id = {p['id']: p for p in patients}
+        self._by_identificacion = {self._key(p.get('identificacion')): p['id'] for p in patients}
+        self._search_index = self._shared_search_index
+        self._sorted = {}
+
+    @staticmethod
+    def _key(identificacion):
+        return (identificacion or '').strip().upper()
+
+    def add(self, patient):
+        self.patients.append(patient)
+        self._by_id[patient['id']] = patient
+        self._by_identificacion[self._key(patient.get('identificacion'))] = patient['id']
+        if self._search_index is not None:
+            self._search_index.add(patient)
+        for field, entries in self._sorted.items():
+            insort(entries, self._sort_entry(patient, field))
+
+    def get(self, patient_id):
+        return self._by_id.get(patient_id)
+
+    def get_by_identificacion(self, identificacion):
+        patient_id = self._by_identificacion.get(self._key(identificacion))
+        return self._by_id.get(patient_id) if patient_id is not None else None
+
+    def update(self, patient_id, updated_data):
+        """Actualizar un paciente y mantener sincronizado el índice de identificación"""
+        patient = self._by_id.get(patient_id)
+        if patient is None:
+            return None
+        old_key = self._key(patient.get('identificacion'))
+        for field, entries in self._sorted.items():
+            self._discard_sorted(entries, self._sort_entry(patient, field))
+        patient.update(updated_data)
+        for field, entries in self._sorted.items():
+            insort(entries, self._sort_entry(patient, field))
+        new_key = self._key(patient.get('identificacion'))
+        if new_key != old_key:
+            if self._by_identificacion.get(old_key) == patient_id:
+                del self._by_identificacion[old_key]
+            self._by_identificacion[new_key] = patient_id
+        if self._search_index is not None:
+            self._search_index.update(patient)
+        return patient
+
+    def remove(self, patient_id):
+        patient = self._by_id.pop(patient_id, None)
+        if patient is None:
+            return None
+        key = self._key(patient.get('identificacion'))
+        if self._by_identificacion.get(key) == patient_id:
+            del self._by_identificacion[key]
+        self.patients.remove(patient)
+        if self._search_index is not None:
+            self._search_index.remove(patient_id)
+        for field, entries in self._sorted.items():
+            self._discard_sorted(entries, self._sort_entry(patient, field))
+        return patient
+
+    def search(self, query, limit=None):
+        """Buscar pacientes por nombre, apellido o identificación (ver PatientSearchIndex)"""
+        if self._search_index is None:
+            # Se construye en la primera búsqueda y luego se mantiene incrementalmente
+            self._search_index = PatientSearchIndex(self.patients)
+        # Un índice compartido puede incluir pacientes agregados por otras sesiones
+        return [self._by_id[pid] for pid in self._search_index.search(query, limit) if pid in self._by_id]
+
+    @staticmethod
+    def _sort_entry(patient, field):
+        value = patient.get(field)
+        if value is None:
+            return ((1, ''), patient['id'])
+        if field in TEXT_SORT_FIELDS:
+            value = normalize_text(value)
+        return ((0, value), patient['id'])
+
+    @staticmethod
+    def _discard_sorted(entries, entry):
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def sorted_page(self, field, start, stop, descending=False):
+        """Pacientes [start:stop] según el orden por `field`, sin ordenar toda la lista"""
+        if field not in self._sorted:
+            # Índice ordenado por campo: se crea al primer uso y se mantiene con inserciones
+            self._sorted[field] = sorted(self._sort_entry(p, field) for p in self.patients)
+        entries = self._sorted[field]
+        if descending:
+            n = len(entries)
+            window = entries[max(n - stop, 0):max(n - start, 0)][::-1]
+        else:
+            window = entries[start:stop]
+        return [self._by_id[pid] for _, pid in window]
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._by_id
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Generación de reportes PDF de análisis (sin dependencias de Streamlit).
+
+Las hojas de estilo y los estilos de tabla se construyen una vez por proceso; el resto
+del documento depende solo del paciente, los resultados y las opciones del reporte.
+"""
+import hashlib
+import io
+from functools import lru_cache
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Image as RLImage
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from colpovision import images
+
+# Cambia cuando cambia el diseño del reporte (invalida los PDF en caché)
+REPORT_VERSION = 'report-2'
+
+PATIENT_FIELDS = ('nombre', 'apellido', 'identificacion', 'fecha_nacimiento', 'edad', 'telefono', 'email')
+DEFAULT_OPTIONS = {
+    'images': True,
+    'recommendations': True,
+    'technical_info': False,
+}
+
+
+@lru_cache(maxsize=1)
+def get_styles():
+    """Estilos compartidos del reporte (inmutables una vez construidos)"""
+    styles = getSampleStyleSheet()
+    title = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,
+        textColor=colors.darkblue
+    )
+    patient_table = TableStyle([
+        ('BACKGROUND', (0, 0), (1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+    results_table = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+    return {
+        'title': title,
+        'heading': styles['Heading2'],
+        'normal': styles['Normal'],
+        'patient_table': patient_table,
+        'results_table': results_table,
+    }
+
+
+def normalize_options(options=None):
+    return dict(DEFAULT_OPTIONS, **(options or {}))
+
+
+def patient_version(patient):
+    """Versión de un paciente: huella de los campos que aparecen en el reporte"""
+    values = '|'.join(str(patient.get(field)) for field in PATIENT_FIELDS)
+    return hashlib.blake2b(values.encode(), digest_size=8).hexdigest()
+
+
+def analysis_id(results):
+    """Identificador de un resultado; los anteriores a 'analysis_id' usan su fecha y tipo"""
+    if 'analysis_id' in results:
+        return results['analysis_id']
+    return f"{results['timestamp'].isoformat()}|{results.get('analysis_type')}"
+
+
+def report_key(patient, results, options=None):
+    """Clave del PDF: (paciente, versión, análisis, opciones, diseño)"""
+    options = normalize_options(options)
+    return '|'.join([str(patient.get('id')), patient_version(patient), analysis_id(results),
+                     repr(sorted(options.items())), REPORT_VERSION])
+
+
+def render_report(patient_data, analysis_results, options=None, image=None):
+    """Generar el PDF de un análisis y devolver sus bytes"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    doc.build(build_story(patient_data, analysis_results, options, image))
+    return buffer.getvalue()
+
+
+def build_story(patient_data, analysis_results, options=None, image=None):
+    """Elementos (flowables) del reporte de un análisis
+
+    `image` son los bytes de la copia de impresión (JPEG), que se incrustan tal cual.
+    """
+    options = normalize_options(options)
+    styles = get_styles()
+    story = []
+    story.append(Paragraph("REPORTE DE ANÁLISIS COLPOSCÓCICO", styles['title']))
+    story.append(Spacer(1, 20))
+    patient_info = [
+        ['Datos del Paciente', ''],
+        ['Nombre:', f"{patient_data['nombre']} {patient_data['apellido']}"],
+        ['Identificación:', patient_data['identificacion']],
+        ['Fecha de Nacimiento:', str(patient_data['fecha_nacimiento'])],
+        ['Edad:', str(patient_data['edad'])],
+        ['Teléfono:', patient_data.get('telefono', 'N/A')],
+        ['Email:', patient_data.get('email', 'N/A')],
+        ['Fecha del Análisis:', analysis_results['timestamp'].strftime('%d/%m/%Y %H:%M')]
+    ]
+    patient_table = Table(patient_info, colWidths=[2*inch, 4*inch])
+    patient_table.setStyle(styles['patient_table'])
+    story.append(patient_table)
+    story.append(Spacer(1, 20))
+    if options['images'] and image:
+        width, height = images.image_size(image)
+        print_width = images.PRINT_WIDTH_INCHES * inch
+        story.append(RLImage(io.BytesIO(image), width=print_width, height=print_width * height / width))
+        story.append(Spacer(1, 20))
+    story.append(Paragraph("RESULTADOS DEL ANÁLISIS", styles['heading']))
+    story.append(Spacer(1, 10))
+    results_data = [['Diagnóstico', 'Probabilidad (%)']]
+    for diag, prob in analysis_results['predictions'].items():
+        results_data.append([diag, f"{prob*100:.1f}%"])
+    results_table = Table(results_data, colWidths=[3*inch, 2*inch])
+    results_table.setStyle(styles['results_table'])
+    story.append(results_table)
+    story.append(Spacer(1, 20))
+    if options['recommendations']:
+        story.append(Paragraph("RECOMENDACIONES CLÍNICAS", styles['heading']))
+        story.append(Spacer(1, 10))
+        for i, rec in enumerate(analysis_results['recommendations'], 1):
+            story.append(Paragraph(f"{i}. {rec}", styles['normal']))
+            story.append(Spacer(1, 5))
+        story.append(Spacer(1, 20))
+    if options['technical_info'] and analysis_results.get('features'):
+        story.append(Paragraph("INFORMACIÓN TÉCNICA", styles['heading']))
+        story.append(Spacer(1, 10))
+        features_data = [['Característica', 'Valor']]
+        for name, value in analysis_results['features'].items():
+            features_data.append([name, f"{value:.3f}"])
+        features_table = Table(features_data, colWidths=[3*inch, 2*inch])
+        features_table.setStyle(styles['results_table'])
+        story.append(features_table)
+        story.append(Spacer(1, 20))
+    info_adicional = f"""
+    <b>Confianza del análisis:</b> {analysis_results['confidence']*100:.1f}%<br/>
+    <b>Calidad de imagen:</b> {analysis_results['image_quality']*100:.1f}%<br/>
+    <b>Tipo de análisis:</b> {analysis_results['analysis_type'].title()}<br/>
+    <br/>
+    <i>Este reporte es generado automáticamente por el sistema ColpoVision y debe ser
+    interpretado por un profesional médico calificado. No sustituye el juicio clínico.</i>
+    """
+    story.append(Paragraph(info_adicional, styles['normal']))
+    return story
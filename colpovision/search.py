@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Índice de búsqueda incremental de pacientes (prefijos y trigramas)."""
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+SEARCH_FIELDS = ('nombre', 'apellido', 'identificacion')
+
+# Puntajes de ranking por término buscado
+SCORE_EXACT_ID = 100
+SCORE_EXACT_TOKEN = 50
+SCORE_PREFIX = 30
+SCORE_SUBSTRING = 10
+
+# Por debajo de este número de candidatos se verifica la subcadena directamente
+VERIFY_LIMIT = 5000
+
+
+def normalize_text(text):
+    """Minúsculas y sin tildes: 'Muñoz Pérez' -> 'munoz perez'"""
+    decomposed = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PatientSearchIndex:
+    """Búsqueda sin distinción de tildes ni mayúsculas sobre nombre, apellido e identificación"""
+
+    def __init__(self, patients=()):
+        self._docs = {}
+        self._tokens = {}
+        self._identificacion = {}
+        self._trigrams = {}
+        self._sorted_tokens = []
+        for patient in patients:
+            self._index(patient)
+        # Carga inicial: ordenar una sola vez en lugar de insertar en orden uno a uno
+        self._sorted_tokens = sorted((token, pid) for pid, tokens in self._tokens.items()
+                                     for token in tokens)
+
+    def _document(self, patient):
+        return ' '.join(normalize_text(patient.get(field)) for field in SEARCH_FIELDS)
+
+    def add(self, patient):
+        if patient['id'] in self._docs:
+            self.remove(patient['id'])
+        for token in self._index(patient):
+            insort(self._sorted_tokens, (token, patient['id']))
+
+    def _index(self, patient):
+        patient_id = patient['id']
+        doc = self._document(patient)
+        tokens = set(doc.split())
+        self._docs[patient_id] = doc
+        self._tokens[patient_id] = tokens
+        self._identificacion[patient_id] = normalize_text(patient.get('identificacion'))
+        for gram in trigrams(doc):
+            self._trigrams.setdefault(gram, set()).add(patient_id)
+        return tokens
+
+    def update(self, patient):
+        self.add(patient)
+
+    def remove(self, patient_id):
+        doc = self._docs.pop(patient_id, None)
+        if doc is None:
+            return
+        for gram in trigrams(doc):
+            postings = self._trigrams.get(gram)
+            if postings is not None:
+                postings.discard(patient_id)
+                if not postings:
+                    del self._trigrams[gram]
+        for token in self._tokens.pop(patient_id):
+            i = bisect_left(self._sorted_tokens, (token, patient_id))
+            if i < len(self._sorted_tokens) and self._sorted_tokens[i] == (token, patient_id):
+                del self._sorted_tokens[i]
+        del self._identificacion[patient_id]
+
+    def _token_matches(self, prefix, exact=False):
+        """Ids con alguna palabra igual a (o que empieza por) el prefijo"""
+        tokens = self._sorted_tokens
+        start = bisect_left(tokens, (prefix,))
+        end = bisect_left(tokens, (prefix, float('inf')) if exact else (prefix + '\uffff',))
+        return {pid for _, pid in tokens[start:end]}
+
+    def _candidates(self, term):
+        """Pacientes cuyo documento contiene el término"""
+        if len(term) < 3:
+            # Sin trigramas que intersectar: se recorren los documentos (sigue siendo O(pacientes))
+            return {pid for pid, doc in self._docs.items() if term in doc}
+        postings = sorted((self._trigrams.get(gram, set()) for gram in trigrams(term)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = postings[0].intersection(*postings[1:])
+        return {pid for pid in candidates if term in self._docs[pid]}
+
+    def search(self, query, limit=None):
+        """Ids de pacientes que coinciden con todos los términos, por relevancia y luego por id"""
+        terms = normalize_text(query).split()
+        if not terms:
+            return []
+        terms = sorted(terms, key=len, reverse=True)
+        matches = self._candidates(terms[0])
+        for term in terms[1:]:
+            if not matches:
+                return []
+            # Con pocos candidatos es más barato verificar cada documento que intersectar índices
+            if len(term) < 3 or len(matches) <= VERIFY_LIMIT:
+                matches = {pid for pid in matches if term in self._docs[pid]}
+            else:
+                matches &= self._candidates(term)
+        # Por término: conjuntos de coincidencia exacta y de prefijo; el resto es subcadena
+        tiers = [(self._token_matches(t, exact=True), self._token_matches(t), t) for t in terms]
+        identificacion = self._identificacion
+
+        def score(pid):
+            total = 0
+            for exact, prefix, term in tiers:
+                if identificacion[pid] == term:
+                    total += SCORE_EXACT_ID
+                elif pid in exact:
+                    total += SCORE_EXACT_TOKEN
+                elif pid in prefix:
+                    total += SCORE_PREFIX
+                else:
+                    total += SCORE_SUBSTRING
+            return total
+
+        # Pocos puntajes distintos: agrupar por puntaje y ordenar cada grupo por id
+        buckets = {}
+        for pid in matches:
+            buckets.setdefault(score(pid), []).append(pid)
+        ranked = []
+        for value in sorted(buckets, reverse=True):
+            ranked.extend(sorted(buckets[value]))
+            if limit and len(ranked) >= limit:
+                return ranked[:limit]
+        return ranked
+
+    def __len__(self):
+        return len(self._docs)
+
+
+class SharedSearchIndex:
+    """Índice compartido por todas las sesiones de un proceso, protegido por un lock
+
+    Se construye una sola vez con `load()` (la lista actual de pacientes del almacén) y
+    después recibe los cambios de cualquier sesión. Los cambios que llegan antes de la
+    construcción se reaplican sobre ella: agregar y quitar son idempotentes.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._index = None
+        self._pending = []
+        self._lock = threading.RLock()
+
+    def _ready(self):
+        if self._index is None:
+            index = PatientSearchIndex(self._load())
+            for apply, argument in self._pending:
+                apply(index, argument)
+            self._index = index
+            self._pending = []
+        return self._index
+
+    def _apply(self, apply, argument):
+        with self._lock:
+            if self._index is None:
+                self._pending.append((apply, argument))
+            else:
+                apply(self._index, argument)
+
+    def warm(self):
+        """Construir el índice en segundo plano si aún no existe"""
+        if self._index is None:
+            threading.Thread(target=self.search, args=('',), name='patient-search-index', daemon=True).start()
+
+    def add(self, patient):
+        self._apply(PatientSearchIndex.add, dict(patient))
+
+    def update(self, patient):
+        self.add(patient)
+
+    def remove(self, patient_id):
+        self._apply(PatientSearchIndex.remove, patient_id)
+
+    def reset(self, patients=()):
+        """Reemplazar el contenido (p. ej. al vaciar el almacén)"""
+        with self._lock:
+            self._index = PatientSearchIndex(patients)
+            self._pending = []
+
+    def search(self, query, limit=None):
+        with self._lock:
+            return self._ready().search(query, limit)
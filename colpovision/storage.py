@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""Almacenamiento incremental de pacientes y análisis sobre SQLite (modo WAL)."""
+import atexit
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RecordStore:
+    """Almacén por registro: guardar un paciente o un análisis escribe solo esa fila"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS analyses (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        data BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # FULL sincroniza el WAL en cada commit: con NORMAL un corte de luz puede perder lo
+        # confirmado desde el último checkpoint. Las escrituras van agrupadas y fuera de la UI,
+        # así que el fsync por transacción no se nota.
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(self.SCHEMA)
+        # Identificador aleatorio de este archivo: distingue una base recreada desde cero
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)",
+                           (int.from_bytes(os.urandom(7), 'little'),))
+        self._next_patient_id = self._initial_patient_id()
+
+    def _initial_patient_id(self):
+        stored = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'next_patient_id'").fetchone()
+        max_id = self._conn.execute('SELECT MAX(id) FROM patients').fetchone()[0]
+        return max(stored[0] if stored else 1, (max_id or 0) + 1)
+
+    def allocate_patient_id(self):
+        """Reservar el siguiente id de paciente (contador monótono, nunca se reutiliza)"""
+        with self._lock:
+            patient_id = self._next_patient_id
+            self._next_patient_id += 1
+            return patient_id
+
+    @staticmethod
+    def _dump(record):
+        return sqlite3.Binary(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def put_patient(self, patient):
+        """Insertar o reemplazar un único paciente"""
+        self.write_batch([patient], [])
+
+    def append_analyses(self, records):
+        """Agregar análisis al final del registro sin tocar los existentes"""
+        self.write_batch([], records)
+
+    def delete_patient(self, patient_id):
+        self.write_batch([], [], deleted_ids=[patient_id])
+
+    def write_batch(self, patients, analyses, deleted_ids=(), meta=None):
+        """Escribir pacientes, análisis, bajas pendientes y marcas de `meta` en una única transacción"""
+        patient_rows = [(p['id'], self._dump(p)) for p in patients]
+        analysis_rows = [(self._dump(r),) for r in analyses]
+        deleted_rows = [(patient_id,) for patient_id in deleted_ids]
+        meta_rows = list((meta or {}).items())
+        if not (patient_rows or analysis_rows or deleted_rows or meta_rows):
+            return
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO patients (id, data) VALUES (?, ?)', patient_rows)
+                self._conn.executemany('DELETE FROM patients WHERE id = ?', deleted_rows)
+                self._conn.executemany('INSERT INTO analyses (data) VALUES (?)', analysis_rows)
+                self._conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', meta_rows)
+                if patient_rows or deleted_rows:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_patient_id', ?)",
+                        (self._next_patient_id,))
+
+    def load(self):
+        """Leer todos los pacientes (por id) y análisis (por orden de inserción)"""
+        with self._lock:
+            return self.load_patients(), self.load_analyses()[0]
+
+    def load_analyses(self):
+        """Análisis en orden de inserción y el origen de esa lectura
+
+        El origen es {'lineage', 'seq'}: el linaje cambia si la base se vacía o se recrea y
+        `seq` es el del último análisis leído (AUTOINCREMENT nunca lo reutiliza). Dos lecturas
+        del mismo linaje son prefijo una de otra: los análisis solo se anexan.
+        """
+        with self._lock:
+            meta = dict(self._conn.execute(
+                "SELECT key, value FROM meta WHERE key IN ('store_id', 'generation')"))
+            analyses = []
+            seq = 0
+            for seq, data in self._conn.execute('SELECT seq, data FROM analyses ORDER BY seq'):
+                analyses.append(pickle.loads(data))
+        lineage = f"{meta['store_id']}-{meta.get('generation', 0)}"
+        return analyses, {'lineage': lineage, 'seq': seq}
+
+    def load_patients(self):
+        with self._lock:
+            return [pickle.loads(row[0]) for row in
+                    self._conn.execute('SELECT data FROM patients ORDER BY id')]
+
+    def is_empty(self):
+        with self._lock:
+            for table in ('patients', 'analyses'):
+                if self._conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+                    return False
+        return True
+
+    def clear(self):
+        """Eliminar todos los registros"""
+        with self._lock:
+            with self._transaction():
+                self._conn.execute('DELETE FROM patients')
+                self._conn.execute('DELETE FROM analyses')
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_patient_id', ?)",
+                    (self._next_patient_id,))
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                    "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+        self.compact()
+
+    def compact(self):
+        """Volcar el WAL al archivo principal y truncarlo"""
+        with self._lock:
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def is_migrated(self):
+        """Si el archivo pickle del formato anterior ya se importó (o no hacía falta)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone() is not None
+
+    def migrate_pickle(self, pickle_path):
+        """Importar una sola vez el pickle del formato anterior
+
+        La marca 'legacy_migrated' se escribe en la misma transacción que los datos, así que
+        vaciar el almacén después (o borrar el último paciente) no vuelve a traer el pickle.
+        Un almacén que ya tenía datos se marca sin importar nada.
+        """
+        if self.is_migrated():
+            return False
+        if not self.is_empty():
+            self.write_batch([], [], meta={'legacy_migrated': 1})
+            return False
+        if not os.path.exists(pickle_path):
+            return False
+        with open(pickle_path, 'rb') as f:
+            data = pickle.load(f)
+        patients = data.get('patients_db', [])
+        with self._lock:
+            for patient in patients:
+                self._next_patient_id = max(self._next_patient_id, patient['id'] + 1)
+        self.write_batch(patients, data.get('analysis_results', []), meta={'legacy_migrated': 1})
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute('BEGIN')
+        try:
+            yield self._conn
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+
+# Espera antes de reintentar una escritura fallida: se duplica con cada fallo seguido
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+class WriteBehindWriter:
+    """Escritor en segundo plano que agrupa los cambios pendientes en una sola transacción
+
+    Si la escritura falla, el lote vuelve a lo pendiente (sin pisar cambios más nuevos) y
+    se reintenta con espera creciente; el error queda en `last_error` hasta que una
+    escritura tenga éxito.
+    """
+
+    def __init__(self, store, window=0.5, compact_every=300.0, retry_delay=RETRY_DELAY):
+        self.store = store
+        self.window = window
+        self.compact_every = compact_every
+        self.retry_delay = retry_delay
+        self.last_error = None
+        self._cond = threading.Condition()
+        self._patients = {}
+        self._deleted = set()
+        self._analyses = []
+        self._busy = False
+        self._urgent = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_compact = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='colpovision-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def put_patient(self, patient):
+        """Marcar un paciente como modificado; las versiones repetidas se fusionan"""
+        with self._cond:
+            self._patients[patient['id']] = dict(patient)
+            self._deleted.discard(patient['id'])
+            self._cond.notify()
+
+    def delete_patient(self, patient_id):
+        """Encolar la baja de un paciente"""
+        with self._cond:
+            self._patients.pop(patient_id, None)
+            self._deleted.add(patient_id)
+            self._cond.notify()
+
+    def append_analyses(self, records):
+        """Encolar análisis nuevos para anexarlos al almacén"""
+        if not records:
+            return
+        with self._cond:
+            self._analyses.extend(records)
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._patients) + len(self._deleted) + len(self._analyses)
+
+    def _has_pending(self):
+        return bool(self._patients or self._deleted or self._analyses)
+
+    def request_write(self):
+        """Pedir que lo pendiente se escriba ya, sin esperar la ventana (no bloquea)"""
+        with self._cond:
+            if self._has_pending():
+                self._urgent = True
+                self._cond.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Esperar a que se escriban todos los cambios pendientes
+
+        Fuerza un intento inmediato aunque se esté esperando para reintentar. Devuelve False
+        si vence el plazo o si ese intento falla (los cambios siguen pendientes).
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            failures = self._failures
+            self.request_write()
+            while self._has_pending() or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._failures > failures:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def clear(self):
+        """Descartar lo pendiente y vaciar el almacén"""
+        with self._cond:
+            self._patients.clear()
+            self._deleted.clear()
+            self._analyses.clear()
+            while self._busy:
+                self._cond.wait()
+            # Un lote que falló mientras se esperaba vuelve a lo pendiente: se descarta también
+            self._patients.clear()
+            self._deleted.clear()
+            self._analyses.clear()
+            self.store.clear()
+            self._failures = 0
+            self.last_error = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._has_pending():
+                    if not self._cond.wait(self.compact_every):
+                        self._maybe_compact()
+                # Ventana de agrupación: las ráfagas de cambios se escriben juntas (tras un
+                # fallo se espera además el plazo de reintento, salvo que flush() lo pida antes)
+                window_end = max(time.monotonic() + self.window, self._retry_at)
+                while not self._urgent:
+                    remaining = window_end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._urgent = False
+                patients = list(self._patients.values())
+                deleted = self._deleted
+                analyses = self._analyses
+                self._patients = {}
+                self._deleted = set()
+                self._analyses = []
+                self._busy = True
+            error = None
+            try:
+                self.store.write_batch(patients, analyses, deleted)
+            except Exception as e:
+                logging.getLogger(__name__).exception("Error en escritura diferida")
+                error = e
+            with self._cond:
+                if error is None:
+                    self._failures = 0
+                    self.last_error = None
+                    self._retry_at = 0.0
+                else:
+                    self._requeue(patients, deleted, analyses)
+                    self._failures += 1
+                    self.last_error = f"{error}"
+                    delay = min(self.retry_delay * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+                    self._retry_at = time.monotonic() + delay
+                    # Los flush() en curso ya reciben el fallo: no adelantan el reintento
+                    self._urgent = False
+                self._busy = False
+                self._cond.notify_all()
+            self._maybe_compact()
+
+    def _requeue(self, patients, deleted, analyses):
+        """Devolver un lote fallido a lo pendiente; lo encolado después tiene prioridad"""
+        for patient in patients:
+            if patient['id'] not in self._patients and patient['id'] not in self._deleted:
+                self._patients[patient['id']] = patient
+        self._deleted.update(patient_id for patient_id in deleted if patient_id not in self._patients)
+        self._analyses[:0] = analyses
+
+    def _maybe_compact(self):
+        if time.monotonic() - self._last_compact >= self.compact_every:
+            self._last_compact = time.monotonic()
+            try:
+                self.store.compact()
+            except Exception:
+                logging.getLogger(__name__).exception("Error al compactar el almacén")
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from colpovision.analysis_index import AnalysisIndex
+
+
+def record(patient_id, day):
+    return {'patient_id': patient_id, 'analysis_date': datetime(2026, 10, day, 9)}
+
+
+def test_recent_patients_follow_last_analysis():
+    index = AnalysisIndex([record(1, 1), record(2, 2), record(1, 3), record(3, 4)])
+    assert index.recent_patient_ids(2) == [3, 1]
+    index.add(4, record(2, 5))
+    assert index.recent_patient_ids(10) == [2, 3, 1]
+    assert index.query(patient_id=1) == [0, 2]
+    assert index.has_patient(3) and not index.has_patient(9)
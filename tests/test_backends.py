@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from colpovision import backends
+
+
+def test_incomplete_backend_fails_when_created():
+    class Incomplete(backends.InferenceBackend):
+        name = 'incompleto'
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    assert backends.get_backend(backends.SIMULATED_BACKEND).name == backends.SIMULATED_BACKEND
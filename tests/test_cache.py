@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import itertools
+import pickle
+
+from colpovision import images
+from colpovision.cache import AnalysisCache
+
+
+def size(value):
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def value(name, length=1000):
+    return {'name': name, 'features': b'x' * length}
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = AnalysisCache(max_bytes=3 * size(value('a')))
+    for name in 'abc':
+        cache.put(name, value(name))
+    # Leer 'a' la vuelve la más reciente: la siguiente inserción desaloja 'b'
+    assert cache.get('a') == value('a')
+    cache.put('d', value('d'))
+    assert cache.get('b') is None
+    assert [cache.get(name)['name'] for name in 'acd'] == ['a', 'c', 'd']
+    # Reemplazar una clave no cuenta dos veces su tamaño ni desaloja a otra
+    cache.put('c', value('c'))
+    assert cache.stats()['entries'] == 3
+    assert cache.stats()['memory_bytes'] == 3 * size(value('a'))
+    cache.put('e', value('e'))
+    assert cache.get('a') is None and cache.get('c') is not None
+
+
+def test_memory_stays_within_the_byte_bound():
+    max_bytes = 20000
+    cache = AnalysisCache(max_bytes=max_bytes)
+    kept = {}
+    for i, length in enumerate(itertools.islice(itertools.cycle([500, 3000, 7000, 1200]), 60)):
+        cache.put(f'k{i}', value(i, length))
+        kept[f'k{i}'] = size(value(i, length))
+        stats = cache.stats()
+        assert stats['memory_bytes'] <= max_bytes
+    remaining = [key for key in kept if cache.get(key) is not None]
+    assert cache.stats()['memory_bytes'] == sum(kept[key] for key in remaining)
+    # Las entradas que sobreviven son las más recientes
+    assert remaining == list(kept)[-len(remaining):]
+
+    # Un valor más grande que el límite no se queda en memoria
+    cache.put('grande', value('grande', 2 * max_bytes))
+    assert cache.get('grande') is None
+    assert cache.stats()['memory_bytes'] <= max_bytes
+
+
+def test_disk_tier_serves_evicted_entries_and_survives_restarts(tmp_path):
+    cache = AnalysisCache(max_bytes=size(value('a')), disk_dir=str(tmp_path))
+    cache.put('a', value('a'))
+    cache.put('b', value('b'))
+    assert cache.stats()['entries'] == 1
+
+    # 'a' salió de memoria pero sigue en disco; al leerla vuelve a memoria
+    assert cache.get('a') == value('a')
+    assert cache.get('a') == value('a')
+    stats = cache.stats()
+    assert (stats['hits'], stats['disk_hits'], stats['misses']) == (1, 1, 0)
+
+    # Una caché nueva sobre el mismo directorio (reinicio) encuentra ambas entradas
+    restarted = AnalysisCache(max_bytes=1 << 20, disk_dir=str(tmp_path))
+    assert restarted.get('b') == value('b') and restarted.get('a') == value('a')
+    assert restarted.stats()['disk_hits'] == 2
+    assert restarted.get('otra') is None and restarted.stats()['misses'] == 1
+
+    restarted.clear()
+    assert AnalysisCache(disk_dir=str(tmp_path)).get('a') is None
+
+
+def test_keys_differ_across_backend_and_preprocessing_settings():
+    digest = 'f' * 40
+    settings = [
+        (digest, 'features', 'v1', 512, None),
+        (digest, 'features', 'v1', 512, None, 'contrast'),
+        (digest, 'features', 'v1', 512, None, 'contrast', 'denoise'),
+        (digest, 'features', 'v1', 512, None, 'denoise', 'contrast'),
+        (digest, 'features', 'v1', 512, 'ResNet-50'),
+        (digest, 'features', 'v1', 512, 'EfficientNet'),
+        (digest, 'features', 'v1', 256, None),
+        (digest, 'features', 'v2', 512, None),
+        (digest, 'features', 'v1+pesos', 512, None),
+        (digest, 'simulated', 'v1', 512, None),
+        ('e' * 40, 'features', 'v1', 512, None),
+    ]
+    keys = [AnalysisCache.make_key(*parts) for parts in settings]
+    assert len(set(keys)) == len(settings)
+    assert keys[0] == AnalysisCache.make_key(*settings[0])
+    # Las copias de impresión comparten la caché en disco sin chocar con los análisis
+    assert images.PrintImageStore.key(digest) not in keys
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import datetime
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from colpovision import columnar
+from colpovision.aggregates import record_results
+from colpovision.columnar import ColumnarStore
+
+
+def analysis(when, patient_id=1, top='Normal', confidence=0.6):
+    predictions = {name: 0.1 for name in columnar.CLASSES}
+    predictions[top] = 0.6
+    return {'patient_id': patient_id, 'analysis_date': when,
+            'results': {'confidence': confidence, 'image_quality': 0.9, 'predictions': predictions}}
+
+
+def batch(when, patient_id, tops):
+    return {'patient_id': patient_id, 'batch_date': when,
+            'batch_results': [{'results': analysis(when, patient_id, top)['results']} for top in tops]}
+
+
+def at(text):
+    return datetime.datetime.fromisoformat(text)
+
+
+def test_empty_append_on_a_mapped_store(tmp_path):
+    ColumnarStore.from_records([analysis(at('2026-10-01')), analysis(at('2026-10-02'))]).save(str(tmp_path))
+    store = ColumnarStore.load(str(tmp_path))
+    assert isinstance(store.record, np.memmap)
+    # Un análisis sin resultados no agrega filas, pero sí cuenta como registro
+    store.append_records([batch(at('2026-10-03'), 1, [])])
+    assert (len(store), store.records) == (2, 3)
+    store.append_records([analysis(at('2026-10-04'))])
+    assert (len(store), store.records) == (3, 4)
+    assert store.record.tolist() == [0, 1, 3]
+
+
+def sample_records(seed=0, count=300):
+    """Análisis individuales y lotes entre noviembre y marzo (cruza fin de año y febrero)"""
+    rng = np.random.default_rng(seed)
+    first = at('2025-11-01')
+    records = []
+    for _ in range(count):
+        when = first + datetime.timedelta(days=int(rng.integers(0, 150)), hours=int(rng.integers(0, 24)))
+        patient_id = int(rng.integers(1, 6))
+        tops = list(rng.choice(columnar.CLASSES, size=int(rng.integers(1, 4))))
+        if len(tops) == 1:
+            records.append(analysis(when, patient_id, tops[0]))
+        else:
+            records.append(batch(when, patient_id, tops))
+    # Sin fecha: no entra en ningún período
+    records.append(analysis(None))
+    return records
+
+
+def rows_frame(records):
+    """Una fila por resultado, calculada con pandas como referencia"""
+    rows = []
+    for position, record in enumerate(records):
+        when = record.get('analysis_date') or record.get('batch_date')
+        for item in record_results(record):
+            predictions = item['predictions']
+            rows.append({'record': position, 'when': when, 'top': max(predictions, key=predictions.get)})
+    return pd.DataFrame(rows).dropna(subset=['when'])
+
+
+RESAMPLE_RULES = {'D': {'rule': 'D'}, 'W': {'rule': 'W-MON', 'label': 'left', 'closed': 'left'},
+                  'M': {'rule': 'MS'}}
+
+
+@pytest.mark.parametrize('freq', ['D', 'W', 'M'])
+def test_counts_by_period_match_pandas(freq):
+    records = sample_records()
+    store = ColumnarStore.from_records(records)
+    rows = rows_frame(records)
+
+    analyses = rows.drop_duplicates('record').set_index('when')['record']
+    expected = analyses.resample(**RESAMPLE_RULES[freq]).count()
+    counts = store.counts_by(freq)
+    assert counts.index.equals(expected.index)
+    assert counts.tolist() == expected.tolist()
+    assert counts.sum() == len(records) - 1
+
+    by_class = pd.crosstab(rows['when'], rows['top']).reindex(columns=columnar.CLASSES, fill_value=0)
+    expected = by_class.resample(**RESAMPLE_RULES[freq]).sum()
+    class_counts = store.class_counts_by(freq)
+    assert class_counts.index.equals(expected.index)
+    assert class_counts.to_numpy().tolist() == expected.to_numpy().tolist()
+
+
+def test_weeks_start_on_monday_and_cover_the_requested_range():
+    records = [analysis(at('2026-03-01T23:59')),   # domingo
+               analysis(at('2026-03-02T00:00')),   # lunes
+               analysis(at('2026-03-08T12:00')),   # domingo
+               analysis(at('2026-03-30T08:00'))]
+    store = ColumnarStore.from_records(records)
+    counts = store.counts_by('W')
+    assert [day.strftime('%Y-%m-%d') for day in counts.index] == [
+        '2026-02-23', '2026-03-02', '2026-03-09', '2026-03-16', '2026-03-23', '2026-03-30']
+    assert counts.tolist() == [1, 2, 0, 0, 0, 1]
+    assert all(day.weekday() == 0 for day in counts.index)
+
+    # Los límites son fechas inclusive; la primera semana empieza el lunes anterior a `start`
+    counts = store.counts_by('W', date(2026, 3, 3), date(2026, 4, 8))
+    assert counts.index[0] == pd.Timestamp('2026-03-02') and counts.index[-1] == pd.Timestamp('2026-04-06')
+    assert counts.tolist() == [1, 0, 0, 0, 1, 0]
+    monthly = store.class_counts_by('M', date(2026, 1, 15), date(2026, 3, 8))
+    assert list(monthly.index) == [pd.Timestamp('2026-01-01'), pd.Timestamp('2026-02-01'),
+                                   pd.Timestamp('2026-03-01')]
+    assert monthly['Normal'].tolist() == [0, 0, 3]
+
+
+def test_downsample_keeps_the_totals():
+    frame = pd.DataFrame({'Normal': range(10), 'CIN I': range(10, 20)},
+                         index=pd.date_range('2026-01-05', periods=10, freq='W-MON'))
+    reduced = columnar.downsample(frame, 3)
+    assert len(reduced) <= 3
+    assert reduced.sum().tolist() == frame.sum().tolist()
+    assert reduced['Normal'].tolist() == [0 + 1 + 2 + 3, 4 + 5 + 6 + 7, 8 + 9]
+    assert list(reduced.index) == [frame.index[0], frame.index[4], frame.index[8]]
+    assert columnar.downsample(frame, 10) is frame
+
+
+def test_patient_summary():
+    records = [analysis(at('2026-10-01T08:00'), 1, 'Normal', confidence=0.5),
+               analysis(at('2026-10-05T08:00'), 1, 'CIN I', confidence=0.9),
+               batch(at('2026-10-03T10:00'), 2, ['CIN II', 'CIN II', 'Normal']),
+               analysis(at('2026-10-04T10:00'), None, 'Carcinoma')]
+    summary = ColumnarStore.from_records(records).patient_summary()
+    assert summary.index.tolist() == [columnar.NO_PATIENT, 1, 2]
+    assert summary['analyses'].tolist() == [1, 2, 1]
+    assert summary['results'].tolist() == [1, 2, 3]
+    assert summary.loc[1, 'confidence'] == pytest.approx(0.7)
+    assert summary.loc[1, 'last'] == np.datetime64('2026-10-05T08:00')
+    assert summary['top_class'].tolist() == ['Carcinoma', 'Normal', 'CIN II']
+
+
+def test_save_and_load_round_trip(tmp_path):
+    records = sample_records(seed=1, count=50)
+    store = ColumnarStore.from_records(records)
+    source = {'lineage': '7-0', 'seq': 50}
+    store.save(str(tmp_path), source)
+
+    loaded = ColumnarStore.load(str(tmp_path))
+    assert (len(loaded), loaded.records, loaded.source) == (len(store), store.records, source)
+    for name in columnar.COLUMNS:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(store, name))
+    assert loaded.counts_by('W').equals(store.counts_by('W'))
+
+    # Sin meta.json (guardado interrumpido) la copia no se usa
+    (tmp_path / columnar.META_FILE).unlink()
+    assert ColumnarStore.load(str(tmp_path)) is None
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import Flowable, PageBreak, SimpleDocTemplate
+
+from colpovision import export
+from colpovision.export import _StreamedStory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Probe(Flowable):
+    """Registra, al dibujarse, cuántas partes había pedido ya ReportLab al generador"""
+
+    def __init__(self, produced, seen):
+        super().__init__()
+        self.produced = produced
+        self.seen = seen
+
+    def wrap(self, available_width, available_height):
+        return 0, 0
+
+    def draw(self):
+        self.seen.append(len(self.produced))
+
+
+def test_reportlab_consumes_the_story_one_part_at_a_time():
+    # _StreamedStory depende de que build() consulte len() y borre story[0] en cada paso
+    produced = []
+    seen = []
+
+    def parts():
+        for i in range(5):
+            produced.append(i)
+            yield [Probe(produced, seen), PageBreak()]
+
+    story = _StreamedStory(parts())
+    SimpleDocTemplate(io.BytesIO(), pagesize=A4).build(story)
+    assert seen == [1, 2, 3, 4, 5]
+    assert list.__len__(story) == 0
+
+
+# Genera `count` reportes con imágenes distintas y mide cuánto sube el pico de memoria al exportarlos
+MEMORY_SCRIPT = '''
+import datetime, io, os, resource, sys, tempfile
+import numpy as np
+from PIL import Image
+from colpovision import export, images
+
+count = int(sys.argv[1])
+directory = tempfile.mkdtemp()
+store = images.PrintImageStore(directory)
+rng = np.random.default_rng(0)
+patient = {'nombre': 'Ana', 'apellido': 'Pérez', 'identificacion': '1', 'edad': 30,
+           'fecha_nacimiento': datetime.date(1990, 1, 1)}
+items = []
+for i in range(count):
+    buffer = io.BytesIO()
+    noise = Image.fromarray(rng.integers(0, 256, (60, 80, 3), dtype=np.uint8))
+    noise.resize((images.PRINT_MAX_SIDE, images.PRINT_MAX_SIDE * 3 // 4)).save(buffer, 'JPEG')
+    results = {'timestamp': datetime.datetime(2026, 10, 1), 'confidence': 0.8, 'image_quality': 0.9,
+               'predictions': {'Normal': 0.6, 'CIN I': 0.1, 'CIN II': 0.1, 'CIN III': 0.1, 'Carcinoma': 0.1},
+               'recommendations': ['Control'], 'analysis_type': 'individual',
+               'image_digest': store.add(buffer.getvalue())}
+    items.append((f'{i}.pdf', patient, results, {'images': True}))
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+export.export_merged_pdf(items, os.path.join(directory, 'todo.pdf'), image_dir=directory)
+print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base) / 1024)
+'''
+MEMORY_BUDGET_MB = 256
+
+
+def peak_growth_mb(count):
+    output = subprocess.run([sys.executable, '-c', MEMORY_SCRIPT, str(count)], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def test_merged_pdf_memory_stays_within_budget_at_the_image_limit():
+    # La memoria del PDF combinado crece con cada imagen distinta: se mide la pendiente
+    # y se proyecta hasta el límite de imágenes del modo combinado
+    small, large = peak_growth_mb(20), peak_growth_mb(60)
+    per_report = max(large - small, 0) / 40
+    assert large + per_report * (export.MERGED_MAX_IMAGES - 60) < MEMORY_BUDGET_MB
+
+
+def test_merged_pdf_rejects_exports_above_the_limits():
+    results = {'image_digest': 'abc'}
+    items = [('r.pdf', {}, results, {'images': True})] * (export.MERGED_MAX_IMAGES + 1)
+    with pytest.raises(ValueError):
+        export.check_merged_pdf(items)
+    export.check_merged_pdf([('r.pdf', {}, results, {'images': False})] * (export.MERGED_MAX_IMAGES + 1))
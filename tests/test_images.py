@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from colpovision import decoding, images
+
+
+def jpeg_bytes(width, height):
+    rng = np.random.default_rng(0)
+    small = Image.fromarray(rng.integers(0, 256, (30, 40, 3), dtype=np.uint8))
+    output = io.BytesIO()
+    small.resize((width, height), Image.BILINEAR).save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('width, height', [(4000, 3000), (1600, 1200), (600, 400)])
+def test_print_copy_shares_the_analysis_decode(width, height):
+    data = jpeg_bytes(width, height)
+    rgb, jpeg = images.decode_with_print(data, 512)
+    assert np.array_equal(rgb, decoding.decode_for_analysis(data, 512))
+    with Image.open(io.BytesIO(jpeg)) as copy:
+        assert max(copy.size) == min(images.PRINT_MAX_SIDE, width)
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from colpovision.backends import FeatureBackend
+
+
+def test_stack_matches_single_images():
+    stack = np.random.default_rng(0).integers(0, 256, (3, 64, 64, 3), dtype=np.uint8)
+    backend = FeatureBackend()
+    for batched, rgb in zip(backend.analyze_stack(stack), stack):
+        single = backend.analyze_array(rgb)
+        assert batched['features'] == single['features']
+        assert batched['predictions'] == pytest.approx(single['predictions'], abs=1e-6)
+        assert batched['confidence'] == pytest.approx(single['confidence'], abs=1e-6)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from colpovision import jobs
+from colpovision.jobs import JobQueue
+
+
+def finish(queue, count, discard=None):
+    ids = [queue.submit('individual', f'trabajo {i}', lambda report, i=i: {'n': i}, discard=discard)
+           for i in range(count)]
+    queue._executor.shutdown(wait=True)
+    return ids
+
+
+def test_prune_keeps_uncollected_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, 'MAX_FINISHED', 2)
+    queue = JobQueue(workers=1)
+    ids = finish(queue, 4)
+    with queue._lock:
+        queue._prune()
+    assert all(queue.get(job_id) for job_id in ids)
+
+    for job_id in ids:
+        queue.mark_collected(job_id)
+    with queue._lock:
+        queue._prune()
+    assert [queue.get(job_id) is not None for job_id in ids] == [False, False, True, True]
+
+
+def test_pending_until_collected():
+    queue = JobQueue(workers=1)
+    job_id = queue.submit('individual', 'trabajo', lambda report: {}, patient_id=7)
+    failed = queue.submit('individual', 'falla', lambda report: 1 / 0, patient_id=8)
+    queue._executor.shutdown(wait=True)
+    assert queue.get(failed)['status'] == jobs.FAILED
+    assert queue.has_pending(7) and not queue.has_pending(8)
+    queue.mark_collected(job_id)
+    assert not queue.has_pending(7)
+
+
+def test_prune_discards_results(monkeypatch):
+    monkeypatch.setattr(jobs, 'MAX_FINISHED', 1)
+    discarded = []
+    queue = JobQueue(workers=1)
+    ids = finish(queue, 3, discard=discarded.append)
+    for job_id in ids:
+        queue.mark_collected(job_id)
+    with queue._lock:
+        queue._prune()
+    assert discarded == [{'n': 0}, {'n': 1}]
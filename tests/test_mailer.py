@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import smtplib
+import socketserver
+import threading
+import time
+
+import pytest
+
+from colpovision import mailer, outbox
+from colpovision.outbox import Dispatcher, Outbox
+
+
+class FakeSMTP:
+    """Sustituto de smtplib.SMTP que registra las sesiones abiertas y los mensajes enviados"""
+
+    sessions = []
+
+    def __init__(self, host, port, timeout=None):
+        self.calls = []
+        self.fail_next = None
+        FakeSMTP.sessions.append(self)
+
+    def starttls(self):
+        self.calls.append('starttls')
+
+    def login(self, user, password):
+        self.calls.append('login')
+
+    def send_message(self, msg):
+        if self.fail_next:
+            error, self.fail_next = self.fail_next, None
+            raise error
+        self.calls.append(msg['To'])
+
+    def quit(self):
+        self.calls.append('quit')
+
+    def close(self):
+        self.calls.append('close')
+
+
+def message(recipient):
+    return mailer.build_message('medico@clinica.com', recipient, 'Resultados', 'Adjunto',
+                                mailer.make_attachment(b'%PDF-1.4', 'reporte.pdf'))
+
+
+def test_pool_reuses_one_session_per_thread():
+    FakeSMTP.sessions = []
+    config = {'smtp_server': 'smtp.local', 'port': 587, 'email': 'medico@clinica.com',
+              'password': 'secreto', 'use_tls': True}
+    pool = mailer.SMTPPool(config, smtp_factory=FakeSMTP)
+    assert pool.attempt(message('a@x.com'))[0] == mailer.SENT
+    assert pool.attempt(message('b@x.com'))[0] == mailer.SENT
+    assert len(FakeSMTP.sessions) == 1
+    assert FakeSMTP.sessions[0].calls == ['starttls', 'login', 'a@x.com', 'b@x.com']
+
+    # Una conexión caída se descarta y el siguiente intento abre otra sesión
+    FakeSMTP.sessions[0].fail_next = smtplib.SMTPServerDisconnected('cortada')
+    assert pool.attempt(message('c@x.com'))[0] == mailer.RETRY
+    assert pool.attempt(message('c@x.com'))[0] == mailer.SENT
+    assert len(FakeSMTP.sessions) == 2
+
+    FakeSMTP.sessions[1].fail_next = smtplib.SMTPRecipientsRefused({'d@x.com': (550, b'no')})
+    assert pool.attempt(message('d@x.com'))[0] == mailer.FAILED
+    pool.close()
+    assert FakeSMTP.sessions[0].calls[-1] == 'close'
+    assert FakeSMTP.sessions[1].calls == ['starttls', 'login', 'c@x.com', 'quit']
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo: rechaza los destinatarios 'rechazado@' y corta la primera entrega"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        self.reply('220 prueba')
+        recipients = []
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line == b'.\r\n':
+                    in_data = False
+                    with server.lock:
+                        drop, server.drop_next = server.drop_next, False
+                    if drop:
+                        return
+                    with server.lock:
+                        server.delivered.extend(recipients)
+                    recipients = []
+                    self.reply('250 ok')
+                continue
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 prueba')
+            elif verb == 'RCPT':
+                if 'rechazado@' in command:
+                    self.reply('550 destinatario desconocido')
+                else:
+                    recipients.append(command.split('<')[1].rstrip('>'))
+                    self.reply('250 ok')
+            elif verb == 'DATA':
+                in_data = True
+                self.reply('354 adelante')
+            elif verb == 'QUIT':
+                self.reply('221 adios')
+                return
+            else:
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.delivered = []
+    server.drop_next = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_dispatcher_delivers_through_a_local_server(tmp_path, smtp_server):
+    config = {'smtp_server': '127.0.0.1', 'port': smtp_server.server_address[1],
+              'email': 'medico@clinica.com', 'password': '', 'use_tls': False}
+    dispatcher = Dispatcher(Outbox(str(tmp_path / 'outbox.db')), max_connections=2,
+                            backoff=0.01, idle_close=0.2)
+    recipients = ['ana@x.com', 'rechazado@x.com', 'luis@x.com']
+    dispatcher.enqueue(config, [
+        {'sender': config['email'], 'recipient': recipient, 'patient': 'Ana Pérez',
+         'subject': 'Resultados', 'body': 'Adjunto', 'filename': 'reporte.pdf', 'pdf': b'%PDF-1.4'}
+        for recipient in recipients])
+
+    deadline = time.monotonic() + 10
+    while set(dispatcher.outbox.counts()) & {outbox.PENDING, outbox.SENDING}:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+    assert dispatcher.outbox.counts() == {outbox.SENT: 2, outbox.FAILED: 1}
+    assert sorted(smtp_server.delivered) == ['ana@x.com', 'luis@x.com']
+    history = {row['recipient']: row for row in dispatcher.outbox.history()}
+    assert history['rechazado@x.com']['attempts'] == 1
+    # La entrega cortada por el servidor se reintentó con una sesión nueva
+    assert sum(row['attempts'] for row in history.values()) == 4
+    dispatcher._close_idle()
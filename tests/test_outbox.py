@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from colpovision.outbox import Outbox
+
+ACCOUNT = 'medico@localhost:1025|tls=False'
+
+
+def message(recipient):
+    return {'sender': 'medico@clinica.com', 'recipient': recipient, 'patient': 'Ana Pérez',
+            'subject': 'Resultados', 'body': 'Adjunto', 'filename': 'reporte.pdf', 'pdf': b'%PDF-1.4'}
+
+
+def test_enqueue_returns_stored_ids_after_clearing(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    first = outbox.enqueue(ACCOUNT, [message(f'p{i}@x.com') for i in range(3)])
+    for row in outbox.claim([ACCOUNT], 10):
+        outbox.mark_sent(row['id'], 0.1)
+    outbox.clear_finished()
+
+    ids = outbox.enqueue(ACCOUNT, [message('q@x.com'), message('r@x.com')])
+    assert ids == [first[-1] + 1, first[-1] + 2]
+    claimed = outbox.claim([ACCOUNT], 10)
+    assert {row['id']: row['recipient'] for row in claimed} == {ids[0]: 'q@x.com', ids[1]: 'r@x.com'}
+    assert outbox.attachment(claimed[0]['digest']) == b'%PDF-1.4'
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from colpovision.registry import PatientRegistry
+from colpovision.search import PatientSearchIndex, SharedSearchIndex
+
+PATIENTS = [
+    {'id': 1, 'nombre': 'Ana', 'apellido': 'Pérez', 'identificacion': 'CC1001'},
+    {'id': 2, 'nombre': 'Lucía', 'apellido': 'Gómez', 'identificacion': 'CC2002'},
+    {'id': 3, 'nombre': 'Ezequiel', 'apellido': 'Ruiz', 'identificacion': 'CC3003'},
+]
+
+
+def test_short_terms_match_substrings():
+    index = PatientSearchIndex(PATIENTS)
+    # Prefijo de palabra antes que subcadena
+    assert index.search('ez') == [3, 1, 2]
+    assert index.search('ci') == [2]
+    assert index.search('ez go') == [2]
+
+
+def test_shared_index_is_built_once_and_sees_every_session():
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [dict(p) for p in PATIENTS]
+
+    shared = SharedSearchIndex(load)
+    first = PatientRegistry([dict(p) for p in PATIENTS], shared)
+    second = PatientRegistry([dict(p) for p in PATIENTS], shared)
+    # Cambio anterior a la construcción: se reaplica sobre lo cargado
+    first.remove(2)
+    assert [p['id'] for p in second.search('gomez')] == []
+    second.add({'id': 4, 'nombre': 'Inés', 'apellido': 'Pérez', 'identificacion': 'CC4004'})
+    assert [p['id'] for p in second.search('perez')] == [1, 4]
+    # La otra sesión no conoce al paciente 4: no aparece en sus resultados
+    assert [p['id'] for p in first.search('perez')] == [1]
+    first.rebuild([dict(p) for p in PATIENTS])
+    assert first.search('ruiz')[0]['id'] == 3
+    assert len(loads) == 1
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Arranque de la app: presupuesto de tiempo y módulos pesados fuera del panel principal.
+
+La app se ejecuta con AppTest en un proceso aparte, para que `sys.modules` no arrastre
+lo que importaron otras pruebas.
+"""
+import ast
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+from colpovision.storage import RecordStore
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+# Se cargan al abrir la página que los usa, nunca en el panel principal
+DEFERRED_MODULES = ('cv2', 'reportlab', 'smtplib')
+
+PROBE = """
+import json, sys
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+at.run()
+print(json.dumps({
+    'exceptions': [e.value for e in at.exception],
+    'first_run': at.session_state.last_run_seconds,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+def startup_budget():
+    with open(APP, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'STARTUP_BUDGET_SECONDS'
+                                                for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise AssertionError("app.py no define STARTUP_BUDGET_SECONDS")
+
+
+def seed(directory, patients=20, analyses=200):
+    store = RecordStore(os.path.join(directory, 'colpovision_data.db'))
+    store.write_batch(
+        [{'id': i, 'nombre': f'Nombre{i}', 'apellido': 'Apellido', 'identificacion': f'ID{i:05d}',
+          'edad': 40, 'email': f'p{i}@clinica.com', 'created_at': datetime(2026, 1, 1)}
+         for i in range(1, patients + 1)],
+        [{'patient_id': k % patients + 1, 'image_name': 'imagen.jpg',
+          'analysis_date': datetime(2026, 10, 1) - timedelta(days=k % 60),
+          'results': {'predictions': {'Normal': 0.6, 'CIN I': 0.2, 'CIN II': 0.1, 'CIN III': 0.05,
+                                      'Carcinoma': 0.05},
+                      'confidence': 0.8, 'image_quality': 0.9, 'timestamp': datetime(2026, 10, 1),
+                      'analysis_type': 'individual', 'recommendations': []}}
+         for k in range(analyses)])
+    store.close()
+
+
+def test_dashboard_starts_within_budget(tmp_path):
+    seed(str(tmp_path))
+    completed = subprocess.run([sys.executable, '-c', PROBE, APP], cwd=tmp_path,
+                               capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, completed.stderr
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert report['exceptions'] == []
+    loaded = [name for name in report['modules']
+              if name.split('.')[0] in DEFERRED_MODULES]
+    assert loaded == []
+    assert report['first_run'] <= startup_budget()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import pickle
+import sqlite3
+import threading
+import time
+
+from colpovision.storage import RecordStore, WriteBehindWriter
+
+
+def write_legacy_pickle(path):
+    with open(path, 'wb') as f:
+        pickle.dump({'patients_db': [{'id': 3, 'nombre': 'Ana'}],
+                     'analysis_results': [{'patient_id': 3}]}, f)
+
+
+def test_legacy_pickle_is_imported_once(tmp_path):
+    legacy = tmp_path / 'colpovision_data.pkl'
+    write_legacy_pickle(legacy)
+    store = RecordStore(str(tmp_path / 'data.db'))
+    assert store.migrate_pickle(str(legacy))
+    assert store.load() == ([{'id': 3, 'nombre': 'Ana'}], [{'patient_id': 3}])
+    assert store.allocate_patient_id() == 4
+
+    # Vaciar la base no debe traer de vuelta los datos del pickle
+    store.clear()
+    store.close()
+    store = RecordStore(str(tmp_path / 'data.db'))
+    assert not store.migrate_pickle(str(legacy))
+    assert store.load() == ([], [])
+
+
+def test_analysis_source_changes_when_the_store_is_emptied(tmp_path):
+    store = RecordStore(str(tmp_path / 'data.db'))
+    store.append_analyses([{'patient_id': 1}, {'patient_id': 2}])
+    analyses, first = store.load_analyses()
+    assert len(analyses) == 2
+    store.append_analyses([{'patient_id': 3}])
+    _, grown = store.load_analyses()
+    assert grown['lineage'] == first['lineage'] and grown['seq'] > first['seq']
+
+    # Vaciar y volver a llenar con la misma cantidad no se confunde con los datos anteriores
+    store.clear()
+    store.append_analyses([{'patient_id': 4}, {'patient_id': 5}])
+    analyses, refilled = store.load_analyses()
+    assert [a['patient_id'] for a in analyses] == [4, 5]
+    assert refilled['lineage'] != first['lineage']
+    store.close()
+
+    # Una base recreada desde cero tampoco comparte linaje
+    (tmp_path / 'data.db').unlink()
+    assert RecordStore(str(tmp_path / 'data.db')).load_analyses()[1]['lineage'] != refilled['lineage']
+
+
+def test_store_with_data_is_marked_without_importing(tmp_path):
+    legacy = tmp_path / 'colpovision_data.pkl'
+    write_legacy_pickle(legacy)
+    store = RecordStore(str(tmp_path / 'data.db'))
+    store.put_patient({'id': 1, 'nombre': 'Luis'})
+    assert not store.migrate_pickle(str(legacy))
+    assert store.is_migrated()
+    store.delete_patient(1)
+    assert not store.migrate_pickle(str(legacy))
+    assert store.load() == ([], [])
+
+
+class RecordingStore(RecordStore):
+    """Almacén que registra cada lote; puede detener la escritura o hacerla fallar"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.batches = []
+        self.failures = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def write_batch(self, patients, analyses, deleted_ids=(), meta=None):
+        self.entered.set()
+        self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError('database is locked')
+        self.batches.append(([p['id'] for p in patients], list(analyses), set(deleted_ids)))
+        super().write_batch(patients, analyses, deleted_ids, meta)
+
+
+def make_writer(tmp_path, **kwargs):
+    store = RecordingStore(str(tmp_path / 'data.db'))
+    return store, WriteBehindWriter(store, **kwargs)
+
+
+def test_writer_coalesces_repeated_changes(tmp_path):
+    store, writer = make_writer(tmp_path, window=0.2)
+    for version in range(3):
+        writer.put_patient({'id': 1, 'nombre': f'Ana {version}'})
+    writer.put_patient({'id': 2, 'nombre': 'Luis'})
+    writer.delete_patient(2)
+    writer.append_analyses([{'patient_id': 1}])
+    assert writer.flush()
+    assert store.batches == [([1], [{'patient_id': 1}], {2})]
+    assert store.load() == ([{'id': 1, 'nombre': 'Ana 2'}], [{'patient_id': 1}])
+
+    # Volver a guardar un paciente dado de baja anula la baja pendiente
+    writer.delete_patient(1)
+    writer.put_patient({'id': 1, 'nombre': 'Ana'})
+    assert writer.flush()
+    assert store.load()[0] == [{'id': 1, 'nombre': 'Ana'}]
+
+
+def test_flush_does_not_wait_for_the_window(tmp_path):
+    store, writer = make_writer(tmp_path, window=30.0)
+    writer.put_patient({'id': 1, 'nombre': 'Ana'})
+    start = time.monotonic()
+    assert writer.flush(timeout=5.0)
+    assert time.monotonic() - start < 1.0
+    assert writer.pending() == 0
+
+    store.entered.clear()
+    writer.put_patient({'id': 2, 'nombre': 'Luis'})
+    writer.request_write()
+    assert writer.pending() == 1
+    assert store.entered.wait(5.0)
+    assert writer.flush(timeout=0.5)
+
+
+def test_clear_waits_for_the_write_in_progress(tmp_path):
+    store, writer = make_writer(tmp_path, window=0.0)
+    store.release.clear()
+    writer.put_patient({'id': 1, 'nombre': 'Ana'})
+    assert store.entered.wait(5.0)
+    cleared = threading.Thread(target=writer.clear)
+    cleared.start()
+    cleared.join(0.2)
+    assert cleared.is_alive()
+    store.release.set()
+    cleared.join(5.0)
+    assert not cleared.is_alive()
+    assert store.load() == ([], [])
+
+
+def test_failed_batch_is_kept_and_retried(tmp_path):
+    store, writer = make_writer(tmp_path, window=0.0, retry_delay=30.0)
+    store.failures = 1
+    store.release.clear()
+    writer.put_patient({'id': 1, 'nombre': 'Ana'})
+    writer.put_patient({'id': 2, 'nombre': 'Luis'})
+    writer.append_analyses([{'patient_id': 1, 'n': 1}])
+    assert store.entered.wait(5.0)
+    # Cambios hechos mientras falla la escritura: tienen prioridad sobre el lote devuelto
+    writer.put_patient({'id': 1, 'nombre': 'Ana María'})
+    writer.delete_patient(2)
+    writer.append_analyses([{'patient_id': 1, 'n': 2}])
+    store.release.set()
+
+    assert not writer.flush(timeout=5.0)
+    assert writer.last_error == 'database is locked'
+    assert store.batches == []
+    assert writer.flush(timeout=5.0)
+    assert writer.last_error is None
+    assert store.load() == ([{'id': 1, 'nombre': 'Ana María'}],
+                            [{'patient_id': 1, 'n': 1}, {'patient_id': 1, 'n': 2}])
+
+
+def test_failed_batch_is_retried_without_flush(tmp_path):
+    store, writer = make_writer(tmp_path, window=0.0, retry_delay=0.05)
+    store.failures = 2
+    writer.put_patient({'id': 1, 'nombre': 'Ana'})
+    deadline = time.monotonic() + 5.0
+    while writer.pending() or not store.batches:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert store.load()[0] == [{'id': 1, 'nombre': 'Ana'}]
+    assert writer.last_error is None